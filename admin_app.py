@@ -1,9 +1,21 @@
 import streamlit as st
-import json
-import os
 from datetime import datetime
 import uuid
 
+import bulk_edit
+import catalog_dupes
+import catalog_import
+import catalog_query
+import catalog_search
+import catalog_stats
+import credentials
+import migrations
+import perf
+import price_history
+import snapshot
+import static_assets
+import storage
+
 # --- Page Configuration ---
 st.set_page_config(
     page_title="Clinic Management",
@@ -13,108 +25,56 @@ st.set_page_config(
 )
 
 # --- CSS Styling for Mobile ---
-st.markdown("""
-    <style>
-    /* Mobile responsive styling */
-    * {
-        margin: 0;
-        padding: 0;
-        box-sizing: border-box;
-    }
-    
-    .main-header {
-        font-size: 1.8em;
-        font-weight: bold;
-        color: #1f77b4;
-        text-align: center;
-        margin-bottom: 20px;
-        padding: 10px;
-    }
-    
-    .product-card {
-        border: 1px solid #ddd;
-        border-radius: 10px;
-        padding: 12px;
-        margin: 8px 0;
-        background-color: #f9f9f9;
-    }
-    
-    .admin-panel {
-        background-color: #f0f8ff;
-        padding: 15px;
-        border-radius: 10px;
-        border: 2px solid #1f77b4;
-        margin: 10px 0;
-    }
-    
-    /* Button styling for mobile */
-    .stButton > button {
-        width: 100%;
-        padding: 12px !important;
-        font-size: 16px !important;
-        border-radius: 8px !important;
-        margin: 5px 0 !important;
-    }
-    
-    /* Input fields */
-    .stTextInput input, .stNumberInput input, .stSelectbox select {
-        font-size: 16px !important;
-        padding: 10px !important;
-        border-radius: 5px !important;
-    }
-    
-    /* Tabs */
-    .stTabs [role="tablist"] button {
-        font-size: 14px !important;
-        padding: 10px 20px !important;
-    }
-    
-    /* Reduce margin */
-    .block-container {
-        padding: 10px !important;
-    }
-    
-    /* Better spacing */
-    h1, h2, h3 {
-        margin-top: 15px !important;
-        margin-bottom: 10px !important;
-    }
-    </style>
-    """, unsafe_allow_html=True)
+static_assets.use_stylesheet("admin_app.css")
 
 # --- Data Management ---
 DATA_FILE = "clinic_data.json"
+PAGE_SIZES = [10, 25, 50, 100]
+BULK_PREVIEW_ROWS = 50
+DUPLICATE_PREVIEW_ROWS = 200
+IMPORT_POLL_SECONDS = 0.5
 
 def load_data():
-    """Load clinic data from JSON file"""
-    if os.path.exists(DATA_FILE):
-        try:
-            with open(DATA_FILE, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except:
-            pass
+    """Load clinic data from the configured storage backend (read-only, edit through the store)"""
+    try:
+        data = storage.get_store(DATA_FILE).load()
+        if data is not None:
+            return data
+    except:
+        pass
     return {
         "products": {"填充": [], "水光": [], "溶脂": []},
         "sources": ["本地供應商", "香港代理", "台灣進口", "其他"],
-        "users": {
-            "admin": "admin123",
-            "partner": "partner123"
-        }
     }
 
 def save_data(data):
-    """Save clinic data to JSON file"""
-    with open(DATA_FILE, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+    """Replace the whole catalog in the configured storage backend"""
+    store = storage.get_store(DATA_FILE)
+    with perf.span("save_data") as span:
+        data = store.save(data)
+        perf.note_catalog(span, data, store.path)
+    return data
     
     # Note: On Streamlit Cloud, you need to manually commit clinic_data.json 
     # to GitHub or use the Upload to Cloud button after making changes
 
+# --- Schema ---
+# Old catalog formats are upgraded once, when the process starts; reruns only read
+try:
+    migrations.ensure_current(storage.get_store(DATA_FILE))
+except migrations.MigrationError as e:
+    st.error(f"❌ Could not upgrade the catalog: {e}")
+    st.stop()
+
 # --- Session State Initialization ---
 if 'authenticated' not in st.session_state:
     st.session_state.authenticated = False
 if 'user_role' not in st.session_state:
     st.session_state.user_role = None
+if 'username' not in st.session_state:
+    st.session_state.username = None
+if 'auth_token' not in st.session_state:
+    st.session_state.auth_token = None
 if 'current_category' not in st.session_state:
     st.session_state.current_category = "填充"
 
@@ -131,19 +91,99 @@ def login_page():
             password = st.text_input("Password", type="password")
 
             if st.form_submit_button("Login", use_container_width=True):
-                data = load_data()
-                if username in data["users"] and data["users"][username] == password:
-                    st.session_state.authenticated = True
-                    st.session_state.user_role = "admin" if username == "admin" else "partner"
-                    st.success("Login successful!")
-                    st.rerun()
+                # Checked against the credentials store on a worker thread; the catalog is not read
+                try:
+                    session = credentials.shared().login(username, password, client=credentials.client_address())
+                except credentials.LoginError as e:
+                    st.error(str(e))
                 else:
-                    st.error("Invalid username or password")
+                    if session["role"] not in ("admin", "partner"):
+                        st.error("This account cannot manage products")
+                    else:
+                        start_session(session)
+                        st.success("Login successful!")
+                        st.rerun()
+
+def start_session(session):
+    st.session_state.authenticated = True
+    st.session_state.user_role = session["role"]
+    st.session_state.username = session["username"]
+    st.session_state.auth_token = session["token"]
+
+def end_session():
+    st.session_state.authenticated = False
+    st.session_state.user_role = None
+    st.session_state.username = None
+    st.session_state.auth_token = None
+
+def session_valid():
+    """Check the session token (not the password) and renew it; logs out when it has expired"""
+    if not st.session_state.authenticated:
+        return False
+    session = credentials.shared().check_token(st.session_state.auth_token)
+    if session is None:
+        end_session()
+        return False
+    start_session(session)
+    return True
 
 # --- Admin Interface ---
+def show_conflict(error, action):
+    """Explain a rejected save and show the product as it is now"""
+    current = error.current
+    if current is None:
+        st.error(f"⚠️ This product was deleted by someone else, so it could not be {action}.")
+        return
+    st.error(f"⚠️ Someone else changed this product, so it was not {action}. This is the latest version:")
+    st.info(f"**{current['name']}** · {current['source']} · {'行貨' if current['is_genuine'] else '水貨'} · "
+            f"${current['price']} {current['unit']}")
+
+def is_duplicate(data, category, product, exclude=None):
+    """Show an error and return True if category already has this product (same name, source and type)"""
+    dupes = catalog_dupes.shared_index().sync(data)
+    found = dupes.find(category, product, exclude)
+    if found is None:
+        return False
+    existing = dupes.record(found)[1]
+    st.error(f"⚠️ {category} already has **{existing['name']}** from {existing['source']} "
+             f"({'行貨' if existing['is_genuine'] else '水貨'}, ${existing['price']} {existing['unit']}).")
+    return True
+
+def rerun_fragment():
+    """Rerun only the fragment this is called from (the whole page if it ran as part of a full run)"""
+    try:
+        st.rerun(scope="fragment")
+    except st.errors.StreamlitAPIException:
+        st.rerun()
+
+def find_products(data, category, text, limit):
+    """Products in category with id text, or else whose name or source matches text"""
+    found = storage.get_store(DATA_FILE).get_product(text)
+    if found is not None:
+        found_category, product = found
+        if found_category == category:
+            return [product]
+        st.info(f"**{product['name']}** is in {found_category}.")
+        if st.button(f"📦 Go to {found_category}", key="jump_category"):
+            st.session_state.current_category = found_category
+            st.rerun()
+        return []
+
+    total, results = catalog_search.shared_index().sync(data).search(text, limit=limit, category=category)
+    if not total:
+        st.info(f"No products in {category} match \"{text}\".")
+    elif total > limit:
+        st.caption(f"First {limit} of {total} matches, refine the search to narrow it down.")
+    return [product for _, product in results]
+
 def admin_interface():
     """Main admin interface for managing products"""
-    data = load_data()
+    with perf.span("load_data") as span:
+        data = load_data()
+        perf.note_catalog(span, data, storage.get_store(DATA_FILE).path)
+    # Kept up to date from the products each write changed, shared by all sessions
+    with perf.span("stats_sync"):
+        stats = catalog_stats.shared_index().sync(data)
 
     # Header
     st.markdown('<h1 class="main-header">💉 Clinic Product Management</h1>', unsafe_allow_html=True)
@@ -153,15 +193,23 @@ def admin_interface():
     
     with col1:
         if st.button("☁️ Upload to Cloud", key="upload_btn", use_container_width=True, help="Save all changes to cloud"):
-            save_data(data)
-            st.success("✅ All data uploaded successfully!")
+            # The cloud copy is always clinic_data.json, whichever backend is in use
+            store = storage.get_store(DATA_FILE)
+            with perf.span("publish") as span:
+                store.export_json(DATA_FILE)
+                # Plus the read-only snapshot the user app downloads (no user accounts in it)
+                manifest, written = snapshot.publish(store.load() or {})
+                span.note(shards=written)
+            st.success(f"✅ All data uploaded successfully! ({len(manifest['categories'])} categories, "
+                       f"{written} new shard{'s' if written != 1 else ''})")
     
     with col3:
         if st.button("Logout", key="logout"):
-            st.session_state.authenticated = False
-            st.session_state.user_role = None
+            end_session()
             st.rerun()
 
+    dashboard_panel(stats)
+
     # Main layout
     col_left, col_right = st.columns([1, 2])
 
@@ -185,142 +233,219 @@ def admin_interface():
         if st.session_state.current_category in data["products"]:
             products = data["products"][st.session_state.current_category]
             
-            # Handle migration from dict to list format
-            if isinstance(products, dict):
-                # Convert old dict format to new list format
-                products_list = []
-                for prod_name, prod_info in products.items():
-                    product_type_suffix = "_g" if prod_info.get('is_genuine', True) else "_ng"
-                    products_list.append({
-                        'id': f"{prod_name.lower().replace(' ', '_')}{product_type_suffix}",
-                        'name': prod_name,
-                        **prod_info
-                    })
-                data["products"][st.session_state.current_category] = products_list
-                save_data(data)  # Save the migrated format
-                products = products_list
-            
-            st.markdown(f"**Products in {st.session_state.current_category}:** {len(products)}")
-
-            for idx, product_info in enumerate(products):
-                product_id = product_info.get('id', f'product_{idx}')
-                key_suffix = f"{product_id}_{idx}"
-                product_name = product_info['name']
-                product_type = '行' if product_info['is_genuine'] else '水'
-                display_name = f"{product_name} ({product_type})"
-                
-                with st.expander(f"💰 {display_name}"):
-                    col1, col2 = st.columns([3, 1])
-                    with col1:
-                        st.write(f"**Source:** {product_info['source']}")
-                        st.write(f"**Type:** {'行貨' if product_info['is_genuine'] else '水貨'}")
-                        st.write(f"**Price:** ${product_info['price']}")
-                        st.write(f"**Unit:** {product_info['unit']}")
-                        st.write(f"**Added:** {product_info['date_added']}")
-                    with col2:
-                        # Edit button
-                        edit_key = f"edit_{st.session_state.current_category}_{key_suffix}"
-                        if st.button("✏️ Edit", key=edit_key, help=f"Edit {product_name}"):
-                            st.session_state[f"editing_{key_suffix}"] = True
-
-                        # Delete button
-                        delete_key = f"delete_{st.session_state.current_category}_{key_suffix}"
-                        if st.button("🗑️ Delete", key=delete_key, help=f"Delete {product_name}"):
-                            st.session_state[f"confirm_delete_{key_suffix}"] = True
-
-                # Edit form (shown when edit button is clicked)
-                if st.session_state.get(f"editing_{key_suffix}", False):
-                    st.markdown("---")
-                    with st.container():
-                        st.markdown(f"### ✏️ Edit Product: {display_name}")
-
-                        with st.form(f"edit_form_{key_suffix}"):
-                            # Product name (editable)
-                            new_product_name = st.text_input("Product Name", value=product_name, key=f"name_{key_suffix}")
-
-                            # Source selection
-                            source_options = data["sources"] + ["+ Add New Source"]
-                            current_source_index = data["sources"].index(product_info['source']) if product_info['source'] in data["sources"] else 0
-                            selected_source = st.selectbox("Product Source", source_options, index=current_source_index, key=f"source_{key_suffix}")
-
-                            # Handle new source addition
-                            if selected_source == "+ Add New Source":
-                                new_source = st.text_input("New Source Name", placeholder="Enter new source", key=f"new_src_{key_suffix}")
-                                if new_source and new_source not in data["sources"]:
-                                    selected_source = new_source
-
-                            # Genuine/Parallel import
-                            is_genuine = st.checkbox("行貨 (Genuine Goods)", value=product_info['is_genuine'], key=f"genuine_{key_suffix}")
-
-                            # Price and Unit
-                            col3, col4 = st.columns(2)
-                            with col3:
-                                price = st.number_input("Price ($)", value=float(product_info['price']), min_value=0.0, step=0.01, format="%.2f", key=f"price_{key_suffix}")
-                            with col4:
-                                unit_options = ["per 支", "per 盒", "per part", "per ml", "per vial"]
-                                current_unit_index = unit_options.index(product_info['unit']) if product_info['unit'] in unit_options else 0
-                                unit = st.selectbox("Unit", unit_options, index=current_unit_index, key=f"unit_{key_suffix}")
-
-                            # Form buttons
-                            col_save, col_cancel = st.columns(2)
-                            with col_save:
-                                save_submitted = st.form_submit_button("💾 Save Changes", use_container_width=True)
-                            with col_cancel:
-                                cancel_submitted = st.form_submit_button("❌ Cancel", use_container_width=True)
-
-                            if save_submitted:
-                                if not new_product_name.strip():
-                                    st.error("Product name cannot be empty")
-                                elif price <= 0:
-                                    st.error("Price must be greater than 0")
-                                else:
-                                    # Add/update new source if needed
-                                    if selected_source not in data["sources"] and selected_source != "+ Add New Source":
-                                        data["sources"].append(selected_source)
-
-                                    # Update product at this index
-                                    data["products"][st.session_state.current_category][idx] = {
-                                        "id": product_id,
-                                        "name": new_product_name.strip(),
-                                        "source": selected_source if selected_source != "+ Add New Source" else new_source,
-                                        "is_genuine": is_genuine,
-                                        "price": price,
-                                        "unit": unit,
-                                        "date_added": product_info['date_added']  # Keep original date
-                                    }
-
-                                    save_data(data)
-                                    st.success(f"✅ Product updated successfully!")
-                                    st.session_state[f"editing_{key_suffix}"] = False
-                                    st.rerun()
-
-                            if cancel_submitted:
-                                st.session_state[f"editing_{key_suffix}"] = False
-                                st.rerun()
-
-                # Delete confirmation (shown when delete button is clicked)
-                if st.session_state.get(f"confirm_delete_{key_suffix}", False):
-                    st.markdown("---")
-                    with st.container():
-                        st.error(f"🗑️ Are you sure you want to delete **{display_name}**?")
-                        st.warning("This action cannot be undone!")
-
-                        col_confirm, col_cancel_del = st.columns(2)
-                        with col_confirm:
-                            if st.button("🗑️ Yes, Delete", key=f"confirm_del_{key_suffix}", use_container_width=True):
-                                data["products"][st.session_state.current_category].pop(idx)
-                                save_data(data)
-                                st.success(f"✅ Product deleted successfully!")
-                                st.session_state[f"confirm_delete_{key_suffix}"] = False
-                                st.rerun()
-                        with col_cancel_del:
-                            if st.button("❌ Cancel", key=f"cancel_del_{key_suffix}", use_container_width=True):
-                                st.session_state[f"confirm_delete_{key_suffix}"] = False
-                                st.rerun()
+            summary = stats.summary(category=st.session_state.current_category)
+            st.markdown(f"**Products in {st.session_state.current_category}:** {summary['count']}")
+            st.caption(catalog_stats.describe(summary))
+
+            # Only one page of products is rendered, so big categories stay quick to click through
+            page_cols = st.columns(2)
+            with page_cols[0]:
+                page_size = st.selectbox("Per page", PAGE_SIZES, index=1, key="admin_page_size")
+            pages = max(1, (len(products) - 1) // page_size + 1)
+            page_key = f"admin_page_{st.session_state.current_category}"
+            if st.session_state.get(page_key, 1) > pages:
+                st.session_state[page_key] = pages
+            with page_cols[1]:
+                page = st.number_input(f"Page (of {pages})", min_value=1, max_value=pages, step=1, key=page_key)
+
+            jump = st.text_input("Jump to product", placeholder="🔎 Product ID or name", key="admin_jump")
+            if jump.strip():
+                visible = find_products(data, st.session_state.current_category, jump.strip(), page_size)
+            else:
+                start = (page - 1) * page_size
+                visible = products[start:start + page_size]
+                if products:
+                    st.caption(f"Showing {start + 1}-{start + len(visible)} of {len(products)}")
+
+            for product_info in visible:
+                # One fragment per card: its buttons and forms rerun just that card
+                product_card(st.session_state.current_category, product_info["id"])
 
     # Right column - Add new product form
     with col_right:
         st.markdown('<div class="admin-panel">', unsafe_allow_html=True)
+        add_product_panel()
+
+        bulk_import_panel(data, categories)
+        bulk_price_panel(data)
+        duplicates_panel(data)
+
+        st.markdown('</div>', unsafe_allow_html=True)
+
+def unit_choices(data, current=None):
+    """The standard units, then any other unit the catalog (or the product being edited) already uses"""
+    units = list(catalog_import.UNITS)
+    for unit in catalog_query.shared_index().sync(data).values("unit") + [current]:
+        if unit and unit not in units:
+            units.append(unit)
+    return units
+
+@st.fragment
+def product_card(category, product_id):
+    """One product's details, edit form and delete confirmation
+
+    A fragment: Edit, Cancel and Save rerun only this card. Deleting changes
+    the category's count, so that reruns the whole page.
+    """
+    with perf.fragment("product_card", "admin_app"):
+        found = storage.get_store(DATA_FILE).get_product(product_id)
+        if found is None or found[0] != category:
+            st.info("This product was deleted or moved by someone else.")
+            return
+        product_info = found[1]
+        data = load_data()
+        # Keyed by id only, so widgets keep their identity when other products are added or deleted
+        key_suffix = product_id
+        product_name = product_info['name']
+        product_type = '行' if product_info['is_genuine'] else '水'
+        display_name = f"{product_name} ({product_type})"
+
+        with st.expander(f"💰 {display_name}"):
+            col1, col2 = st.columns([3, 1])
+            with col1:
+                st.write(f"**Source:** {product_info['source']}")
+                st.write(f"**Type:** {'行貨' if product_info['is_genuine'] else '水貨'}")
+                st.write(f"**Price:** ${product_info['price']}")
+                st.write(f"**Unit:** {product_info['unit']}")
+                st.write(f"**Added:** {product_info['date_added']}")
+                trend = price_history.shared().trend(product_id)
+                if trend:
+                    st.write(f"**Price history:** {price_history.sparkline(price for _, price in trend)} "
+                             f"${trend[0][1]} → ${trend[-1][1]} since {trend[0][0][:10]} "
+                             f"({len(trend) - 1} change{'s' if len(trend) > 2 else ''})")
+            with col2:
+                # Edit button
+                edit_key = f"edit_{category}_{key_suffix}"
+                if st.button("✏️ Edit", key=edit_key, help=f"Edit {product_name}"):
+                    st.session_state[f"editing_{key_suffix}"] = True
+                    # Remember the revision being edited so a stale save is rejected
+                    st.session_state[f"edit_rev_{key_suffix}"] = product_info.get('rev', 0)
+
+                # Delete button
+                delete_key = f"delete_{category}_{key_suffix}"
+                if st.button("🗑️ Delete", key=delete_key, help=f"Delete {product_name}"):
+                    st.session_state[f"confirm_delete_{key_suffix}"] = True
+                    st.session_state[f"delete_rev_{key_suffix}"] = product_info.get('rev', 0)
+
+        # Edit form (shown when edit button is clicked)
+        if st.session_state.get(f"editing_{key_suffix}", False):
+            st.markdown("---")
+            with st.container():
+                st.markdown(f"### ✏️ Edit Product: {display_name}")
+
+                with st.form(f"edit_form_{key_suffix}"):
+                    # Product name (editable)
+                    new_product_name = st.text_input("Product Name", value=product_name, key=f"name_{key_suffix}")
+
+                    # Source selection
+                    source_options = data["sources"] + ["+ Add New Source"]
+                    current_source_index = data["sources"].index(product_info['source']) if product_info['source'] in data["sources"] else 0
+                    selected_source = st.selectbox("Product Source", source_options, index=current_source_index, key=f"source_{key_suffix}")
+
+                    # Handle new source addition
+                    if selected_source == "+ Add New Source":
+                        new_source = st.text_input("New Source Name", placeholder="Enter new source", key=f"new_src_{key_suffix}")
+                        if new_source and new_source not in data["sources"]:
+                            selected_source = new_source
+
+                    # Genuine/Parallel import
+                    is_genuine = st.checkbox("行貨 (Genuine Goods)", value=product_info['is_genuine'], key=f"genuine_{key_suffix}")
+
+                    # Price and Unit
+                    col3, col4 = st.columns(2)
+                    with col3:
+                        price = st.number_input("Price ($)", value=float(product_info['price']), min_value=0.0, step=0.01, format="%.2f", key=f"price_{key_suffix}")
+                    with col4:
+                        unit_options = unit_choices(data, product_info.get('unit'))
+                        current_unit_index = unit_options.index(product_info['unit']) if product_info.get('unit') in unit_options else 0
+                        unit = st.selectbox("Unit", unit_options, index=current_unit_index, key=f"unit_{key_suffix}")
+
+                    # Form buttons
+                    col_save, col_cancel = st.columns(2)
+                    with col_save:
+                        save_submitted = st.form_submit_button("💾 Save Changes", use_container_width=True)
+                    with col_cancel:
+                        cancel_submitted = st.form_submit_button("❌ Cancel", use_container_width=True)
+
+                    if save_submitted:
+                        if not new_product_name.strip():
+                            st.error("Product name cannot be empty")
+                        elif price <= 0:
+                            st.error("Price must be greater than 0")
+                        elif not is_duplicate(data, category, {
+                                "name": new_product_name,
+                                "source": selected_source if selected_source != "+ Add New Source" else new_source,
+                                "is_genuine": is_genuine}, exclude=product_id):
+                            store = storage.get_store(DATA_FILE)
+
+                            # Add/update new source if needed
+                            if selected_source not in data["sources"] and selected_source != "+ Add New Source":
+                                store.add_source(selected_source)
+
+                            # Update this product's record only, if nobody else saved it meanwhile
+                            try:
+                                store.update_product(category, product_id, {
+                                    "id": product_id,
+                                    "name": new_product_name.strip(),
+                                    "source": selected_source if selected_source != "+ Add New Source" else new_source,
+                                    "is_genuine": is_genuine,
+                                    "price": price,
+                                    "unit": unit,
+                                    "date_added": product_info['date_added']  # Keep original date
+                                }, expected_rev=st.session_state.get(f"edit_rev_{key_suffix}", product_info.get('rev', 0)))
+                            except storage.ConflictError as e:
+                                show_conflict(e, "saved")
+                                if e.current is not None:
+                                    # Saving again now deliberately overwrites the version shown above
+                                    st.session_state[f"edit_rev_{key_suffix}"] = e.current.get('rev', 0)
+                                    st.warning("Save again to replace it with your changes.")
+                            else:
+                                price_history.shared().record(product_id, product_info['source'],
+                                                              product_info['price'], price,
+                                                              st.session_state.username)
+                                st.success(f"✅ Product updated successfully!")
+                                st.session_state[f"editing_{key_suffix}"] = False
+                                rerun_fragment()
+
+                    if cancel_submitted:
+                        st.session_state[f"editing_{key_suffix}"] = False
+                        rerun_fragment()
+
+        # Delete confirmation (shown when delete button is clicked)
+        if st.session_state.get(f"confirm_delete_{key_suffix}", False):
+            st.markdown("---")
+            with st.container():
+                st.error(f"🗑️ Are you sure you want to delete **{display_name}**?")
+                st.warning("This action cannot be undone!")
+
+                col_confirm, col_cancel_del = st.columns(2)
+                with col_confirm:
+                    if st.button("🗑️ Yes, Delete", key=f"confirm_del_{key_suffix}", use_container_width=True):
+                        try:
+                            storage.get_store(DATA_FILE).delete_product(
+                                category, product_id,
+                                expected_rev=st.session_state.get(f"delete_rev_{key_suffix}", product_info.get('rev', 0)))
+                        except storage.ConflictError as e:
+                            show_conflict(e, "deleted")
+                            st.session_state[f"delete_rev_{key_suffix}"] = e.current.get('rev', 0)
+                        else:
+                            st.success(f"✅ Product deleted successfully!")
+                            st.session_state[f"confirm_delete_{key_suffix}"] = False
+                            st.rerun()  # the category has one product fewer
+                with col_cancel_del:
+                    if st.button("❌ Cancel", key=f"cancel_del_{key_suffix}", use_container_width=True):
+                        st.session_state[f"confirm_delete_{key_suffix}"] = False
+                        rerun_fragment()
+
+@st.fragment
+def add_product_panel():
+    """Form for a new product in the current category, with the source list
+
+    A fragment: adding a source reruns only this panel. Adding a product
+    changes the category's count, so that reruns the whole page.
+    """
+    with perf.fragment("add_product_panel", "admin_app"):
+        data = load_data()
         st.markdown(f"### ➕ Add New Product - {st.session_state.current_category}")
 
         # Source management (outside form for immediate updates)
@@ -334,10 +459,9 @@ def admin_interface():
             if st.button("➕ Add Source", key="add_source_btn"):
                 if new_source_name.strip():
                     if new_source_name not in data["sources"]:
-                        data["sources"].append(new_source_name.strip())
-                        save_data(data)
+                        storage.get_store(DATA_FILE).add_source(new_source_name.strip())
                         st.success(f"✅ Added new source: {new_source_name}")
-                        st.rerun()
+                        rerun_fragment()
                     else:
                         st.warning("Source already exists")
                 else:
@@ -366,7 +490,7 @@ def admin_interface():
             with col3:
                 price = st.number_input("Price ($)", min_value=0.0, step=0.01, format="%.2f")
             with col4:
-                unit_options = ["per 支", "per 盒", "per part", "per ml", "per vial"]
+                unit_options = unit_choices(data)
                 unit = st.selectbox("Unit", unit_options)
 
             # Submit button
@@ -379,17 +503,13 @@ def admin_interface():
                     st.error("Please select a valid product source")
                 elif price <= 0:
                     st.error("Please enter a valid price")
-                else:
-                    # Initialize category if it doesn't exist
-                    if st.session_state.current_category not in data["products"]:
-                        data["products"][st.session_state.current_category] = []
-
-                    # Generate unique ID based on product name, type, and timestamp to avoid duplicates
-                    product_type_suffix = "_g" if is_genuine else "_ng"
-                    product_id = f"{product_name.lower().replace(' ', '_')}{product_type_suffix}_{datetime.now().strftime('%Y%m%d%H%M%S%f')}"
-                    
-                    # Add product to list
-                    data["products"][st.session_state.current_category].append({
+                elif not is_duplicate(data, st.session_state.current_category,
+                                      {"name": product_name, "source": final_source, "is_genuine": is_genuine}):
+                    # Compact, time-sortable id that never collides
+                    product_id = storage.new_product_id()
+
+                    # Add product to list (the store creates the category if it doesn't exist)
+                    storage.get_store(DATA_FILE).add_product(st.session_state.current_category, {
                         "id": product_id,
                         "name": product_name.strip(),
                         "source": final_source,
@@ -399,18 +519,196 @@ def admin_interface():
                         "date_added": datetime.now().strftime("%Y-%m-%d %H:%M")
                     })
 
-                    save_data(data)
                     st.success(f"✅ Product '{product_name}' added successfully!")
+                    st.rerun()  # the category has one product more
+
+def dashboard_panel(stats):
+    """Catalog statistics per category and per source"""
+    with st.expander("📊 Dashboard"):
+        # Rebuilt only when the catalog changes, not on every rerun of the page
+        summary, by_category, by_source = stats.memo("dashboard", lambda: (
+            catalog_stats.describe(stats.summary()),
+            catalog_stats.table_rows(stats.table("category"), "Category"),
+            catalog_stats.table_rows(stats.table("source"), "Source"),
+        ))
+        st.caption(summary)
+        st.markdown("**By category**")
+        st.dataframe(by_category, use_container_width=True, hide_index=True)
+        st.markdown("**By source**")
+        st.dataframe(by_source, use_container_width=True, hide_index=True)
+
+@st.fragment(run_every=IMPORT_POLL_SECONDS)
+def import_progress(job):
+    """Progress of an import being checked on the import pool; reruns the page once it is done"""
+    progress = job.progress()
+    if progress["done"]:
+        st.rerun()
+    st.info(f"⏳ Checking {job.filename}: {progress['rows']} rows so far...")
+
+def bulk_import_panel(data, categories):
+    """Upload a supplier price list, review the checked rows, then import them in one commit"""
+    with st.expander(f"📥 Bulk Import to {st.session_state.current_category} (CSV / Excel)",
+                     expanded="import_job" in st.session_state or "import_report" in st.session_state):
+        st.caption("Columns: name, price, and optionally source, unit, type (行貨/水貨) and category. "
+                   f"Units: {', '.join(catalog_import.UNITS)}.")
+        job = st.session_state.get("import_job")
+
+        if job is None:
+            report = st.session_state.pop("import_report", None)
+            if report is not None:
+                st.success(f"✅ Imported {report['added']} products!")
+                if report["skipped"]:
+                    skipped = len(report["skipped"])
+                    st.warning(f"Skipped {skipped} row{'s' if skipped != 1 else ''} that the catalog got "
+                               "after the file was checked.")
+                    st.dataframe(report["skipped"], use_container_width=True, hide_index=True)
+            uploaded = st.file_uploader("Price list", type=["csv", "xlsx"], key="import_file")
+            default_source = st.selectbox("Source for rows without one", data["sources"], key="import_default_source")
+            if uploaded is not None and st.button("🔍 Check File", key="import_check"):
+                st.session_state.import_job = catalog_import.start_import(
+                    uploaded, st.session_state.current_category, data, categories, default_source)
+                st.rerun()
+            return
+
+        progress = job.progress()
+        if not progress["done"]:
+            import_progress(job)
+            return
+
+        if job.failed:
+            st.error(f"Could not read {job.filename}: {job.failed}")
+        else:
+            col1, col2, col3 = st.columns(3)
+            col1.metric("Rows", progress["rows"])
+            col2.metric("Accepted", progress["accepted"])
+            col3.metric("Rejected", progress["rejected"])
+            if job.new_sources:
+                st.info(f"New sources to add: {', '.join(job.new_sources)}")
+            if job.errors:
+                st.markdown("**Rejected rows**")
+                st.dataframe(job.errors, use_container_width=True, hide_index=True)
+                if progress["rejected"] > len(job.errors):
+                    st.caption(f"Showing the first {len(job.errors)} of {progress['rejected']} rejected rows.")
+            if job.preview:
+                st.markdown("**Accepted rows (preview)**")
+                st.dataframe([{"Category": category, "Product": product["name"], "Source": product["source"],
+                               "Type": "行" if product["is_genuine"] else "水", "Price": product["price"],
+                               "Unit": product["unit"]} for category, product in job.preview],
+                             use_container_width=True, hide_index=True)
+
+        col_import, col_discard = st.columns(2)
+        with col_import:
+            if not job.failed and progress["accepted"] and st.button(
+                    f"✅ Import {progress['accepted']} products", key="import_commit", use_container_width=True):
+                added = job.commit(storage.get_store(DATA_FILE))
+                del st.session_state.import_job
+                st.session_state.import_report = {"added": len(added), "skipped": job.skipped}
+                st.rerun()
+        with col_discard:
+            if st.button("❌ Discard", key="import_discard", use_container_width=True):
+                job.close()
+                del st.session_state.import_job
+                st.rerun()
+
+def bulk_price_panel(data):
+    """Change the price of every product matching a filter, previewed, in one commit"""
+    with st.expander("💲 Bulk Price Change"):
+        all_categories = st.checkbox("All categories", key="bulk_all_categories")
+        category = None if all_categories else st.session_state.current_category
+        index = catalog_query.shared_index().sync(data)
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            sources = st.multiselect("Sources", index.values("source", category), key="bulk_sources")
+        with col2:
+            product_type = st.selectbox("Type", ["All", "行貨", "水貨"], key="bulk_type")
+        with col3:
+            units = st.multiselect("Units", index.values("unit", category), key="bulk_units")
+
+        col4, col5, col6 = st.columns(3)
+        with col4:
+            operation = st.selectbox("Change", list(bulk_edit.OPERATIONS), format_func=bulk_edit.OPERATIONS.get,
+                                     key="bulk_operation")
+        with col5:
+            amount = 0.0
+            if operation != "round":
+                amount = st.number_input(bulk_edit.OPERATIONS[operation], value=0.0, step=1.0, format="%.2f",
+                                         key="bulk_amount")
+        with col6:
+            step = st.selectbox("Rounding", list(bulk_edit.ROUNDING), format_func=bulk_edit.ROUNDING.get,
+                                key="bulk_rounding")
+
+        genuine = None if product_type == "All" else product_type == "行貨"
+        # Planning scans the selection, so it only runs on Preview; the plan is kept with the filters it was
+        # made for, and Apply commits exactly what was shown (edits made since are caught by their revs)
+        filters = (category, tuple(sources), genuine, tuple(units), operation, amount, step)
+        if st.button("🔍 Preview", key="bulk_preview"):
+            with perf.span("bulk_price_plan") as span:
+                selected = bulk_edit.select(data, category, sources, genuine, units)
+                changes, invalid = bulk_edit.plan(selected, operation, amount, step)
+                span.note(products=len(selected))
+            st.session_state.bulk_plan = {"filters": filters, "matched": len(selected), "changes": changes,
+                                          "invalid": invalid}
+        shown = st.session_state.get("bulk_plan")
+        if shown is None or shown["filters"] != filters:
+            st.caption("Preview to see which prices would change.")
+            return
+        changes, invalid = shown["changes"], shown["invalid"]
+
+        st.caption(f"{shown['matched']} products match, {len(changes)} would change"
+                   f"{' in ' + category if category else ''}.")
+        if invalid:
+            st.warning(f"{len(invalid)} products would drop to $0 or below and are left out, "
+                       f"e.g. {invalid[0][1]['name']}.")
+        if changes:
+            st.dataframe([{"Product": product["name"], "Category": product_category, "Source": product["source"],
+                           "Before": catalog_query.price_of(product), "After": price,
+                           "Change": round(price - catalog_query.price_of(product), 2)}
+                          for product_category, product, price in changes[:BULK_PREVIEW_ROWS]],
+                         use_container_width=True, hide_index=True)
+            if len(changes) > BULK_PREVIEW_ROWS:
+                st.caption(f"Showing the first {BULK_PREVIEW_ROWS} of {len(changes)} changes.")
+
+            if st.button(f"✅ Apply to {len(changes)} products", key="bulk_apply", use_container_width=True):
+                del st.session_state.bulk_plan
+                try:
+                    updated = bulk_edit.apply(storage.get_store(DATA_FILE), changes, price_history.shared(),
+                                              st.session_state.username)
+                except storage.ConflictError as e:
+                    name = e.current["name"] if e.current is not None else "a product"
+                    st.error(f"⚠️ Someone else changed {name} after this preview, so no prices were changed. "
+                             "Preview again and apply.")
+                else:
+                    st.success(f"✅ Updated {len(updated)} prices!")
                     st.rerun()
 
-        st.markdown('</div>', unsafe_allow_html=True)
+def duplicates_panel(data):
+    """Groups of duplicate and near-duplicate products, with a merge report to download"""
+    with st.expander("🧹 Duplicates"):
+        dupes = catalog_dupes.shared_index().sync(data)
+        # Sorting every group is the slow part; done again only when the catalog changes
+        rows = dupes.memo("merge_report", lambda: catalog_dupes.merge_report(dupes))
+        if not rows:
+            st.caption("No duplicates found.")
+            return
+        merges = sum(row["Action"] == "merge" for row in rows)
+        st.caption(f"{rows[-1]['Group']} groups: {merges} products look like a copy of the oldest product in "
+                   "their group (same category, source and type; names differing only in case, width, spacing "
+                   "or word order).")
+        st.dataframe(rows[:DUPLICATE_PREVIEW_ROWS], use_container_width=True, hide_index=True)
+        if len(rows) > DUPLICATE_PREVIEW_ROWS:
+            st.caption(f"Showing the first {DUPLICATE_PREVIEW_ROWS} of {len(rows)} rows; the report has them all.")
+        report = dupes.memo("merge_report_csv", lambda: catalog_dupes.report_csv(rows))
+        st.download_button("⬇️ Merge report (CSV)", report, file_name="merge_report.csv",
+                           mime="text/csv", key="duplicates_download")
 
 # --- Main App Logic ---
 def main():
-    if not st.session_state.authenticated:
-        login_page()
-    else:
-        admin_interface()
+    with perf.rerun("admin_app"):
+        if not session_valid():
+            login_page()
+        else:
+            admin_interface()
+    perf.debug_panel()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
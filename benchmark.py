@@ -0,0 +1,228 @@
+"""
+Benchmarks of the data and render paths on synthetic catalogs
+Run this with: python benchmark.py [--sizes 1000 10000 100000] [--backend json] [--compare baseline.json]
+
+For each size, a seeded catalog from synthetic_catalog is written to a temp
+folder and timed through the same code the apps run:
+
+    save_data        store.save() of the whole catalog
+    load_cold        store.load() with an empty cache (parse from disk)
+    load_warm        store.load() served from the shared cache
+    migrate          every schema migration on the same catalog in the old dict format
+    add_product      one product added to the full catalog
+    update_product   one product edited in the full catalog
+    query_index      building the filter/sort index from scratch
+    search_index     building the search index from scratch
+    stats_index      building the statistics index from scratch
+    dupes_index      building the duplicate index from scratch
+    compare_index    building the price comparison index and listing every category's groups
+    user_table       user_app's display table for the largest category
+    user_first       first render of user_app.py (Streamlit AppTest, headless)
+    user_rerun       a rerun of the same session
+    admin_first      first render of admin_app.py, logged in as admin
+    admin_rerun      a rerun of the same session
+
+Times are in seconds, the best of --repeat runs (first renders run once).
+Results are written to --output as JSON. --compare BASELINE checks them
+against an earlier file (or --compare OLD NEW compares two files without
+running anything) and exits with 1 if any timing got more than --threshold
+times slower.
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import catalog_cache
+import catalog_compare
+import catalog_dupes
+import catalog_query
+import catalog_search
+import catalog_stats
+import credentials
+import migrations
+import storage
+import synthetic_catalog
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DATA_FILE = "clinic_data.json"
+NOISE_FLOOR = 0.005  # seconds; smaller slowdowns are not reported as regressions
+ADMIN_SESSION = {"authenticated": True, "user_role": "admin", "username": "admin"}
+
+
+def best_of(function, repeat):
+    """(best time, last result) of repeat calls"""
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def render_times(app, session_state, repeat):
+    """(first render, best rerun, exceptions) of app through AppTest"""
+    from streamlit.testing.v1 import AppTest
+
+    test = AppTest.from_file(os.path.join(HERE, app), default_timeout=600)
+    for key, value in session_state.items():
+        test.session_state[key] = value
+    first, _ = best_of(test.run, 1)
+    rerun, _ = best_of(test.run, repeat)
+    return first, rerun, [str(e.value) for e in test.exception]
+
+
+def bench_size(size, args):
+    """Every timing for one catalog size, run inside a fresh temp folder"""
+    results = {}
+    data = synthetic_catalog.generate(size, seed=args.seed)
+    store = storage.get_store(DATA_FILE)
+    results["save_data"], _ = best_of(lambda: store.save(data), args.repeat)
+
+    def load_cold():
+        catalog_cache.cache_for(store.path).invalidate()
+        return store.load()
+
+    results["load_cold"], loaded = best_of(load_cold, args.repeat)
+    results["load_warm"], loaded = best_of(store.load, args.repeat)
+
+    legacy = synthetic_catalog.generate(size, seed=args.seed, legacy=True)
+    results["migrate"], _ = best_of(lambda: migrations.migrate(legacy), args.repeat)
+    del legacy
+
+    new = synthetic_catalog.generate(1, seed=args.seed + 1)["products"]
+    category, product = next((c, products[0]) for c, products in new.items() if products)
+    results["add_product"], _ = best_of(
+        lambda: store.add_product(category, {**product, "id": storage.new_product_id()}), args.repeat)
+    edited = store.load()["products"][category][0]
+    results["update_product"], _ = best_of(
+        lambda: store.update_product(category, edited["id"], {**edited, "price": edited["price"] + 1}), args.repeat)
+
+    loaded = store.load()
+    results["query_index"], index = best_of(lambda: catalog_query.QueryIndex().sync(loaded), args.repeat)
+    results["search_index"], _ = best_of(lambda: catalog_search.SearchIndex().sync(loaded), args.repeat)
+    results["stats_index"], _ = best_of(lambda: catalog_stats.StatsIndex().sync(loaded), args.repeat)
+    results["dupes_index"], _ = best_of(lambda: catalog_dupes.DuplicateIndex().sync(loaded), args.repeat)
+
+    def compare_index():
+        compare = catalog_compare.CompareIndex().sync(loaded)
+        return [compare.groups(category) for category in loaded["products"]]
+
+    results["compare_index"], _ = best_of(compare_index, args.repeat)
+
+    import pandas  # noqa: F401 - imported up front so user_table times the table, not the import
+    import user_app
+
+    largest = max(loaded["products"], key=lambda c: len(loaded["products"][c]))
+    products = loaded["products"][largest]
+
+    def user_table():
+        user_app.category_table.clear()
+        return user_app.category_table(id(products), largest, products)
+
+    results["user_table"], _ = best_of(user_table, args.repeat)
+
+    if not args.no_render:
+        results["user_first"], results["user_rerun"], errors = render_times("user_app.py", {}, args.repeat)
+        session = {**ADMIN_SESSION, "auth_token": credentials.shared().session_for("admin")["token"]}
+        results["admin_first"], results["admin_rerun"], admin_errors = render_times("admin_app.py", session,
+                                                                                    args.repeat)
+        for error in errors + admin_errors:
+            print(f"   ❌ {error}")
+    return {name: round(seconds, 6) for name, seconds in results.items()}
+
+
+def run(args):
+    os.environ["CLINIC_STORAGE"] = args.backend
+    # Running the apps' modules outside `streamlit run` logs a warning per Streamlit call
+    logging.disable(logging.WARNING)
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=HERE,
+                                capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = ""
+    report = {
+        "meta": {
+            "date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "commit": commit,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "backend": args.backend,
+            "seed": args.seed,
+            "repeat": args.repeat,
+        },
+        "sizes": {},
+    }
+    here = os.getcwd()
+    for size in args.sizes:
+        workdir = tempfile.mkdtemp(prefix=f"clinic_bench_{size}_")
+        os.environ["CLINIC_DB_FILE"] = os.path.join(workdir, "clinic_data.db")
+        os.chdir(workdir)
+        try:
+            print(f"📦 {size} products")
+            results = bench_size(size, args)
+        finally:
+            os.chdir(here)
+        for name, seconds in results.items():
+            print(f"   {name:<16}{seconds * 1000:>10.1f} ms")
+        report["sizes"][str(size)] = results
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"✅ Results written to {args.output}")
+    return report
+
+
+def compare(baseline, current, threshold):
+    """Print every timing next to the baseline; returns the number of regressions"""
+    regressions = 0
+    print(f"{'size':>8}  {'timing':<16}{'before':>10}{'after':>10}  change")
+    for size, results in current["sizes"].items():
+        for name, after in results.items():
+            before = baseline.get("sizes", {}).get(size, {}).get(name)
+            if before is None:
+                continue
+            ratio = after / before if before else float("inf")
+            slower = ratio > threshold and after - before > NOISE_FLOOR
+            regressions += slower
+            print(f"{size:>8}  {name:<16}{before * 1000:>8.1f}ms{after * 1000:>8.1f}ms  "
+                  f"{ratio:.2f}x{'  ❌ slower' if slower else ''}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the catalog data and render paths")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--backend", choices=sorted(storage.BACKENDS), default="json")
+    parser.add_argument("--no-render", action="store_true", help="skip the Streamlit app renders")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--compare", nargs="+", metavar="FILE",
+                        help="baseline results to compare against (two files: compare them without running)")
+    parser.add_argument("--threshold", type=float, default=1.25, help="slowdown ratio that counts as a regression")
+    args = parser.parse_args()
+
+    if args.compare and len(args.compare) > 2:
+        parser.error("--compare takes a baseline file, or two files to compare")
+    if args.compare and len(args.compare) == 2:
+        baseline, current = (catalog_cache.read_json(path) for path in args.compare)
+    else:
+        current = run(args)
+        baseline = catalog_cache.read_json(args.compare[0]) if args.compare else None
+    if baseline is not None:
+        regressions = compare(baseline, current, args.threshold)
+        print(f"{'❌' if regressions else '✅'} {regressions} regression{'s' if regressions != 1 else ''} "
+              f"(slower than {args.threshold}x)")
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
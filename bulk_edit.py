@@ -0,0 +1,83 @@
+"""
+Price changes applied to every product that matches a filter.
+
+select() picks products by category, source, 行貨/水貨 and unit through the
+shared catalog_query index. plan() works out each new price (set it, add or
+subtract an amount, or change it by a percentage, then optionally round it)
+and leaves out products whose price would not change. apply() writes the
+whole plan with one store.update_products() call: every price changes, or,
+if any of those products was edited after the plan was made, none does.
+Applied changes are also recorded in a price_history.PriceHistory.
+
+    changes, invalid = bulk_edit.plan(bulk_edit.select(data, category="填充"), "percent", 5)
+    bulk_edit.apply(store, changes)
+"""
+
+import math
+
+import catalog_query
+
+OPERATIONS = {
+    "percent": "Change by %",
+    "add": "Add / subtract $",
+    "set": "Set price to $",
+    "round": "Round only",
+}
+ROUNDING = {
+    None: "No rounding",
+    0.1: "Nearest $0.10",
+    0.5: "Nearest $0.50",
+    1: "Nearest $1",
+    5: "Nearest $5",
+    10: "Nearest $10",
+}
+
+
+def select(data, category=None, sources=None, genuine=None, units=None):
+    """Every (category, product) matching the filter, by name"""
+    index = catalog_query.shared_index().sync(data)
+    filters = {"category": category, "sources": sources, "genuine": genuine, "units": units}
+    total, _ = index.query(**filters, limit=0)
+    return index.query(**filters, limit=total)[1]
+
+
+def new_price(price, operation, amount=0, step=None):
+    """The price after one operation and the optional rounding to a multiple of step"""
+    if operation == "set":
+        price = amount
+    elif operation == "add":
+        price = price + amount
+    elif operation == "percent":
+        price = price * (1 + amount / 100)
+    elif operation != "round":
+        raise ValueError(f"Unknown price operation: {operation}")
+    if step:
+        # Half up, so $12.50 rounds to $13 the way people expect
+        price = math.floor(price / step + 0.5) * step
+    return round(float(price), 2)
+
+
+def plan(products, operation, amount=0, step=None):
+    """Return ([(category, product, new price)], products the change would take to $0 or below)"""
+    changes = []
+    invalid = []
+    for category, product in products:
+        old = catalog_query.price_of(product)
+        price = new_price(old, operation, amount, step)
+        if price <= 0:
+            invalid.append((category, product))
+        elif price != old:
+            changes.append((category, product, price))
+    return changes, invalid
+
+
+def apply(store, changes, history=None, user=None):
+    """Write every planned price in one commit (and to history); ConflictError if any product changed since"""
+    updated = store.update_products(
+        (category, product["id"], {**product, "price": price}, product.get("rev", 0))
+        for category, product, price in changes
+    )
+    if history is not None:
+        history.record_many([(product["id"], product.get("source"), catalog_query.price_of(product), price)
+                             for _, product, price in changes], user)
+    return updated
@@ -0,0 +1,309 @@
+"""
+Read-only HTTP/JSON catalog API for partner clinics and scripts
+Run this with: python catalog_api.py [--host 127.0.0.1] [--port 8600]
+
+A standalone process, separate from the Streamlit apps. It loads the
+catalog from the configured store (CLINIC_STORAGE) once and keeps the query
+and statistics indexes in step with it. A background thread checks the
+store every POLL_SECONDS and only the products that changed are re-indexed.
+
+    GET /categories                   every category with counts and price statistics
+    GET /products?category=&source=&genuine=&unit=&min_price=&max_price=
+                 &sort=name|price|date&order=asc|desc&offset=0&limit=100
+    GET /products/{id}                one product
+    GET /compare?category=&min_offers=2
+                                      products offered by several sources, best price per unit
+    GET /compare?category=&model=     every offer of one of them
+
+genuine is true (行貨) or false (水貨); source and unit can be repeated to
+match any of several. Lists are paginated (limit at most MAX_LIMIT).
+
+Encoded responses are cached until the catalog changes, so a repeated
+request costs a dictionary lookup. Every response has a strong ETag
+(If-None-Match answers 304) and is gzipped when the client accepts it; the
+gzipped body has an ETag of its own.
+User accounts are never part of the catalog and never served.
+"""
+
+import argparse
+import gzip
+import hashlib
+import http.server
+import json
+import threading
+import time
+from urllib.parse import parse_qsl, urlsplit
+
+import catalog_compare
+import catalog_query
+import catalog_stats
+import migrations
+import storage
+
+DATA_FILE = "clinic_data.json"
+POLL_SECONDS = 1.0
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+RESPONSE_CACHE = 4096  # encoded responses kept per catalog version
+GZIP_MIN_BYTES = 512
+MAX_AGE = 5  # seconds clients may reuse a response without revalidating
+PRICE_PARAMS = {"min_price": "price_min", "max_price": "price_max"}
+
+
+class BadRequest(Exception):
+    pass
+
+
+class Response:
+    """An encoded JSON body with its ETags; the gzip version is made on first use
+
+    The gzip body is a different representation, so it has its own ETag (ending in -gz).
+    """
+
+    def __init__(self, status, payload):
+        self.status = status
+        self.body = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        digest = hashlib.sha1(self.body).hexdigest()[:20]
+        self.etag = '"%s"' % digest
+        self.gzip_etag = '"%s-gz"' % digest
+        self._gzipped = None
+
+    def gzipped(self):
+        if self._gzipped is None:
+            self._gzipped = gzip.compress(self.body, compresslevel=6, mtime=0)
+        return self._gzipped
+
+
+def etag_matches(header, etag):
+    """Whether an If-None-Match header names etag: "*", or one of its tags (W/ weak tags compare equal)"""
+    for tag in (header or "").split(","):
+        tag = tag.strip()
+        if tag == "*" or (tag[2:] if tag.startswith("W/") else tag) == etag:
+            return True
+    return False
+
+
+def _flag(value):
+    lowered = value.strip().lower()
+    if lowered in ("true", "1", "yes", "行貨"):
+        return True
+    if lowered in ("false", "0", "no", "水貨"):
+        return False
+    raise BadRequest(f"genuine must be true or false, not {value!r}")
+
+
+def _number(name, value, kind=float, minimum=0):
+    try:
+        number = kind(value)
+    except ValueError:
+        raise BadRequest(f"{name} must be a number, not {value!r}") from None
+    if number < minimum:
+        raise BadRequest(f"{name} must be at least {minimum}")
+    return number
+
+
+class CatalogService:
+    """The served catalog: indexes that follow the store, and the responses encoded for it"""
+
+    def __init__(self, store, poll=POLL_SECONDS):
+        self.store = store
+        self.poll = poll
+        self.query_index = catalog_query.QueryIndex()
+        self.stats = catalog_stats.StatsIndex()
+        self.compare = catalog_compare.CompareIndex()
+        self.version = 0
+        self._loaded = None
+        self._lock = threading.Lock()
+        self._responses = {}
+        self.refresh()
+
+    def refresh(self):
+        """Re-index if the store has a new catalog; returns whether it had"""
+        loaded = self.store.load()
+        if loaded is self._loaded:
+            return False
+        # Read-only process: an older schema is upgraded in memory, never written back
+        data = migrations.upgraded(loaded)
+        with self._lock:
+            self.query_index.sync(data)
+            self.stats.sync(data)
+            self.compare.sync(data)
+            self._loaded = loaded
+            self._responses = {}
+            self.version += 1
+        return True
+
+    def watch(self):
+        """Poll the store in a daemon thread"""
+        def loop():
+            while True:
+                time.sleep(self.poll)
+                try:
+                    self.refresh()
+                except Exception as e:  # a half-written file or a locked database; try again next poll
+                    print(f"⚠️ Could not reload the catalog: {e}")
+        threading.Thread(target=loop, name="catalog-api-watch", daemon=True).start()
+
+    # --- Requests ---
+    def respond(self, path, query):
+        """The Response for a GET of path?query, from the cache when this catalog version has made it"""
+        key = (path, query)
+        response = self._responses.get(key)
+        if response is None:
+            with self._lock:
+                try:
+                    response = self._build(path, query)
+                except Exception as e:  # answer, and leave it out of the cache
+                    return Response(500, {"error": str(e)})
+                if len(self._responses) >= RESPONSE_CACHE:
+                    self._responses.clear()
+                self._responses[key] = response
+        return response
+
+    def _build(self, path, query):
+        parts = [part for part in path.split("/") if part]
+        try:
+            if parts == ["categories"]:
+                return Response(200, self.categories())
+            if parts == ["products"]:
+                return Response(200, self.products(parse_qsl(query)))
+            if len(parts) == 2 and parts[0] == "products":
+                found = self.query_index.record(parts[1])
+                if found is None:
+                    return Response(404, {"error": f"no product {parts[1]}"})
+                return Response(200, {**found[1], "category": found[0]})
+            if parts == ["compare"]:
+                return Response(200, self.comparison(parse_qsl(query)))
+        except BadRequest as e:
+            return Response(400, {"error": str(e)})
+        return Response(404, {"error": "not found", "paths": ["/categories", "/products", "/products/{id}",
+                                                           "/compare"]})
+
+    def categories(self):
+        return {"categories": [{"name": name, **{k: v for k, v in summary.items() if k != "cheapest"}}
+                               for name, summary in self.stats.table("category")]}
+
+    def products(self, params):
+        filters = {"sources": [], "units": []}
+        offset, limit = 0, DEFAULT_LIMIT
+        sort, descending = "name", False
+        for name, value in params:
+            if name == "category":
+                filters["category"] = value
+            elif name == "source":
+                filters["sources"].append(value)
+            elif name == "unit":
+                filters["units"].append(value)
+            elif name == "genuine":
+                filters["genuine"] = _flag(value)
+            elif name in PRICE_PARAMS:
+                filters[PRICE_PARAMS[name]] = _number(name, value)
+            elif name == "sort":
+                if value not in catalog_query.SORTS:
+                    raise BadRequest(f"sort must be one of {', '.join(catalog_query.SORTS)}")
+                sort = value
+            elif name == "order":
+                if value not in ("asc", "desc"):
+                    raise BadRequest("order must be asc or desc")
+                descending = value == "desc"
+            elif name == "offset":
+                offset = _number(name, value, int)
+            elif name == "limit":
+                limit = min(_number(name, value, int, 1), MAX_LIMIT)
+            else:
+                raise BadRequest(f"unknown parameter {name!r}")
+        total, page = self.query_index.query(sort=sort, descending=descending, offset=offset, limit=limit,
+                                             **filters)
+        return {"total": total, "offset": offset, "limit": limit,
+                "products": [{**product, "category": category} for category, product in page]}
+
+    def comparison(self, params):
+        category, model, min_offers = None, None, 2
+        for name, value in params:
+            if name == "category":
+                category = value
+            elif name == "model":
+                model = value
+            elif name == "min_offers":
+                min_offers = _number(name, value, int, 1)
+            else:
+                raise BadRequest(f"unknown parameter {name!r}")
+        if category is None:
+            raise BadRequest("category is required")
+        if model is not None:
+            offers = self.compare.offers(category, model)
+            return {"category": category, "model": model,
+                    "offers": [{**offer, "basis": catalog_compare.basis_label(offer["basis"])} for offer in offers]}
+        groups = self.compare.groups(category, min_offers)
+        return {"category": category, "products": [
+            {"model": group["model"], "label": group["label"], "products": group["products"],
+             "offers": group["offers"], "basis": catalog_compare.basis_label(group["basis"]),
+             "best": {**group["best"], "basis": catalog_compare.basis_label(group["best"]["basis"])}}
+            for group in groups]}
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, so a client reuses one connection
+    # Headers and body go out as two writes; with Nagle on, the body waits for a delayed ACK (~40ms)
+    disable_nagle_algorithm = True
+    server_version = "ClinicCatalogAPI"
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        response = self.server.service.respond(url.path.rstrip("/") or "/", url.query)
+        gzipped = len(response.body) >= GZIP_MIN_BYTES and "gzip" in self.headers.get("Accept-Encoding", "")
+        etag = response.gzip_etag if gzipped else response.etag
+        if response.status == 200 and etag_matches(self.headers.get("If-None-Match"), etag):
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Vary", "Accept-Encoding")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        body = response.gzipped() if gzipped else response.body
+        self.send_response(response.status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", etag)
+        self.send_header("Cache-Control", f"public, max-age={MAX_AGE}")
+        self.send_header("Vary", "Accept-Encoding")
+        if gzipped:
+            self.send_header("Content-Encoding", "gzip")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class CatalogServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, service, verbose=False):
+        super().__init__(address, Handler)
+        self.service = service
+        self.verbose = verbose
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Read-only HTTP/JSON catalog API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8600)
+    parser.add_argument("--data", default=DATA_FILE, help="catalog file (the sqlite backend uses CLINIC_DB_FILE)")
+    parser.add_argument("--verbose", action="store_true", help="log every request")
+    args = parser.parse_args()
+
+    service = CatalogService(storage.get_store(args.data))
+    service.watch()
+    server = CatalogServer((args.host, args.port), service, args.verbose)
+    print(f"✅ Serving {len(service.query_index)} products on http://{args.host}:{server.server_address[1]}/",
+          flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+"""
+Process-wide catalog cache shared by every Streamlit session.
+
+Streamlit re-executes the app script on every interaction, but imported
+modules live for the whole server process. Keeping the parsed catalog here
+means clinic_data.json is only parsed again when the file itself changes
+(inode, mtime or size), no matter how many sessions are open.
+
+Sessions get a read-only view of the cached data so that one session cannot
+mutate what another session is rendering. Use thaw() to get a private,
+mutable copy before changing anything.
+"""
+
+import json
+import os
+import tempfile
+import threading
+
+
+# --- Read-only containers ---
+class FrozenDict(dict):
+    """Read-only dict that still passes isinstance(..., dict) and json.dump"""
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("catalog data is read-only, use thaw() to get a mutable copy")
+
+    __setitem__ = __delitem__ = __ior__ = _readonly
+    clear = pop = popitem = setdefault = update = _readonly
+
+    def __deepcopy__(self, memo):
+        return thaw(self)
+
+
+class FrozenList(list):
+    """Read-only list that still passes isinstance(..., list) and json.dump"""
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("catalog data is read-only, use thaw() to get a mutable copy")
+
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = _readonly
+    append = extend = insert = remove = pop = clear = sort = reverse = _readonly
+
+    def __deepcopy__(self, memo):
+        return thaw(self)
+
+
+def freeze(obj):
+    """Return a deeply read-only version of obj"""
+    if isinstance(obj, (FrozenDict, FrozenList)):
+        return obj
+    if isinstance(obj, dict):
+        return FrozenDict((key, freeze(value)) for key, value in obj.items())
+    if isinstance(obj, list):
+        return FrozenList(freeze(value) for value in obj)
+    return obj
+
+
+def thaw(obj):
+    """Return a deep, mutable copy of obj made of plain dicts and lists"""
+    if isinstance(obj, dict):
+        return {key: thaw(value) for key, value in obj.items()}
+    if isinstance(obj, list):
+        return [thaw(value) for value in obj]
+    return obj
+
+
+# --- Cache ---
+def file_key(path):
+    """Identity of the file's current contents, or None if it does not exist"""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+class CatalogCache:
+    """Holds one frozen catalog and the key of the source it was read from"""
+
+    def __init__(self, name):
+        self.name = name
+        self._lock = threading.Lock()
+        self._key = None
+        self._data = None
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, loader):
+        """Return the cached catalog for key, calling loader() on a miss"""
+        # Loading under the lock means a burst of sessions waiting on a
+        # changed file triggers one parse instead of one parse per session.
+        with self._lock:
+            if self._data is not None and key == self._key:
+                self.hits += 1
+                return self._data
+            self.misses += 1
+            self._data = freeze(loader())
+            self._key = key
+            return self._data
+
+    def put(self, key, data):
+        """Replace the cached catalog after a write"""
+        with self._lock:
+            self._data = freeze(data)
+            self._key = key
+            return self._data
+
+    def peek(self, key=None):
+        """Return the cached catalog (only if it is at key, when given) without counting a hit"""
+        with self._lock:
+            if key is not None and key != self._key:
+                return None
+            return self._data
+
+    def invalidate(self):
+        with self._lock:
+            self._data = None
+            self._key = None
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "key": self._key}
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def cache_for(name):
+    """Return the process-wide cache registered under name"""
+    name = os.path.abspath(name)
+    with _caches_lock:
+        if name not in _caches:
+            _caches[name] = CatalogCache(name)
+        return _caches[name]
+
+
+def stats():
+    """Hit/miss counters for every cache in this process"""
+    with _caches_lock:
+        caches = list(_caches.values())
+    return {cache.name: cache.stats() for cache in caches}
+
+
+# --- JSON file helpers ---
+def read_json(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def load_json(path):
+    """Return the frozen catalog in path, or None if the file does not exist"""
+    key = file_key(path)
+    if key is None:
+        return None
+    return cache_for(path).get(key, lambda: read_json(path))
+
+
+def write_json_atomic(path, data):
+    """Write data to path so readers see either the old or the new file, never half of one
+
+    Each write has its own temporary file, so concurrent writers never share one.
+    """
+    directory, name = os.path.split(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=f"{name}.", suffix=".tmp", dir=directory)
+    try:
+        with open(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def save_json(path, data):
+    """Write data to path and make it the cached catalog for that file"""
+    write_json_atomic(path, data)
+    return cache_for(path).put(file_key(path), data)
@@ -0,0 +1,227 @@
+"""
+Best prices for the same product across sources, on a common per-unit basis.
+
+Products are grouped as the same product when they are in the same category
+and their names match once pack sizes are taken out and the remaining words
+are compared as catalog_dupes.loose_text() does: "Juvederm Volift 1ml",
+"JUVEDERM VOLIFT 2 x 1ml" and "Volift Juvederm 2ml" are one product.
+
+Prices are converted to a per-unit price when the name says how much is in
+the pack: per ml ("1ml", "2 x 1ml"), per U for toxins ("100U"), or per
+piece for boxes with a count ("x5", "10 vials", "10支"). A price "per ml"
+already is one. Anything else is compared only with offers listed in the
+same unit.
+
+    compare = catalog_compare.shared_index().sync(data)
+    compare.groups("填充")              # products offered more than once, with the best price of each
+    compare.offers("填充", model)       # the cheapest offer per source and 行貨/水貨
+
+Like the other indexes it follows the catalog product by product. A write
+marks only the products' groups stale, and a group's best offers are worked
+out again the next time it is read.
+"""
+
+import re
+from functools import lru_cache
+
+from catalog_dupes import loose_text
+from catalog_index import IncrementalIndex, shared
+from catalog_query import price_of
+from catalog_search import normalize
+
+NAME_CACHE = 65536
+PER_ML = "per ml"
+PER_BOX = "per 盒"
+PIECE_UNITS = {"per 支", "per vial", "per syringe", "per part", "per bottle", "per ampoule"}
+BASES = {"ml": "per ml", "U": "per U", "piece": "per 支"}  # common bases, best first
+
+_VOLUME_RE = re.compile(r"(\d+(?:\.\d+)?)\s*ml\b", re.IGNORECASE)
+_TOXIN_RE = re.compile(r"(\d+(?:\.\d+)?)\s*u\b", re.IGNORECASE)
+# Numbers are delimited with (?<![\d.]) rather than \b: CJK characters are word characters, so "肉毒10支" has no \b
+_COUNT_RES = (
+    re.compile(r"(?<![\d.])(\d+)\s*[x×*](?=\s*\d)", re.IGNORECASE),  # 2 x 1ml
+    re.compile(r"(?<![a-z])[x×*]\s*(\d+)\b", re.IGNORECASE),         # x5, 水光x5
+    re.compile(r"(?<![\d.])(\d+)\s*(?:支|pcs\b|pieces?\b|vials?\b|syringes?\b|amps?\b|ampoules?\b)",
+               re.IGNORECASE),
+)
+
+
+@lru_cache(maxsize=NAME_CACHE)
+def parse_name(name):
+    """(model, label, ml per piece, U per piece, pieces) of a product name; sizes are None when not given"""
+    text = normalize(name).strip() if name else ""
+    label = " ".join(str(name or "").split())
+    sizes = {}
+    # The count first, so "2 x 1ml" still has its "1" when "2 x" is looked for
+    for pattern in _COUNT_RES:
+        match = pattern.search(text)
+        if match:
+            sizes["pieces"] = int(match.group(1)) or None
+            text = text[:match.start()] + " " + text[match.end():]
+            break
+    for field, pattern in (("ml", _VOLUME_RE), ("U", _TOXIN_RE)):
+        match = pattern.search(text)
+        if match:
+            sizes[field] = float(match.group(1)) or None
+            text = text[:match.start()] + " " + text[match.end():]
+    if sizes:
+        # The label keeps the original spelling, without the pack size
+        rest = set(loose_text(text).split())
+        label = " ".join(word for word in label.split() if set(loose_text(word).split()) <= rest) or label
+    return loose_text(text), label, sizes.get("ml"), sizes.get("U"), sizes.get("pieces")
+
+
+def unit_price(product):
+    """(basis, price per unit of it) of a product: a BASES key, or the listed unit when it cannot be converted"""
+    price = price_of(product)
+    unit = (product.get("unit") or "").strip()
+    if unit == PER_ML:
+        return "ml", price
+    _, _, ml, toxin_units, pieces = parse_name(product.get("name"))
+    if unit == PER_BOX:
+        if pieces is None:
+            return unit, price
+    elif unit in PIECE_UNITS:
+        pieces = 1
+    else:
+        return unit, price
+    if ml:
+        return "ml", price / (pieces * ml)
+    if toxin_units:
+        return "U", price / (pieces * toxin_units)
+    return "piece", price / pieces
+
+
+def basis_label(basis):
+    return BASES.get(basis, basis)
+
+
+class CompareIndex(IncrementalIndex):
+    """Products grouped by (category, model), with each group's best offers worked out when read"""
+
+    def __init__(self):
+        super().__init__()
+        self._entries = {}      # id -> (group, label, basis, unit price)
+        self._groups = {}       # (category, model) -> {id: (label, basis, unit price)}
+        self._by_category = {}  # category -> set of models
+        self._best = {}         # group -> summary, for groups not changed since
+        self._tables = {}       # category -> groups() result, for categories not changed since
+
+    # --- Maintenance ---
+    def _add(self, product_id, category, product):
+        model, label, *_ = parse_name(product.get("name"))
+        basis, price = unit_price(product)
+        group = (category, model)
+        self._entries[product_id] = (group, label, basis, price)
+        self._groups.setdefault(group, {})[product_id] = (label, basis, price)
+        self._by_category.setdefault(category, set()).add(model)
+        self._changed(group)
+
+    def _remove(self, product_id, category, product):
+        group = self._entries.pop(product_id)[0]
+        members = self._groups[group]
+        del members[product_id]
+        if not members:
+            del self._groups[group]
+            self._by_category[group[0]].discard(group[1])
+        self._changed(group)
+
+    def _changed(self, group):
+        self._best.pop(group, None)
+        self._tables.pop(group[0], None)
+
+    # --- Reading ---
+    def offers(self, category, model):
+        """The cheapest product per (source, 行貨, basis) of one group, best basis and lowest price first
+
+        Each is {"id", "source", "genuine", "basis", "unit_price", "best"}; best marks the
+        cheapest offer of its basis.
+        """
+        with self.lock:
+            return list(self._summary((category, model))["offer_list"])
+
+    def groups(self, category, min_offers=2):
+        """[{"model", "label", "products", "offers", "basis", "best": offer}, ...] by label
+
+        Only products on offer at least min_offers ways (source and 行貨/水貨) are listed.
+        """
+        with self.lock:
+            rows = self._tables.get(category)
+            if rows is None:
+                rows = self._tables[category] = sorted(
+                    (self._summary((category, model)) for model in self._by_category.get(category, ())),
+                    key=lambda row: (row["label"].casefold(), row["model"]))
+            return [row for row in rows if row["offers"] >= min_offers]
+
+    def _summary(self, group):
+        summary = self._best.get(group)
+        if summary is not None:
+            return summary
+        cheapest = {}  # (source, genuine, basis) -> (unit price, id)
+        labels = []
+        for product_id, (label, basis, price) in self._groups.get(group, {}).items():
+            product = self._records[product_id][1]
+            key = (product.get("source") or "", bool(product.get("is_genuine", True)), basis)
+            if key not in cheapest or (price, product_id) < cheapest[key]:
+                cheapest[key] = (price, product_id)
+            labels.append(label)
+        ranks = {basis: rank for rank, basis in enumerate(BASES)}
+        offers = sorted(
+            ({"id": product_id, "source": source, "genuine": genuine, "basis": basis, "unit_price": price,
+              "best": False} for (source, genuine, basis), (price, product_id) in cheapest.items()),
+            key=lambda offer: (ranks.get(offer["basis"], len(ranks)), offer["basis"], offer["unit_price"],
+                               offer["source"]))
+        seen = set()
+        for offer in offers:
+            if offer["basis"] not in seen:
+                offer["best"] = True
+                seen.add(offer["basis"])
+        # The basis most offers can be compared on, and its cheapest offer
+        counts = {}
+        for offer in offers:
+            counts[offer["basis"]] = counts.get(offer["basis"], 0) + 1
+        basis = max(counts, key=lambda b: (counts[b], -ranks.get(b, len(ranks)))) if counts else None
+        summary = self._best[group] = {
+            "model": group[1],
+            "label": min(labels, key=lambda label: (len(label), label)) if labels else group[1],
+            "products": len(labels),
+            "offers": len({(offer["source"], offer["genuine"]) for offer in offers}),
+            "basis": basis,
+            "best": next((offer for offer in offers if offer["basis"] == basis), None),
+            "offer_list": offers,
+        }
+        return summary
+
+
+def group_rows(groups):
+    """Dataframe rows for the output of CompareIndex.groups()"""
+    return [{
+        "Product": group["label"],
+        "Offers": group["offers"],
+        "Best price ($)": round(group["best"]["unit_price"], 2),
+        "Per": basis_label(group["basis"]),
+        "Source": group["best"]["source"],
+        "Type": "行" if group["best"]["genuine"] else "水",
+    } for group in groups]
+
+
+def offer_rows(index, offers):
+    """Dataframe rows for the output of CompareIndex.offers(), with the listed price of each"""
+    rows = []
+    for offer in offers:
+        found = index.record(offer["id"])
+        product = found[1] if found else {}
+        rows.append({
+            "": "🏆" if offer["best"] else "",
+            "Source": offer["source"],
+            "Type": "行" if offer["genuine"] else "水",
+            "Price ($)": round(offer["unit_price"], 2),
+            "Per": basis_label(offer["basis"]),
+            "Listed as": f"{product.get('name', '')} · ${price_of(product):,.2f} {product.get('unit', '')}",
+        })
+    return rows
+
+
+def shared_index():
+    """The process-wide comparison index; call .sync(data) before reading"""
+    return shared(CompareIndex)
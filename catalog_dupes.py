@@ -0,0 +1,204 @@
+"""
+Duplicate and near-duplicate products.
+
+Two products are duplicates when they have the same category, name, source
+and type (行貨/水貨) once the text is normalized: NFKC (full-width letters,
+digits and spaces become their ASCII forms), case-folded, and with runs of
+whitespace collapsed. The index keeps every product under that key, so
+checking a new or edited product is one dictionary lookup.
+
+Near-duplicates are looser: names and sources are compared as the sorted
+set of their words and numbers, so "Juvederm Ultra 1ml", "JUVEDERM ULTRA
+1 ml" and "Ultra Juvederm (1ml)" are the same product. Each product is
+filed under that key too, so the whole catalog is grouped in one pass and
+merge_report() only walks the groups that have more than one product.
+
+    dupes = catalog_dupes.shared_index().sync(data)
+    dupes.find("填充", {"name": "voluma ", "source": "SINOPHARM", "is_genuine": False})  # id or None
+    catalog_dupes.merge_report(dupes)  # rows: which product to keep, which to merge into it
+
+    python catalog_dupes.py [clinic_data.json] [--csv report.csv]
+"""
+
+import argparse
+import csv
+import io
+import re
+import sys
+from functools import lru_cache
+
+from catalog_index import IncrementalIndex, shared
+from catalog_query import price_of
+from catalog_search import normalize
+
+SOURCE_CACHE = 4096
+_LOOSE_RE = re.compile(r"[^\W\d_]+|\d+(?:\.\d+)?")
+
+
+def normalize_text(text):
+    """NFKC, case-folded, with whitespace collapsed to single spaces"""
+    return " ".join(normalize(text).split())
+
+
+def _loose(normalized):
+    tokens = []
+    for token in _LOOSE_RE.findall(normalized):
+        if token[0].isdigit():
+            token = format(float(token), "g")
+        tokens.append(token)
+    return " ".join(sorted(tokens))
+
+
+def loose_text(text):
+    """The words and numbers of text, sorted: "1ml" and "1.0 ML" both give 1 ml"""
+    return _loose(normalize(text))
+
+
+@lru_cache(maxsize=SOURCE_CACHE)
+def _source_texts(source):
+    """(normalize_text, loose_text) of a source; there are few sources and each is on many products"""
+    normalized = normalize(source)
+    return " ".join(normalized.split()), _loose(normalized)
+
+
+def product_key(category, product):
+    """What makes two products the same: (category, name, source, 行貨)"""
+    return (category, normalize_text(product.get("name")), _source_texts(product.get("source") or "")[0],
+            bool(product.get("is_genuine", True)))
+
+
+def near_key(category, product):
+    """product_key with names and sources reduced to loose_text()"""
+    return (category, loose_text(product.get("name")), _source_texts(product.get("source") or "")[1],
+            bool(product.get("is_genuine", True)))
+
+
+def _both_keys(category, product):
+    """(product_key, near_key), normalizing the name once"""
+    name = normalize(product.get("name"))
+    source, loose_source = _source_texts(product.get("source") or "")
+    genuine = bool(product.get("is_genuine", True))
+    return (category, " ".join(name.split()), source, genuine), (category, _loose(name), loose_source, genuine)
+
+
+class DuplicateIndex(IncrementalIndex):
+    """Product ids by product_key() and by near_key()"""
+
+    def __init__(self):
+        super().__init__()
+        self._exact = {}   # product key -> set of ids
+        self._near = {}    # near key -> set of ids
+        self._keys = {}    # id -> (product key, near key) it was filed under
+        self._crowded = set()  # near keys with more than one id
+
+    # --- Maintenance ---
+    def _add(self, product_id, category, product):
+        exact, near = self._keys[product_id] = _both_keys(category, product)
+        self._exact.setdefault(exact, set()).add(product_id)
+        ids = self._near.setdefault(near, set())
+        ids.add(product_id)
+        if len(ids) == 2:
+            self._crowded.add(near)
+
+    def _remove(self, product_id, category, product):
+        exact, near = self._keys.pop(product_id)
+        ids = self._exact[exact]
+        ids.discard(product_id)
+        if not ids:
+            del self._exact[exact]
+        ids = self._near[near]
+        ids.discard(product_id)
+        if len(ids) < 2:
+            self._crowded.discard(near)
+        if not ids:
+            del self._near[near]
+
+    # --- Reading ---
+    def find(self, category, product, exclude=None):
+        """Id of a product that product (a record, id or not) would duplicate in category, or None
+
+        exclude is the id of the product being edited, which does not count.
+        """
+        with self.lock:
+            for product_id in self._exact.get(product_key(category, product), ()):
+                if product_id != exclude:
+                    return product_id
+        return None
+
+    def groups(self):
+        """Lists of ids of near-duplicate products, two or more per group"""
+        with self.lock:
+            return [sorted(self._near[key]) for key in self._crowded]
+
+
+def merge_report(index):
+    """Dataframe rows for every near-duplicate group, the product to keep (the oldest) first"""
+    groups = []
+    with index.lock:
+        for ids in index.groups():
+            records = sorted((index.record(product_id) for product_id in ids),
+                             key=lambda found: (found[1].get("date_added") or "", found[1].get("id")))
+            groups.append(records)
+    groups.sort(key=lambda records: (records[0][0], normalize_text(records[0][1].get("name"))))
+    rows = []
+    for number, records in enumerate(groups, start=1):
+        keep = product_key(*records[0])
+        for position, (category, product) in enumerate(records):
+            rows.append({
+                "Group": number,
+                "Action": "keep" if position == 0 else "merge",
+                "Match": "" if position == 0 else "exact" if product_key(category, product) == keep else "near",
+                "Category": category,
+                "Product": product.get("name", ""),
+                "Source": product.get("source", ""),
+                "Type": "行" if product.get("is_genuine", True) else "水",
+                "Price": price_of(product),
+                "Unit": product.get("unit", ""),
+                "Added": product.get("date_added", ""),
+                "ID": product.get("id"),
+            })
+    return rows
+
+
+def report_csv(rows):
+    """merge_report() rows as CSV text (with a BOM, so Excel reads the Chinese text)"""
+    out = io.StringIO()
+    out.write("\ufeff")
+    if rows:
+        writer = csv.DictWriter(out, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+    return out.getvalue()
+
+
+def shared_index():
+    """The process-wide duplicate index; call .sync(data) before reading"""
+    return shared(DuplicateIndex)
+
+
+if __name__ == "__main__":
+    import storage
+
+    parser = argparse.ArgumentParser(description="List duplicate and near-duplicate products")
+    parser.add_argument("data", nargs="?", default="clinic_data.json",
+                        help="catalog file (the sqlite backend uses CLINIC_DB_FILE)")
+    parser.add_argument("--csv", help="also write the merge report to this CSV file")
+    args = parser.parse_args()
+
+    data = storage.get_store(args.data).load()
+    if data is None:
+        print(f"📦 {args.data}: no catalog yet")
+        sys.exit(0)
+    rows = merge_report(DuplicateIndex().sync(data))
+    groups = rows[-1]["Group"] if rows else 0
+    merges = sum(row["Action"] == "merge" for row in rows)
+    print(f"📦 {groups} group{'s' if groups != 1 else ''} of duplicates, {merges} product{'s' if merges != 1 else ''} "
+          "to merge")
+    for row in rows:
+        marker = "  keep " if row["Action"] == "keep" else f"  {row['Match']:<5}"
+        print(f"{row['Group']:>4}{marker} {row['Category']} · {row['Product']} · {row['Source']} · {row['Type']} · "
+              f"${row['Price']:,.2f} {row['Unit']} · {row['Added']} · {row['ID']}")
+    if args.csv and rows:
+        with open(args.csv, "w", newline="", encoding="utf-8") as f:
+            f.write(report_csv(rows))
+        print(f"✅ Merge report written to {args.csv}")
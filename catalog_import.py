@@ -0,0 +1,267 @@
+"""
+Bulk import of supplier price lists (CSV or Excel) into the catalog.
+
+Files are streamed row by row: CSV through the csv module, .xlsx through
+openpyxl's read-only mode (optional, pip install openpyxl). Every row is
+checked with the admin form's rules (a name, a price above 0, one of UNITS)
+plus a source and a type the app understands, and rows that repeat an
+existing product (or an earlier row) are rejected as duplicates: same
+category, name, source and type, compared as catalog_dupes does.
+
+Checking runs as an ImportJob on a small shared thread pool, so the admin
+page only polls job.progress() while a large file is read. Accepted rows
+are spooled to a temporary file, and only PREVIEW_ROWS of them and the
+first MAX_REPORTED_ERRORS problems are kept in memory; apart from an 8-byte
+duplicate key per row, memory stays flat whatever the file size. Existing
+products are looked up in the shared catalog_dupes index.
+job.commit(store) then writes every accepted row, and any new sources, with
+one store.add_products() call: one commit. Rows are checked against the
+catalog again at that point, and those added by someone else in the
+meantime are skipped and listed in job.skipped.
+"""
+
+import csv
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import catalog_dupes
+import storage
+
+UNITS = ["per 支", "per 盒", "per part", "per ml", "per vial"]
+IMPORT_WORKERS = 2
+PREVIEW_ROWS = 20
+MAX_REPORTED_ERRORS = 200
+
+# Accepted column headers (compared case-insensitively) -> product field
+COLUMNS = {
+    "name": "name", "product": "name", "product name": "name", "產品": "name", "產品名稱": "name",
+    "source": "source", "supplier": "source", "來源": "source", "供應商": "source",
+    "price": "price", "price ($)": "price", "價格": "price",
+    "unit": "unit", "單位": "unit",
+    "type": "type", "is_genuine": "type", "genuine": "type", "類型": "type",
+    "category": "category", "類別": "category",
+}
+GENUINE = {"行", "行貨", "genuine", "true", "yes", "y", "1"}
+PARALLEL = {"水", "水貨", "parallel", "false", "no", "n", "0"}
+
+_executor = ThreadPoolExecutor(max_workers=IMPORT_WORKERS, thread_name_prefix="catalog-import")
+
+
+# --- Reading ---
+def map_header(header):
+    """Product field for each column (None for columns we ignore)"""
+    fields = [COLUMNS.get(str(cell or "").strip().lower()) for cell in header]
+    missing = [field for field in ("name", "price") if field not in fields]
+    if missing:
+        raise ValueError(f"Missing column(s): {', '.join(missing)}. "
+                         f"Expected a header row with at least name and price.")
+    return fields
+
+
+def _rows(header_and_rows):
+    """Yield (line number, {field: text}) for the data rows after the header"""
+    rows = iter(header_and_rows)
+    header = next(rows, None)
+    if header is None:
+        return
+    fields = map_header(header)
+    for line, row in enumerate(rows, start=2):
+        if not any(cell not in (None, "") for cell in row):
+            continue
+        yield line, {field: cell for field, cell in zip(fields, row) if field and cell is not None}
+
+
+def read_csv(path):
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        yield from _rows(csv.reader(f))
+
+
+def read_xlsx(path):
+    try:
+        import openpyxl
+    except ImportError:
+        raise ValueError("Reading .xlsx files needs openpyxl: pip install openpyxl")
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        yield from _rows(workbook.active.iter_rows(values_only=True))
+    finally:
+        workbook.close()
+
+
+def read_rows(path, filename):
+    extension = os.path.splitext(filename)[1].lower()
+    if extension == ".csv":
+        return read_csv(path)
+    if extension in (".xlsx", ".xlsm"):
+        return read_xlsx(path)
+    raise ValueError(f"Unsupported file type {extension or filename!r}, use .csv or .xlsx")
+
+
+# --- Checking ---
+def parse_price(value):
+    if isinstance(value, (int, float)):
+        return float(value)
+    return float(str(value).replace(",", "").replace("$", "").strip())
+
+
+def validate_row(fields, category, categories, default_source=None):
+    """Return (category, product, errors) for one row"""
+    errors = []
+    name = str(fields.get("name", "")).strip()
+    if not name:
+        errors.append("Product name is empty")
+
+    price = None
+    try:
+        price = parse_price(fields.get("price", ""))
+    except ValueError:
+        errors.append(f"Price {fields.get('price')!r} is not a number")
+    else:
+        if price <= 0:
+            errors.append("Price must be greater than 0")
+
+    unit = str(fields.get("unit", "")).strip() or UNITS[0]
+    if unit not in UNITS and f"per {unit}" in UNITS:
+        unit = f"per {unit}"
+    if unit not in UNITS:
+        errors.append(f"Unknown unit {unit!r} (use one of {', '.join(UNITS)})")
+
+    source = str(fields.get("source", "")).strip() or (default_source or "")
+    if not source:
+        errors.append("Source is empty")
+
+    product_type = str(fields.get("type", "")).strip().lower()
+    is_genuine = True
+    if product_type in PARALLEL:
+        is_genuine = False
+    elif product_type and product_type not in GENUINE:
+        errors.append(f"Type {fields.get('type')!r} is neither 行貨 nor 水貨")
+
+    row_category = str(fields.get("category", "")).strip() or category
+    if row_category not in categories:
+        errors.append(f"Unknown category {row_category!r}")
+
+    product = {"name": name, "source": source, "is_genuine": is_genuine, "price": price, "unit": unit}
+    return row_category, product, errors
+
+
+def duplicate_key(category, product):
+    """Small fixed-size form of catalog_dupes.product_key(), for the rows of one file"""
+    text = "\x00".join(str(part) for part in catalog_dupes.product_key(category, product))
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest()
+
+
+class ImportJob:
+    """Checks one uploaded file in the background and commits the accepted rows"""
+
+    def __init__(self, path, filename, category, catalog, categories, default_source=None):
+        self.path = path
+        self.filename = filename
+        self.category = category
+        self.categories = set(categories) | set(catalog.get("products", {}))
+        self.default_source = default_source
+        self.known_sources = list(catalog.get("sources", []))
+        self.rows = 0
+        self.accepted = 0
+        self.rejected = 0
+        self.errors = []    # first MAX_REPORTED_ERRORS {"Row", "Product", "Problem"}
+        self.preview = []   # first PREVIEW_ROWS accepted (category, product)
+        self.new_sources = []
+        self.skipped = []   # {"Row", "Product", "Problem"} of rows commit() found already in the catalog
+        self.failed = None
+        self.done = False
+        self.committed = False
+        self._spool = tempfile.TemporaryFile("w+", encoding="utf-8")
+        self._lock = threading.Lock()
+        self._existing = catalog_dupes.shared_index().sync(catalog)
+        self._future = _executor.submit(self._run)
+
+    def _run(self):
+        seen = {}  # duplicate key -> first line with it
+        try:
+            for line, fields in read_rows(self.path, self.filename):
+                category, product, errors = validate_row(fields, self.category, self.categories, self.default_source)
+                if not errors:
+                    key = duplicate_key(category, product)
+                    if self._existing.find(category, product) is not None:
+                        errors.append(f"Already in {category}")
+                    elif key in seen:
+                        errors.append(f"Duplicate of row {seen[key]}")
+                    else:
+                        seen[key] = line
+                with self._lock:
+                    self.rows += 1
+                    if errors:
+                        self.rejected += 1
+                        if len(self.errors) < MAX_REPORTED_ERRORS:
+                            self.errors.append({"Row": line, "Product": product["name"], "Problem": "; ".join(errors)})
+                        continue
+                    self.accepted += 1
+                    if len(self.preview) < PREVIEW_ROWS:
+                        self.preview.append((category, product))
+                    if product["source"] not in self.known_sources and product["source"] not in self.new_sources:
+                        self.new_sources.append(product["source"])
+                self._spool.write(json.dumps([line, category, product], ensure_ascii=False) + "\n")
+        except Exception as e:
+            self.failed = str(e)
+        finally:
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+            self.done = True
+
+    def progress(self):
+        with self._lock:
+            return {"rows": self.rows, "accepted": self.accepted, "rejected": self.rejected, "done": self.done}
+
+    def commit(self, store):
+        """Write every accepted row (and new sources) in one commit; returns the added records
+
+        The catalog may have changed since the file was checked, so each row is looked up again
+        and those that are now duplicates go to self.skipped instead.
+        """
+        if not self.done or self.failed or self.committed:
+            raise RuntimeError("Import is not ready to commit")
+        current = store.load()
+        current_sources = set((current or {}).get("sources", []))
+        existing = catalog_dupes.shared_index().sync(current)
+        date_added = datetime.now().strftime("%Y-%m-%d %H:%M")
+        self._spool.seek(0)
+        items = []
+        keys = set()
+        self.skipped = []
+        for entry in self._spool:
+            line, category, product = json.loads(entry)
+            key = duplicate_key(category, product)
+            if existing.find(category, product) is not None or key in keys:
+                self.skipped.append({"Row": line, "Product": product["name"], "Problem": f"Already in {category}"})
+                continue
+            keys.add(key)
+            items.append((category, {"id": storage.new_product_id(), **product, "date_added": date_added}))
+        added = store.add_products(items, sources=[s for s in self.new_sources if s not in current_sources])
+        self.committed = True
+        self.close()
+        return added
+
+    def close(self):
+        self._spool.close()
+
+
+def start_import(uploaded_file, category, catalog, categories, default_source=None):
+    """Copy an uploaded file to disk and start checking it; returns the ImportJob"""
+    extension = os.path.splitext(uploaded_file.name)[1]
+    fd, path = tempfile.mkstemp(prefix="clinic_import_", suffix=extension)
+    with os.fdopen(fd, "wb") as f:
+        uploaded_file.seek(0)
+        while True:
+            chunk = uploaded_file.read(1 << 20)
+            if not chunk:
+                break
+            f.write(chunk)
+    return ImportJob(path, uploaded_file.name, category, catalog, categories, default_source)
@@ -0,0 +1,248 @@
+"""
+Base class for in-memory indexes derived from the catalog.
+
+A derived index (search, filters, statistics, ...) is built once and then
+follows new catalog versions by applying only the products that were added,
+changed or removed. Catalogs patched in-process by the store share every
+untouched category list and record object with the previous version, so
+unchanged categories and products are skipped with an identity check; a
+catalog re-read from disk falls back to comparing records by value, which is
+still far cheaper than re-indexing.
+
+Indexes are process-wide: every Streamlit session reads the same instance.
+"""
+
+import bisect
+import gc
+import heapq
+import threading
+
+BULK_CHANGES = 1000  # above this many changes per sync, indexes rebuild sorted structures once
+RANK_GAP = 1 << 20
+
+
+def iter_products(data):
+    """Yield (category, record) for every product in list-format categories"""
+    for category, products in (data or {}).get("products", {}).items():
+        if isinstance(products, list):
+            for product in products:
+                yield category, product
+
+
+class IncrementalIndex:
+    """Keeps itself in step with the catalog through _add() and _remove()"""
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self._data = None
+        self._lists = {}    # category -> product list object as of the last sync
+        self._records = {}  # id -> (category, record)
+        self.version = 0    # goes up with every sync that changed something
+        self._memo = {}     # key -> result of memo(), for this version
+
+    def _add(self, product_id, category, product):
+        raise NotImplementedError
+
+    def _remove(self, product_id, category, product):
+        raise NotImplementedError
+
+    def sync(self, data):
+        """Bring the index up to date with data; a no-op when data was already seen"""
+        with self.lock:
+            if data is self._data:
+                return self
+            lists = {category: products for category, products in (data or {}).get("products", {}).items()
+                     if isinstance(products, list)}
+            # Only categories whose list object changed can hold changes
+            stale = set()
+            for category, products in self._lists.items():
+                if lists.get(category) is not products:
+                    stale.update(product.get("id") for product in products)
+            current = {}
+            for category, products in lists.items():
+                if self._lists.get(category) is not products:
+                    for product in products:
+                        current[product.get("id")] = (category, product)
+            removed = [(product_id, *self._records[product_id]) for product_id in stale if product_id not in current]
+            added = []
+            for product_id, (category, product) in current.items():
+                old = self._records.get(product_id)
+                if old is not None and (old[1] is product or old == (category, product)):
+                    self._records[product_id] = (category, product)
+                    continue
+                if old is not None:
+                    removed.append((product_id, *old))
+                added.append((product_id, category, product))
+            self._apply(removed, added)
+            if removed or added:
+                self.version += 1
+                self._memo = {}
+            for product_id, *_ in removed:
+                self._records.pop(product_id, None)
+            for product_id, category, product in added:
+                self._records[product_id] = (category, product)
+            self._lists = lists
+            self._data = data
+            return self
+
+    def _apply(self, removed, added):
+        """Remove, then add, (product_id, category, record) entries"""
+        bulk = len(removed) + len(added) > BULK_CHANGES
+        # A bulk build allocates millions of small objects; collecting midway only rescans them
+        collect = bulk and gc.isenabled()
+        if bulk:
+            self._begin_bulk()
+        if collect:
+            gc.disable()
+        try:
+            for entry in removed:
+                self._remove(*entry)
+            for entry in added:
+                self._add(*entry)
+        finally:
+            if bulk:
+                self._end_bulk()
+            if collect:
+                gc.enable()
+
+    def _begin_bulk(self):
+        """Called before a large batch of changes; sorted structures may defer upkeep"""
+
+    def _end_bulk(self):
+        """Called after a large batch of changes"""
+
+    def memo(self, key, compute):
+        """compute(), worked out once per version of the index; for results read on every rerun"""
+        with self.lock:
+            if key not in self._memo:
+                self._memo[key] = compute()
+            return self._memo[key]
+
+    def record(self, product_id):
+        """Return (category, record) for product_id as of the last sync, or None"""
+        return self._records.get(product_id)
+
+    def __len__(self):
+        return len(self._records)
+
+
+class SortedOrder:
+    """Products sorted by a key, each with an integer rank in that order
+
+    Ranks are spaced RANK_GAP apart so an insert can usually take a free rank
+    between its neighbours. Picking the first page of a large id set is then
+    a heap over plain ints instead of comparing key tuples.
+    """
+
+    def __init__(self):
+        self._keys = {}     # id -> sort key (ending with the id, so keys are unique)
+        self._order = []    # every sort key, sorted
+        self.rank = {}      # id -> rank
+        self._by_rank = {}  # rank -> id
+        self._deferred = False
+
+    def __len__(self):
+        return len(self._keys)
+
+    def begin_bulk(self):
+        self._deferred = True
+
+    def end_bulk(self):
+        self._deferred = False
+        self._order = sorted(self._keys.values())
+        self._renumber()
+
+    def add(self, product_id, key):
+        key = (*key, product_id)
+        self._keys[product_id] = key
+        if not self._deferred:
+            position = bisect.bisect_left(self._order, key)
+            self._order.insert(position, key)
+            self._place(product_id, position)
+
+    def remove(self, product_id):
+        key = self._keys.pop(product_id)
+        rank = self.rank.pop(product_id, None)
+        if rank is not None:
+            del self._by_rank[rank]
+        if not self._deferred:
+            del self._order[bisect.bisect_left(self._order, key)]
+
+    def _place(self, product_id, position):
+        """Give the product at _order[position] a rank between its neighbours"""
+        low = self.rank[self._order[position - 1][-1]] if position > 0 else -RANK_GAP
+        high = self.rank[self._order[position + 1][-1]] if position + 1 < len(self._order) else low + 2 * RANK_GAP
+        if high - low < 2:
+            self._renumber()
+            return
+        rank = (low + high) // 2
+        self.rank[product_id] = rank
+        self._by_rank[rank] = product_id
+
+    def _renumber(self):
+        self.rank = {key[-1]: i * RANK_GAP for i, key in enumerate(self._order)}
+        self._by_rank = {rank: product_id for product_id, rank in self.rank.items()}
+
+    # --- Reading ---
+    def first(self, ids, count, reverse=False):
+        """The first count ids of the set ids, in this order"""
+        pick = heapq.nlargest if reverse else heapq.nsmallest
+        return [self._by_rank[rank] for rank in pick(count, map(self.rank.__getitem__, ids))]
+
+    def walk(self, reverse=False, start=None, stop=None):
+        """Yield ids in order, optionally only those with start <= key prefix <= stop"""
+        low = 0 if start is None else bisect.bisect_left(self._order, tuple(start))
+        high = len(self._order) if stop is None else bisect.bisect_right(self._order, (*stop, _MAX))
+        if reverse:
+            for i in range(high - 1, low - 1, -1):
+                yield self._order[i][-1]
+        else:
+            for i in range(low, high):
+                yield self._order[i][-1]
+
+    def contains(self, product_id, start=None, stop=None):
+        """Whether the key of product_id lies in the same range walk() would cover"""
+        key = self._keys[product_id]
+        return (start is None or key >= tuple(start)) and (stop is None or key <= (*stop, _MAX))
+
+    def count_between(self, start=None, stop=None):
+        low = 0 if start is None else bisect.bisect_left(self._order, tuple(start))
+        high = len(self._order) if stop is None else bisect.bisect_right(self._order, (*stop, _MAX))
+        return max(high - low, 0)
+
+
+class _Max:
+    """Sorts after every other value, to close key-prefix ranges"""
+
+    def __lt__(self, other):
+        return False
+
+    def __gt__(self, other):
+        return True
+
+    def __le__(self, other):
+        return isinstance(other, _Max)
+
+    def __ge__(self, other):
+        return True
+
+    def __eq__(self, other):
+        return isinstance(other, _Max)
+
+    __hash__ = object.__hash__
+
+
+_MAX = _Max()
+
+
+_shared = {}
+_shared_lock = threading.Lock()
+
+
+def shared(index_class, *args):
+    """Return the process-wide instance of index_class (one per argument tuple)"""
+    key = (index_class, args)
+    with _shared_lock:
+        if key not in _shared:
+            _shared[key] = index_class(*args)
+        return _shared[key]
@@ -0,0 +1,198 @@
+"""
+Filtered, sorted and paginated views of the catalog.
+
+Every filterable attribute has precomputed posting sets (category, source,
+行貨/水貨, unit) and every sortable attribute a SortedOrder (price, name, date
+added), all kept in step with the catalog incrementally. Price and date
+ranges are slices of their sort order, found by bisection.
+
+A query intersects the posting sets smallest first, then fills the page
+either by walking the sort order (when matches are common, so a page is
+found after a few dozen steps) or by a heap over the ranks of the matches
+(when they are rare). An unfiltered page, or one filtered only by a range of
+the attribute it is sorted by, is a plain slice.
+
+    index = catalog_query.shared_index().sync(data)
+    total, page = index.query(category="填充", price_max=500, sort="price", offset=0, limit=20)
+"""
+
+from itertools import islice
+
+from catalog_index import IncrementalIndex, SortedOrder, shared
+from catalog_search import normalize
+
+POSTINGS = ("category", "source", "genuine", "unit")
+SORTS = ("name", "price", "date")
+WALK_SELECTIVITY = 16  # walk the sort order when at least 1 in this many products match
+RESULT_CACHE_SIZE = 256  # pages; Streamlit reruns repeat the same query on every interaction
+MATCH_CACHE_SIZE = 32  # match sets, which can hold most of the catalog, so fewer of them
+
+
+def price_of(product):
+    try:
+        return float(product.get("price") or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def attributes(category, product):
+    """The posting values of a product, in POSTINGS order"""
+    return (
+        category,
+        product.get("source") or "",
+        bool(product.get("is_genuine", True)),
+        product.get("unit") or "",
+    )
+
+
+def sort_keys(product):
+    """The key of a product in each order, in SORTS order"""
+    name = normalize(product.get("name"))
+    price = price_of(product)
+    return (
+        (name, price),
+        (price, name),
+        (str(product.get("date_added") or ""), name),
+    )
+
+
+class QueryIndex(IncrementalIndex):
+    """Posting sets per attribute value plus one sort order per sortable attribute"""
+
+    def __init__(self):
+        super().__init__()
+        self._postings = {attribute: {} for attribute in POSTINGS}  # attribute -> value -> ids
+        self._orders = {sort: SortedOrder() for sort in SORTS}
+        self._attributes = {}  # id -> posting values it was indexed under
+        self._matches = {}     # query() filters -> _match() result, for the current catalog
+        self._results = {}     # query() arguments -> result, for the current catalog
+
+    # --- Maintenance ---
+    def _add(self, product_id, category, product):
+        values = attributes(category, product)
+        for attribute, value in zip(POSTINGS, values):
+            self._postings[attribute].setdefault(value, set()).add(product_id)
+        for sort, key in zip(SORTS, sort_keys(product)):
+            self._orders[sort].add(product_id, key)
+        self._attributes[product_id] = values
+
+    def _remove(self, product_id, category, product):
+        for attribute, value in zip(POSTINGS, self._attributes.pop(product_id)):
+            ids = self._postings[attribute][value]
+            ids.discard(product_id)
+            if not ids:
+                del self._postings[attribute][value]
+        for order in self._orders.values():
+            order.remove(product_id)
+
+    def _begin_bulk(self):
+        for order in self._orders.values():
+            order.begin_bulk()
+
+    def _end_bulk(self):
+        for order in self._orders.values():
+            order.end_bulk()
+
+    def _apply(self, removed, added):
+        if removed or added:
+            self._matches.clear()
+            self._results.clear()
+        super()._apply(removed, added)
+
+    # --- Queries ---
+    def values(self, attribute, category=None):
+        """Sorted distinct values of a posting attribute (within category, when given)"""
+        with self.lock:
+            postings = self._postings[attribute]
+            if category is None:
+                return sorted(postings)
+            in_category = self._postings["category"].get(category, set())
+            return sorted(value for value, ids in postings.items() if not ids.isdisjoint(in_category))
+
+    def _any_of(self, attribute, values):
+        postings = self._postings[attribute]
+        if len(values) == 1:
+            return postings.get(values[0], set())
+        return set().union(*(postings.get(value, set()) for value in values))
+
+    def query(self, category=None, sources=None, genuine=None, units=None,
+              price_min=None, price_max=None, date_from=None, date_to=None, ids=None,
+              sort="name", descending=False, offset=0, limit=20):
+        """Return (total matches, [(category, record), ...]) for one page
+
+        sources and units match any of the given values; genuine is True for
+        行貨 and False for 水貨; dates are "YYYY-MM-DD" strings (or dates) and
+        date_to is inclusive; ids restricts the query to a set of product ids,
+        such as the matches of a text search.
+        """
+        # ids is usually the frozenset catalog_search.match() keeps per query, so its hash is computed once
+        selection = (category, tuple(sources or ()), genuine, tuple(units or ()), price_min, price_max,
+                     date_from, date_to, None if ids is None else frozenset(ids), sort)
+        with self.lock:
+            key = (selection, descending, offset, limit)
+            if key not in self._results:
+                if selection not in self._matches:
+                    if len(self._matches) >= MATCH_CACHE_SIZE:
+                        self._matches.clear()
+                    self._matches[selection] = self._match(category, sources, genuine, units, price_min,
+                                                           price_max, date_from, date_to, ids, sort)
+                total, matches, start, stop = self._matches[selection]
+                order = self._orders[sort]
+                if matches is None:
+                    page = islice(order.walk(descending, start, stop), offset, offset + limit)
+                elif total * WALK_SELECTIVITY >= len(order):
+                    walk = (product_id for product_id in order.walk(descending, start, stop) if product_id in matches)
+                    page = islice(walk, offset, offset + limit)
+                else:
+                    page = order.first(matches, offset + limit, reverse=descending)[offset:]
+                if len(self._results) >= RESULT_CACHE_SIZE:
+                    self._results.clear()
+                self._results[key] = (total, [self._records[product_id] for product_id in page])
+            return self._results[key]
+
+    def _match(self, category, sources, genuine, units, price_min, price_max, date_from, date_to, ids, sort):
+        """(total, matching ids or None for the whole range, start, stop) of the range walked in the sort order"""
+        constraints = []
+        if category is not None:
+            constraints.append(self._postings["category"].get(category, set()))
+        if sources:
+            constraints.append(self._any_of("source", list(sources)))
+        if genuine is not None:
+            constraints.append(self._postings["genuine"].get(bool(genuine), set()))
+        if units:
+            constraints.append(self._any_of("unit", list(units)))
+        if ids is not None:
+            constraints.append(self._records.keys() & ids)
+
+        ranges = {}
+        if price_min is not None or price_max is not None:
+            ranges["price"] = (None if price_min is None else (float(price_min),),
+                               None if price_max is None else (float(price_max),))
+        if date_from is not None or date_to is not None:
+            ranges["date"] = (None if date_from is None else (str(date_from),),
+                              None if date_to is None else (f"{date_to}\uffff",))
+
+        order = self._orders[sort]
+        start, stop = ranges.get(sort, (None, None))
+        if not constraints and set(ranges) <= {sort}:
+            return order.count_between(start, stop), None, start, stop
+        matches = None
+        if constraints:
+            constraints.sort(key=len)
+            matches = constraints[0].intersection(*constraints[1:]) if len(constraints) > 1 else constraints[0]
+        # Narrowest range first; a range wider than the matches so far is checked per match instead
+        for attribute, (low, high) in sorted(ranges.items(),
+                                             key=lambda item: self._orders[item[0]].count_between(*item[1])):
+            in_range = self._orders[attribute]
+            if matches is None:
+                matches = set(in_range.walk(start=low, stop=high))
+            elif in_range.count_between(low, high) < len(matches):
+                matches = matches.intersection(in_range.walk(start=low, stop=high))
+            else:
+                matches = {product_id for product_id in matches if in_range.contains(product_id, low, high)}
+        return len(matches), matches, start, stop
+
+
+def shared_index():
+    """The process-wide query index; call .sync(data) before querying"""
+    return shared(QueryIndex)
@@ -0,0 +1,182 @@
+"""
+Product search over names and sources, across all categories.
+
+Text is NFKC-normalized and case-folded, so full-width letters and digits
+match their ASCII forms. Latin/digit words are matched by prefix ("volu"
+finds VOLUMA): prefixes up to PREFIX_GRAMS characters are looked up
+directly, longer ones through a sorted vocabulary. Chinese (and other CJK)
+text is indexed as single characters and character bigrams, so any run of
+CJK characters in the query matches where those characters appear together.
+
+Results are ordered by name through a catalog_index.SortedOrder, so picking
+the first page of thousands of matches is a heap over integer ranks.
+
+    index = catalog_search.shared_index().sync(data)
+    total, results = index.search("volu", limit=50)
+"""
+
+import bisect
+import re
+import unicodedata
+
+from catalog_index import IncrementalIndex, SortedOrder, shared
+
+PREFIX_GRAMS = 3
+RESULT_CACHE_SIZE = 256  # Streamlit reruns repeat the last query on every interaction
+MATCH_CACHE_SIZE = 32  # match() sets, which can hold most of the catalog, so fewer of them
+
+_CJK = "\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uac00-\ud7af"
+_TOKEN_RE = re.compile(f"([{_CJK}]+)|([^\\W_{_CJK}]+)")
+
+
+def normalize(text):
+    return unicodedata.normalize("NFKC", str(text or "")).casefold()
+
+
+def tokenize(text):
+    """Split text into (words, cjk_runs)"""
+    words, runs = [], []
+    for cjk, word in _TOKEN_RE.findall(normalize(text)):
+        if cjk:
+            runs.append(cjk)
+        else:
+            words.append(word)
+    return words, runs
+
+
+def cjk_grams(run):
+    """Single characters and bigrams of a CJK run"""
+    grams = set(run)
+    grams.update(run[i:i + 2] for i in range(len(run) - 1))
+    return grams
+
+
+class SearchIndex(IncrementalIndex):
+    """Inverted index from words, word prefixes and CJK n-grams to product ids"""
+
+    def __init__(self):
+        super().__init__()
+        self._words = {}      # full word -> ids
+        self._vocab = []      # sorted words, for prefixes longer than PREFIX_GRAMS
+        self._prefixes = {}   # word prefix up to PREFIX_GRAMS chars -> ids
+        self._grams = {}      # CJK character / bigram -> ids
+        self._terms = {}      # id -> (words, prefixes, grams) it was indexed under
+        self._order = SortedOrder()  # results by name
+        self._matches = {}    # query -> match() result for the current catalog
+        self._results = {}    # (query, limit, category) -> search() result for the current catalog
+        self._bulk = False
+
+    # --- Maintenance ---
+    def _add(self, product_id, category, product):
+        words, runs = tokenize(f"{product.get('name', '')} {product.get('source', '')}")
+        words = set(words)
+        prefixes = {word[:n] for word in words for n in range(1, min(len(word), PREFIX_GRAMS) + 1)}
+        grams = set()
+        for run in runs:
+            grams |= cjk_grams(run)
+        for word in words:
+            if word not in self._words:
+                self._words[word] = set()
+                if not self._bulk:
+                    bisect.insort(self._vocab, word)
+            self._words[word].add(product_id)
+        for prefix in prefixes:
+            self._prefixes.setdefault(prefix, set()).add(product_id)
+        for gram in grams:
+            self._grams.setdefault(gram, set()).add(product_id)
+        self._terms[product_id] = (words, prefixes, grams)
+        self._order.add(product_id, (normalize(product.get("name")), normalize(product.get("source"))))
+
+    def _remove(self, product_id, category, product):
+        words, prefixes, grams = self._terms.pop(product_id)
+        self._order.remove(product_id)
+        for word in words:
+            ids = self._words[word]
+            ids.discard(product_id)
+            if not ids:
+                del self._words[word]
+                if not self._bulk:
+                    del self._vocab[bisect.bisect_left(self._vocab, word)]
+        for table, terms in ((self._prefixes, prefixes), (self._grams, grams)):
+            for term in terms:
+                ids = table[term]
+                ids.discard(product_id)
+                if not ids:
+                    del table[term]
+
+    def _begin_bulk(self):
+        self._bulk = True
+        self._order.begin_bulk()
+
+    def _end_bulk(self):
+        self._vocab = sorted(self._words)
+        self._order.end_bulk()
+        self._bulk = False
+
+    def _apply(self, removed, added):
+        if removed or added:
+            self._matches.clear()
+            self._results.clear()
+        super()._apply(removed, added)
+
+    # --- Queries ---
+    def _word_matches(self, prefix):
+        if len(prefix) <= PREFIX_GRAMS:
+            return self._prefixes.get(prefix, set())
+        start = bisect.bisect_left(self._vocab, prefix)
+        end = bisect.bisect_left(self._vocab, prefix + "\U0010ffff")
+        if end - start == 1:
+            return self._words[self._vocab[start]]
+        matches = set()
+        for word in self._vocab[start:end]:
+            matches |= self._words[word]
+        return matches
+
+    def _run_matches(self, run):
+        if len(run) == 1:
+            return self._grams.get(run, set())
+        bigrams = [run[i:i + 2] for i in range(len(run) - 1)]
+        return [self._grams.get(gram, set()) for gram in bigrams]
+
+    def _match(self, query):
+        """Smallest-first intersection of the id sets for every query term (caller holds the lock)"""
+        words, runs = tokenize(query)
+        candidates = [self._word_matches(word) for word in words]
+        for run in runs:
+            found = self._run_matches(run)
+            candidates.extend(found if isinstance(found, list) else [found])
+        if not candidates:
+            return set()
+        candidates.sort(key=len)
+        if len(candidates) == 1:
+            return candidates[0]
+        return candidates[0].intersection(*candidates[1:])
+
+    def match(self, query):
+        """Return the frozenset of product ids matching every term of query"""
+        with self.lock:
+            if query not in self._matches:
+                if len(self._matches) >= MATCH_CACHE_SIZE:
+                    self._matches.clear()
+                self._matches[query] = frozenset(self._match(query))
+            return self._matches[query]
+
+    def search(self, query, limit=50, category=None):
+        """Return (total matches, [(category, record), ...]) ordered by name"""
+        with self.lock:
+            cache_key = (query, limit, category)
+            if cache_key in self._results:
+                return self._results[cache_key]
+            ids = self._match(query)
+            if category is not None:
+                ids = [product_id for product_id in ids if self._records[product_id][0] == category]
+            result = (len(ids), [self._records[product_id] for product_id in self._order.first(ids, limit)])
+            if len(self._results) >= RESULT_CACHE_SIZE:
+                self._results.clear()
+            self._results[cache_key] = result
+            return result
+
+
+def shared_index():
+    """The process-wide search index; call .sync(data) before searching"""
+    return shared(SearchIndex)
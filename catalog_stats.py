@@ -0,0 +1,162 @@
+"""
+Catalog statistics kept up to date product by product.
+
+For the whole catalog, each category, each source and each (category,
+source) pair the index keeps the product count, the 行貨/水貨 split and
+the prices in sorted order, so min, max, mean, median and the cheapest
+product are read without touching the catalog. A write changes only the
+groups of the products it added, changed or removed (see catalog_index).
+
+    stats = catalog_stats.shared_index().sync(data)
+    stats.summary(category="填充")          # {"count": ..., "median": ..., "cheapest": id, ...}
+    stats.table("source", category="填充")  # one summary row per source in 填充
+"""
+
+from bisect import bisect_left, insort
+
+from catalog_index import IncrementalIndex, shared
+from catalog_query import price_of
+
+GROUPINGS = ("category", "source")
+
+
+class Group:
+    """Count, 行貨 count and sorted prices of one group of products"""
+
+    def __init__(self):
+        self.prices = {}  # id -> price
+        self.order = []   # (price, id), sorted
+        self.genuine = 0
+        self.cents = 0    # sum of prices in cents, so adding and removing never drifts
+
+    def __len__(self):
+        return len(self.prices)
+
+    def add(self, product_id, price, genuine, deferred):
+        self.prices[product_id] = price
+        self.genuine += genuine
+        self.cents += round(price * 100)
+        if not deferred:
+            insort(self.order, (price, product_id))
+
+    def remove(self, product_id, genuine, deferred):
+        price = self.prices.pop(product_id)
+        self.genuine -= genuine
+        self.cents -= round(price * 100)
+        if not deferred:
+            del self.order[bisect_left(self.order, (price, product_id))]
+
+    def resort(self):
+        self.order = sorted((price, product_id) for product_id, price in self.prices.items())
+
+    def summary(self):
+        count = len(self.order)
+        if not count:
+            return {"count": 0, "genuine": 0, "parallel": 0, "min": None, "max": None, "mean": None,
+                    "median": None, "cheapest": None}
+        middle = count // 2
+        median = self.order[middle][0] if count % 2 else (self.order[middle - 1][0] + self.order[middle][0]) / 2
+        return {
+            "count": count,
+            "genuine": self.genuine,
+            "parallel": count - self.genuine,
+            "min": self.order[0][0],
+            "max": self.order[-1][0],
+            "mean": round(self.cents / count / 100, 2),
+            "median": round(median, 2),
+            "cheapest": self.order[0][1],
+        }
+
+
+class StatsIndex(IncrementalIndex):
+    """One Group for the catalog and for every category, source and (category, source)"""
+
+    def __init__(self):
+        super().__init__()
+        self._groups = {}  # (category or None, source or None) -> Group
+        self._entries = {}  # id -> (category, source, price, genuine) it was counted under
+        self._deferred = False
+        self._dirty = set()
+
+    def _keys(self, category, source):
+        return ((None, None), (category, None), (None, source), (category, source))
+
+    # --- Maintenance ---
+    def _add(self, product_id, category, product):
+        entry = (category, product.get("source") or "", price_of(product), bool(product.get("is_genuine", True)))
+        for key in self._keys(*entry[:2]):
+            group = self._groups.get(key)
+            if group is None:
+                group = self._groups[key] = Group()
+            group.add(product_id, entry[2], entry[3], self._deferred)
+            if self._deferred:
+                self._dirty.add(key)
+        self._entries[product_id] = entry
+
+    def _remove(self, product_id, category, product):
+        category, source, _, genuine = self._entries.pop(product_id)
+        for key in self._keys(category, source):
+            group = self._groups[key]
+            group.remove(product_id, genuine, self._deferred)
+            if not group:
+                del self._groups[key]
+                self._dirty.discard(key)
+            elif self._deferred:
+                self._dirty.add(key)
+
+    def _begin_bulk(self):
+        self._deferred = True
+
+    def _end_bulk(self):
+        for key in self._dirty:
+            self._groups[key].resort()
+        self._dirty.clear()
+        self._deferred = False
+
+    # --- Reading ---
+    def summary(self, category=None, source=None):
+        """Statistics of the products in category and/or from source (None = any)"""
+        with self.lock:
+            group = self._groups.get((category, source))
+            return group.summary() if group is not None else Group().summary()
+
+    def table(self, by="category", category=None):
+        """[(category or source, summary), ...] sorted by name; by="source" can be limited to one category"""
+        if by not in GROUPINGS:
+            raise ValueError(f"Unknown grouping: {by}")
+        with self.lock:
+            rows = []
+            for (group_category, group_source), group in self._groups.items():
+                if by == "category" and group_category is not None and group_source is None:
+                    rows.append((group_category, group.summary()))
+                elif by == "source" and group_source is not None and group_category == category:
+                    rows.append((group_source, group.summary()))
+            return sorted(rows, key=lambda row: row[0])
+
+
+def describe(summary):
+    """One line for a summary header: count, 行貨/水貨 split, price range and median"""
+    count = summary["count"]
+    if not count:
+        return "No products"
+    return (f"{count} product{'s' if count != 1 else ''} · 行貨 {summary['genuine']} / 水貨 {summary['parallel']} · "
+            f"${summary['min']:,.2f}–${summary['max']:,.2f} · median ${summary['median']:,.2f}")
+
+
+def table_rows(rows, label):
+    """Dataframe rows for the output of StatsIndex.table(); label names the first column"""
+    return [{
+        label: name,
+        "Products": summary["count"],
+        "行貨": summary["genuine"],
+        "水貨": summary["parallel"],
+        "Min ($)": summary["min"],
+        "Median ($)": summary["median"],
+        "Mean ($)": summary["mean"],
+        "Max ($)": summary["max"],
+    } for name, summary in rows]
+
+
+def shared_index():
+    """The process-wide statistics index; call .sync(data) before reading"""
+    return shared(StatsIndex)
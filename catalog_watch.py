@@ -0,0 +1,216 @@
+"""
+Pushes catalog changes to the user sessions that have the catalog open.
+
+One daemon thread per process checks the catalog every WATCH_SECONDS. For a
+local store that is a stat() of the files (a version query for SQLite); the
+store only re-reads the catalog when it changed, and that parse then happens
+on the watcher thread instead of in someone's rerun. Without a local catalog
+(Streamlit Cloud) the thread follows the published snapshot's manifest, or
+the remote catalog file, instead: reading them costs nothing, and they
+revalidate with the server in the background once their TTL has passed.
+
+When the catalog changes the version goes up, and every subscribed fragment
+(the product table of each open user session) is asked to rerun on its own.
+Nothing else on those pages reruns, no session polls, and a session that is
+just open costs nothing until the catalog actually changes.
+
+    @st.fragment(run_every=catalog_watch.fallback_interval())
+    def product_table():
+        catalog_watch.shared(store.path, store.load).subscribe()
+        ...
+
+Rerunning one fragment of another session goes through Streamlit's runtime
+the same way it reruns sessions when a source file is saved; that is not a
+public API. Every private call sits in _StreamlitRuntime, which is only used
+on the Streamlit versions in PUSH_VERSIONS and only when the attributes it
+needs are there. Anywhere else (AppTest, a Streamlit that moved them)
+fallback_interval() gives the fragment a slow run_every, so the table still
+catches up with the catalog, by rerunning itself every FALLBACK_SECONDS.
+requirements.txt keeps Streamlit within PUSH_VERSIONS, so a fresh install
+pushes.
+"""
+
+import os
+import re
+import threading
+import time
+
+WATCH_SECONDS = float(os.environ.get("CLINIC_WATCH_SECONDS", 0.5))
+# Only where pushing is unavailable: idle pages rerun their table this often
+FALLBACK_SECONDS = float(os.environ.get("CLINIC_FALLBACK_SECONDS", 60))
+PUSH_VERSIONS = ((1, 37), (1, 65))  # Streamlit releases the push was checked against; keep requirements.txt in step
+
+
+class _StreamlitRuntime:
+    """The private Streamlit runtime calls a push needs, checked once per process
+
+    A push that finds an attribute missing turns pushing off for the rest of
+    the process, so the next full rerun of each page falls back to polling.
+    """
+
+    def __init__(self):
+        self.usable = self._supported()
+
+    def _supported(self):
+        try:
+            import streamlit
+            from streamlit.proto.ClientState_pb2 import ClientState
+            from streamlit.runtime import Runtime  # noqa: F401
+            from streamlit.runtime.app_session import AppSession
+        except ImportError:
+            return False
+        version = tuple(int(part) for part in re.findall(r"\d+", streamlit.__version__)[:2])
+        return (PUSH_VERSIONS[0] <= version <= PUSH_VERSIONS[1]
+                and "fragment_id" in ClientState.DESCRIPTOR.fields_by_name
+                and hasattr(AppSession, "request_rerun"))
+
+    def running(self):
+        """Whether a Streamlit server is running in this process and pushes can reach its sessions"""
+        if not self.usable:
+            return False
+        from streamlit.runtime import Runtime
+
+        return Runtime.exists() and hasattr(Runtime.instance(), "_session_mgr")
+
+    def current_fragment(self):
+        """(session id, fragment id) of the fragment running on this thread, or None"""
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+        ctx = get_script_run_ctx()
+        if ctx is None:
+            return None
+        fragment_id = getattr(ctx, "current_fragment_id", None)
+        if fragment_id is None:
+            try:
+                from streamlit.runtime.scriptrunner_utils.script_run_context import ThreadState
+
+                fragment_id = ThreadState.get().fragment_id
+            except (ImportError, AttributeError, LookupError):
+                return None
+        return (ctx.session_id, fragment_id) if fragment_id else None
+
+    def rerun_fragment(self, session_id, fragment_id):
+        """Ask a session to rerun one fragment; False if the session is gone or pushing stopped working
+
+        The rerun carries no widget changes, so the session's widgets keep the values held
+        in its session state.
+        """
+        from streamlit.proto.ClientState_pb2 import ClientState
+        from streamlit.runtime import Runtime
+
+        if not self.running():
+            return False
+        try:
+            info = Runtime.instance()._session_mgr.get_active_session_info(session_id)
+            if info is None:
+                return False
+            session = info.session
+            state = ClientState()
+            state.CopyFrom(session._client_state)
+            state.fragment_id = fragment_id
+            session._event_loop.call_soon_threadsafe(session.request_rerun, state)
+        except AttributeError as e:
+            print(f"⚠️ Streamlit's runtime changed ({e}); catalog changes are polled instead")
+            self.usable = False
+            return False
+        return True
+
+
+_runtime = None
+
+
+def _streamlit_runtime():
+    global _runtime
+    if _runtime is None:
+        _runtime = _StreamlitRuntime()
+    return _runtime
+
+
+def can_push():
+    """Whether this process can rerun another session's fragment"""
+    return _streamlit_runtime().running()
+
+
+def fallback_interval():
+    """run_every for a subscribed fragment: None when changes are pushed, else FALLBACK_SECONDS"""
+    return None if can_push() else FALLBACK_SECONDS
+
+
+class Watcher:
+    """The version of one catalog, and the fragments to rerun when it changes
+
+    load() returns the catalog, the same object until it changes: Store.load(),
+    RemoteCatalog.get().
+    """
+
+    def __init__(self, load, interval=WATCH_SECONDS):
+        self.load = load
+        self.interval = interval
+        self.version = 0
+        self._loaded = load()
+        self._subscribers = {}  # session id -> (fragment id, version it rendered)
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def subscribe(self):
+        """Rerun the calling fragment whenever the catalog changes (call it before loading the data)"""
+        if not can_push():
+            return
+        current = _streamlit_runtime().current_fragment()
+        if current is None:
+            return
+        session_id, fragment_id = current
+        with self._lock:
+            self._subscribers[session_id] = (fragment_id, self.version)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name="catalog-watch", daemon=True)
+                self._thread.start()
+
+    def check(self):
+        """Bump the version if there is a new catalog; returns whether there was"""
+        loaded = self.load()
+        if loaded is self._loaded:
+            return False
+        with self._lock:
+            self._loaded = loaded
+            self.version += 1
+        return True
+
+    def push(self):
+        """Rerun the fragments that rendered an older version; returns how many"""
+        with self._lock:
+            stale = [(session_id, fragment_id) for session_id, (fragment_id, seen) in self._subscribers.items()
+                     if seen < self.version]
+            for session_id, fragment_id in stale:
+                # Marked current now; the rerun subscribes again with the version it renders
+                self._subscribers[session_id] = (fragment_id, self.version)
+        pushed = 0
+        for session_id, fragment_id in stale:
+            if _streamlit_runtime().rerun_fragment(session_id, fragment_id):
+                pushed += 1
+            else:
+                with self._lock:
+                    self._subscribers.pop(session_id, None)
+        return pushed
+
+    def _loop(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.check()
+                # Also catches a session that subscribed just before a change it then did not load
+                self.push()
+            except Exception as e:  # a half-written file or a locked database; try again next time
+                print(f"⚠️ Could not check the catalog: {e}")
+
+
+_shared = {}
+_shared_lock = threading.Lock()
+
+
+def shared(key, load):
+    """Return the process-wide watcher of the catalog named key (a store path or URL), read with load()"""
+    with _shared_lock:
+        if key not in _shared:
+            _shared[key] = Watcher(load)
+        return _shared[key]
@@ -0,0 +1,236 @@
+"""
+Checks the remote catalog loader and snapshot client against a local HTTP server stand-in
+Run this with: python check_remote_catalog.py
+
+The stand-in serves a catalog with an ETag and Last-Modified, answers
+conditional requests with 304, and can be told to change the catalog, fail,
+or hang. It also serves a snapshot directory published by snapshot.publish().
+Every check prints ✅ or ❌; the exit code is 1 if any failed.
+"""
+
+import email.utils
+import hashlib
+import http.server
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import remote_catalog
+import snapshot
+
+
+class StandIn(http.server.ThreadingHTTPServer):
+    """What raw.githubusercontent.com looks like to the loader"""
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), Handler)
+        self.requests = []
+        self.paths = []
+        self.sent = 0
+        self.mode = "ok"  # ok | fail | hang
+        self.snapshot_dir = None
+        self.set_catalog({"products": {"填充": []}, "sources": [], "users": {}})
+
+    def set_catalog(self, catalog):
+        self.body = json.dumps(catalog, ensure_ascii=False).encode("utf-8")
+        self.etag = '"%s"' % hashlib.sha1(self.body).hexdigest()
+        self.modified = email.utils.formatdate(usegmt=True)
+
+    def lookup(self, path):
+        """(body, etag, last modified) for a path, or None"""
+        if path == "/clinic_data.json":
+            return self.body, self.etag, self.modified
+        if self.snapshot_dir and path.startswith("/snapshot/"):
+            try:
+                with open(os.path.join(self.snapshot_dir, *path.split("/")[2:]), "rb") as f:
+                    body = f.read()
+            except OSError:
+                return None
+            return body, '"%s"' % hashlib.sha1(body).hexdigest(), None
+        return None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/clinic_data.json"
+
+    @property
+    def manifest_url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/snapshot/manifest.json"
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        server = self.server
+        server.requests.append(self.headers.get("If-None-Match"))
+        server.paths.append(self.path)
+        if server.mode == "hang":
+            time.sleep(3)
+        if server.mode == "fail":
+            self.send_error(503)
+            return
+        found = server.lookup(self.path)
+        if found is None:
+            self.send_error(404)
+            return
+        body, etag, modified = found
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("ETag", etag)
+        if modified:
+            self.send_header("Last-Modified", modified)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        server.sent += len(body)
+
+    def log_message(self, *args):
+        pass
+
+
+failures = []
+
+
+def check(name, ok):
+    print(f"{'✅' if ok else '❌'} {name}")
+    if not ok:
+        failures.append(name)
+
+
+def wait_for(condition, seconds=5):
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+def main():
+    server = StandIn()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    cache_path = os.path.join(tempfile.mkdtemp(prefix="clinic_remote_"), "remote.json")
+    remote_catalog.RETRY_SECONDS = 0.2
+
+    loader = remote_catalog.RemoteCatalog(server.url, cache_path, ttl=0.3, timeout=0.5)
+    first = loader.get()
+    check("cold start fetches the catalog", first is not None and "填充" in first["products"])
+    check("catalog is saved to disk", os.path.exists(cache_path))
+
+    before = len(server.requests)
+    for _ in range(50):
+        loader.get()
+    check("reruns within the TTL make no requests", len(server.requests) == before)
+
+    time.sleep(0.35)
+    check("a stale catalog is served immediately", loader.get() is first)
+    check("revalidation sends If-None-Match and gets a 304",
+          wait_for(lambda: loader.stats()["not_modified"] == 1) and server.requests[-1] == server.etag)
+    check("a 304 keeps the same catalog object", loader.get() is first)
+
+    server.set_catalog({"products": {"填充": [], "水光": []}, "sources": [], "users": {}})
+    time.sleep(0.35)
+    loader.get()
+    check("a changed catalog is picked up in the background",
+          wait_for(lambda: "水光" in loader.get()["products"]))
+    changed = loader.get()
+
+    server.mode = "fail"
+    time.sleep(0.35)
+    check("a failing server keeps the last good copy", loader.get() is changed)
+    check("the error is recorded", wait_for(lambda: loader.stats()["error"] is not None))
+
+    server.mode = "hang"
+    time.sleep(0.35)
+    started = time.monotonic()
+    served = loader.get()
+    check("a hanging server does not block get()", served is changed and time.monotonic() - started < 0.1)
+    check("the hanging request times out", wait_for(lambda: "timed out" in str(loader.stats()["error"]), 2))
+
+    server.mode = "ok"
+    cold_requests = len(server.requests)
+    restarted = remote_catalog.RemoteCatalog(server.url, cache_path, ttl=0.3, timeout=0.5)
+    started = time.monotonic()
+    saved = restarted.get()
+    check("a restart serves the saved copy without waiting",
+          saved is not None and "水光" in saved["products"] and time.monotonic() - started < 0.1)
+    check("a restart revalidates the saved copy with a 304",
+          wait_for(lambda: restarted.stats()["not_modified"] == 1) and len(server.requests) > cold_requests)
+
+    server.mode = "fail"
+    unreachable = remote_catalog.RemoteCatalog(server.url, None, ttl=0.3, timeout=0.5)
+    check("a cold start with the server down returns None", unreachable.get() is None)
+    requests = len(server.requests)
+    unreachable.get()
+    check("a failed cold start is not retried on every rerun", len(server.requests) == requests)
+
+    server.mode = "ok"
+    check_snapshots(server)
+
+    server.shutdown()
+    sys.exit(1 if failures else 0)
+
+
+def check_snapshots(server):
+    workdir = tempfile.mkdtemp(prefix="clinic_snapshot_")
+    server.snapshot_dir = os.path.join(workdir, "snapshot")
+    catalog = {
+        "products": {
+            category: [{"id": f"{category}_{i}", "name": f"{category} product {i}", "price": 100.0 + i}
+                       for i in range(500)]
+            for category in ["填充", "水光", "溶脂", "肉毒", "生髮"]
+        },
+        "sources": ["Local Supplier"],
+        "users": {"admin": "admin123"},
+    }
+    manifest, written = snapshot.publish(catalog, server.snapshot_dir)
+    check("publishing writes one shard per category", written == 5 and len(manifest["categories"]) == 5)
+    with open(os.path.join(server.snapshot_dir, snapshot.MANIFEST), encoding="utf-8") as f:
+        check("user accounts are not published", "admin123" not in f.read())
+    _, written = snapshot.publish(catalog, server.snapshot_dir)
+    check("republishing an unchanged catalog writes nothing", written == 0)
+
+    client = snapshot.SnapshotClient(server.manifest_url, os.path.join(workdir, "cache"), ttl=0.3, timeout=0.5)
+    before = server.sent
+    opened = client.get(["填充"])
+    shard_bytes = manifest["categories"]["填充"]["bytes"]
+    check("opening one category downloads the manifest and that shard only",
+          list(opened["products"]) == ["填充"] and server.sent - before < shard_bytes * 1.5 + 2000)
+    check("the snapshot has no users", "users" not in opened)
+    check("a second call is the same catalog object", client.get(["填充"]) is opened)
+
+    everything = client.get()
+    check("opening all categories fetches the rest", len(everything["products"]) == 5
+          and everything["products"]["填充"] is opened["products"]["填充"])
+
+    catalog["products"]["水光"][0]["price"] = 1.0
+    _, written = snapshot.publish(catalog, server.snapshot_dir)
+    check("editing one category publishes one new shard", written == 1)
+    time.sleep(0.35)
+    client.get()
+    wait_for(lambda: client.manifest.stats()["fetches"] == 2)
+    before = server.sent
+    refreshed = client.get()
+    changed = manifest["categories"]["水光"]["bytes"]
+    check("a refresh downloads only the changed shard",
+          refreshed["products"]["水光"][0]["price"] == 1.0 and server.sent - before < changed * 1.5)
+    check("unchanged categories keep their objects",
+          refreshed["products"]["填充"] is everything["products"]["填充"])
+
+    restarted = snapshot.SnapshotClient(server.manifest_url, os.path.join(workdir, "cache"), ttl=0.3, timeout=0.5)
+    shard_requests = sum(1 for path in server.paths if "/shards/" in path)
+    restarted.get()
+    check("a restart reads shards from its disk cache",
+          sum(1 for path in server.paths if "/shards/" in path) == shard_requests)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,306 @@
+"""
+Login accounts, kept apart from the catalog in clinic_users.json.
+
+Passwords are stored as salted PBKDF2-SHA256 hashes, slow on purpose.
+Checking one takes a CPU core for about a tenth of a second, so it runs on a
+small worker pool instead of the Streamlit script thread: a burst of logins
+queues on the pool (at most MAX_PENDING waiting, the rest are told to retry)
+while other sessions' reruns carry on. Repeated failures are throttled per
+username and per client address before any hashing is done.
+
+A successful login gets a signed session token that expires after
+TOKEN_MINUTES (renewed while the session is in use), so an authenticated
+rerun checks an HMAC instead of the password.
+
+    accounts = credentials.shared()
+    session = accounts.login("admin", password, client=credentials.client_address())
+    ...
+    session = accounts.check_token(session["token"])  # None once expired
+
+The file is created with the default admin/partner accounts if it does not
+exist (change their passwords), and accounts that used to live in the
+catalog are moved here by the schema migration. Manage accounts with:
+
+    python credentials.py list | set USERNAME [ROLE] | remove USERNAME
+"""
+
+import base64
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as VerifyTimeout
+
+import catalog_cache
+
+USERS_FILE = os.environ.get("CLINIC_USERS_FILE", "clinic_users.json")
+ROLES = ("admin", "partner", "user")
+DEFAULT_USERS = {"admin": ("admin123", "admin"), "partner": ("partner123", "partner")}
+ITERATIONS = 260_000
+VERIFY_WORKERS = 2
+MAX_PENDING = 16  # logins waiting for a worker; more are refused until the queue drains
+MAX_FAILURES = 5  # failed attempts per username, and per client, within FAILURE_WINDOW
+FAILURE_WINDOW = 300  # seconds
+# Reverse proxies in front of the app that append to X-Forwarded-For (0 = clients connect directly)
+TRUSTED_PROXIES = int(os.environ.get("CLINIC_TRUSTED_PROXIES", 0))
+MAX_THROTTLED_KEYS = 10_000  # usernames and clients with recent failures that are remembered
+TOKEN_MINUTES = int(os.environ.get("CLINIC_SESSION_MINUTES", 30))
+
+
+class LoginError(Exception):
+    """A login was refused; the message can be shown to the user"""
+
+
+def hash_password(password, iterations=ITERATIONS):
+    salt = secrets.token_bytes(16)
+    digest = hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), salt, iterations)
+    return f"pbkdf2_sha256${iterations}${salt.hex()}${digest.hex()}"
+
+
+def check_password(password, encoded):
+    """Whether password matches a hash_password() result (constant time)"""
+    try:
+        algorithm, iterations, salt, digest = encoded.split("$")
+    except (AttributeError, ValueError):
+        return False
+    if algorithm != "pbkdf2_sha256":
+        return False
+    actual = hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), bytes.fromhex(salt), int(iterations))
+    return hmac.compare_digest(actual.hex(), digest)
+
+
+class Throttle:
+    """Failed attempts per key in a sliding window
+
+    At most max_keys keys are kept: past that, keys whose window has passed
+    are dropped, then the ones that failed least recently.
+    """
+
+    def __init__(self, limit=MAX_FAILURES, window=FAILURE_WINDOW, max_keys=MAX_THROTTLED_KEYS):
+        self.limit = limit
+        self.window = window
+        self.max_keys = max_keys
+        self._failures = {}  # key -> deque of failure times, least recently failed first
+        self._lock = threading.Lock()
+
+    def wait(self, key):
+        """Seconds until key may try again (0 = now)"""
+        with self._lock:
+            failures = self._failures.get(key)
+            if not failures:
+                return 0
+            now = time.monotonic()
+            while failures and now - failures[0] >= self.window:
+                failures.popleft()
+            if not failures:
+                del self._failures[key]
+                return 0
+            return self.window - (now - failures[0]) if len(failures) >= self.limit else 0
+
+    def fail(self, key):
+        with self._lock:
+            now = time.monotonic()
+            failures = self._failures.pop(key, None) or deque(maxlen=self.limit)
+            failures.append(now)
+            self._failures[key] = failures
+            if len(self._failures) > self.max_keys:
+                self._prune(now)
+
+    def _prune(self, now):
+        for key in [key for key, failures in self._failures.items() if now - failures[-1] >= self.window]:
+            del self._failures[key]
+        # Still full: forget the oldest tenth at once, so the next failures do not sweep again
+        while len(self._failures) > self.max_keys - self.max_keys // 10:
+            del self._failures[next(iter(self._failures))]
+
+    def clear(self, key):
+        with self._lock:
+            self._failures.pop(key, None)
+
+
+class Credentials:
+    """The accounts in one users file, a verification pool and the login throttles"""
+
+    def __init__(self, path=USERS_FILE):
+        self.path = path
+        self._write_lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=VERIFY_WORKERS, thread_name_prefix="login-verify")
+        self._pending = threading.BoundedSemaphore(MAX_PENDING)
+        self.by_user = Throttle()
+        self.by_client = Throttle()
+        # Checked against for unknown usernames, so the answer takes as long either way
+        self._dummy = f"pbkdf2_sha256${ITERATIONS}${'00' * 16}${'00' * 32}"
+
+    # --- The users file ---
+    def _load(self):
+        """The parsed users file (cached until it changes), created with the default accounts if missing"""
+        data = catalog_cache.load_json(self.path)
+        if data is None:
+            with self._write_lock:
+                data = catalog_cache.load_json(self.path)
+                if data is None:
+                    users = {name: {"hash": hash_password(password), "role": role}
+                             for name, (password, role) in DEFAULT_USERS.items()}
+                    data = self._write({"secret": secrets.token_hex(32), "users": users})
+        return data
+
+    def _write(self, data):
+        catalog_cache.write_json_atomic(self.path, data)
+        return catalog_cache.load_json(self.path)
+
+    def _update(self, change):
+        """Apply change(users) to a copy of the accounts and write the file"""
+        self._load()
+        with self._write_lock:
+            data = catalog_cache.thaw(catalog_cache.load_json(self.path))
+            change(data["users"])
+            self._write(data)
+
+    def users(self):
+        """{username: role}"""
+        return {name: user["role"] for name, user in self._load()["users"].items()}
+
+    def set_password(self, username, password, role=None):
+        if role is not None and role not in ROLES:
+            raise ValueError(f"Unknown role: {role}")
+
+        def change(users):
+            users[username] = {"hash": hash_password(password),
+                               "role": role or users.get(username, {}).get("role", "partner")}
+        self._update(change)
+
+    def remove(self, username):
+        self._update(lambda users: users.pop(username, None))
+
+    def import_users(self, plaintext, admin="admin"):
+        """Hash and add {username: password} accounts not in the file yet (a new file gets only these)"""
+        with self._write_lock:
+            data = catalog_cache.load_json(self.path)
+            data = catalog_cache.thaw(data) if data is not None else {"secret": secrets.token_hex(32), "users": {}}
+            missing = sorted(name for name in plaintext if name not in data["users"])
+            for name in missing:
+                data["users"][name] = {"hash": hash_password(plaintext[name]),
+                                       "role": "admin" if name == admin else "partner"}
+            if missing:
+                self._write(data)
+            return missing
+
+    # --- Logging in ---
+    def login(self, username, password, client=None, timeout=10):
+        """A session (see check_token) for valid credentials; LoginError otherwise"""
+        wait = max(self.by_user.wait(username), self.by_client.wait(client) if client else 0)
+        if wait:
+            raise LoginError(f"Too many failed attempts, try again in {int(wait) // 60 + 1} min")
+        if not self._pending.acquire(blocking=False):
+            raise LoginError("The server is busy, please try again in a moment")
+        try:
+            user = self._load()["users"].get(username)
+            ok = self._pool.submit(check_password, password, user["hash"] if user else self._dummy).result(timeout)
+        except VerifyTimeout:
+            raise LoginError("The server is busy, please try again in a moment")
+        finally:
+            self._pending.release()
+        if not ok or user is None:
+            self.by_user.fail(username)
+            if client:
+                self.by_client.fail(client)
+            raise LoginError("Invalid username or password")
+        self.by_user.clear(username)
+        return self._session(username, user["role"])
+
+    # --- Session tokens ---
+    def session_for(self, username):
+        """A session for username without a password (for tools acting as a known user), or None"""
+        user = self._load()["users"].get(username)
+        return self._session(username, user["role"]) if user else None
+
+    def _sign(self, payload):
+        key = self._load()["secret"].encode("ascii")
+        return hmac.new(key, payload.encode("ascii"), hashlib.sha256).hexdigest()[:32]
+
+    def _session(self, username, role):
+        expires = int(time.time()) + TOKEN_MINUTES * 60
+        payload = base64.urlsafe_b64encode(json.dumps([username, role, expires]).encode("utf-8")).decode("ascii")
+        return {"username": username, "role": role, "expires": expires,
+                "token": f"{payload}.{self._sign(payload)}"}
+
+    def check_token(self, token):
+        """The session a token belongs to, renewed when half used up; None if invalid or expired"""
+        try:
+            payload, signature = token.split(".")
+            if not hmac.compare_digest(signature, self._sign(payload)):
+                return None
+            username, role, expires = json.loads(base64.urlsafe_b64decode(payload))
+        except (AttributeError, ValueError):
+            return None
+        remaining = expires - time.time()
+        user = self._load()["users"].get(username)
+        if remaining <= 0 or user is None or user["role"] != role:
+            return None
+        if remaining < TOKEN_MINUTES * 30:
+            return self._session(username, role)
+        return {"username": username, "role": role, "expires": expires, "token": token}
+
+
+def client_address():
+    """The browser's address, for throttling logins per client, or None
+
+    Behind TRUSTED_PROXIES proxies it is the X-Forwarded-For hop the outermost
+    of them appended; hops to the left of that are whatever the client sent, so
+    they are never used. Without proxies it is the connection's own address.
+    """
+    import streamlit as st
+
+    context = getattr(st, "context", None)
+    if context is None:
+        return None
+    if TRUSTED_PROXIES:
+        try:
+            forwarded = context.headers.get("X-Forwarded-For")
+        except (AttributeError, RuntimeError):
+            forwarded = None
+        hops = [hop.strip() for hop in (forwarded or "").split(",") if hop.strip()]
+        if len(hops) >= TRUSTED_PROXIES:
+            return hops[-TRUSTED_PROXIES]
+    return getattr(context, "ip_address", None)
+
+
+_shared = {}
+_shared_lock = threading.Lock()
+
+
+def shared(path=USERS_FILE):
+    """Return the process-wide accounts for path"""
+    with _shared_lock:
+        key = os.path.abspath(path)
+        if key not in _shared:
+            _shared[key] = Credentials(key)
+        return _shared[key]
+
+
+if __name__ == "__main__":
+    import getpass
+
+    command = sys.argv[1:2]
+    accounts = shared()
+    if command == ["list"]:
+        for name, role in sorted(accounts.users().items()):
+            print(f"{name:<20}{role}")
+    elif command == ["set"] and len(sys.argv) in (3, 4):
+        password = getpass.getpass(f"New password for {sys.argv[2]}: ")
+        if not password or password != getpass.getpass("Again: "):
+            print("❌ Passwords are empty or do not match")
+            sys.exit(1)
+        accounts.set_password(sys.argv[2], password, *sys.argv[3:4])
+        print(f"✅ Password set for {sys.argv[2]}")
+    elif command == ["remove"] and len(sys.argv) == 3:
+        accounts.remove(sys.argv[2])
+        print(f"✅ Removed {sys.argv[2]}")
+    else:
+        print("Usage: python credentials.py list | set USERNAME [admin|partner|user] | remove USERNAME")
+        sys.exit(1)
@@ -0,0 +1,171 @@
+"""
+Load generator for the catalog API
+Run this with: python load_test_api.py [--products 10000] [--clients 4] [--seconds 10] [--url http://host:port]
+
+Without --url it seeds a synthetic catalog in a temp folder, starts
+catalog_api.py on it in its own process, and loads that. Each client is a
+separate process holding one keep-alive connection and sending a mix of
+requests: category lists, filtered product pages (a fixed set of queries,
+as real partner scripts repeat theirs), single products, and revalidations
+with If-None-Match. It reports requests per second, latency percentiles and
+the status codes seen; the exit code is 1 if any request failed.
+
+--min-rps makes the run fail unless the server sustained that many requests
+per second.
+"""
+
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from urllib.parse import quote, urlsplit
+
+import catalog_cache
+import synthetic_catalog
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def request_mix(catalog, rng, count=200):
+    """A fixed list of request paths drawn from the catalog"""
+    products = [(category, product) for category, items in catalog["products"].items() for product in items]
+    paths = ["/categories"]
+    for _ in range(count):
+        category, product = rng.choice(products)
+        kind = rng.random()
+        if kind < 0.4:
+            paths.append(f"/products/{product['id']}")
+        elif kind < 0.7:
+            paths.append(f"/products?category={quote(category)}&limit=20&sort=price")
+        elif kind < 0.9:
+            paths.append(f"/products?category={quote(category)}&source={quote(product['source'])}"
+                         f"&genuine={'true' if rng.random() < 0.5 else 'false'}&max_price={rng.randrange(500, 5000, 500)}")
+        else:
+            paths.append(f"/products?min_price={rng.randrange(0, 2000, 100)}&sort=date&order=desc&limit=50")
+    return paths
+
+
+def client(url, paths, seconds, seed, results):
+    """One keep-alive connection sending requests until the time is up"""
+    rng = random.Random(seed)
+    target = urlsplit(url)
+    conn = http.client.HTTPConnection(target.hostname, target.port, timeout=10)
+    etags = {}
+    latencies = []
+    statuses = {}
+    received = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        path = rng.choice(paths)
+        headers = {"Accept-Encoding": "gzip"}
+        if path in etags and rng.random() < 0.3:
+            headers["If-None-Match"] = etags[path]
+        started = time.perf_counter()
+        try:
+            conn.request("GET", path, headers=headers)
+            response = conn.getresponse()
+            body = response.read()
+        except (OSError, http.client.HTTPException):
+            statuses["error"] = statuses.get("error", 0) + 1
+            conn.close()
+            conn = http.client.HTTPConnection(target.hostname, target.port, timeout=10)
+            continue
+        latencies.append(time.perf_counter() - started)
+        statuses[response.status] = statuses.get(response.status, 0) + 1
+        received += len(body)
+        if response.getheader("ETag"):
+            etags[path] = response.getheader("ETag")
+    conn.close()
+    results.put({"latencies": latencies, "statuses": statuses, "bytes": received})
+
+
+def start_server(products, seed):
+    """Seed a catalog in a temp folder and start catalog_api.py on a free port; returns (process, url)"""
+    workdir = tempfile.mkdtemp(prefix="clinic_api_load_")
+    catalog_cache.write_json_atomic(os.path.join(workdir, "clinic_data.json"),
+                                    synthetic_catalog.generate(products, seed=seed))
+    server = subprocess.Popen(
+        [sys.executable, os.path.join(HERE, "catalog_api.py"), "--port", "0"],
+        cwd=workdir, env={**os.environ, "CLINIC_STORAGE": "json"}, stdout=subprocess.PIPE, text=True,
+    )
+    line = server.stdout.readline()
+    if not line.startswith("✅"):
+        server.kill()
+        raise RuntimeError("catalog_api.py did not start")
+    return server, line.split()[-1].rstrip("/")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="load a running API instead of starting one")
+    parser.add_argument("--products", type=int, default=10000)
+    parser.add_argument("--clients", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--min-rps", type=float, help="fail below this many requests per second")
+    args = parser.parse_args()
+
+    server = None
+    url = args.url
+    if url is None:
+        server, url = start_server(args.products, args.seed)
+    try:
+        conn = http.client.HTTPConnection(urlsplit(url).hostname, urlsplit(url).port, timeout=10)
+        # The paths are drawn from the catalog the server is actually serving
+        catalog = {"products": {}}
+        conn.request("GET", "/categories")
+        for category in json.loads(conn.getresponse().read())["categories"]:
+            conn.request("GET", f"/products?category={quote(category['name'])}&limit=1000")
+            catalog["products"][category["name"]] = json.loads(conn.getresponse().read())["products"]
+        conn.close()
+        paths = request_mix(catalog, random.Random(args.seed))
+
+        # Warm up, so every response is encoded once before timing
+        warm = http.client.HTTPConnection(urlsplit(url).hostname, urlsplit(url).port, timeout=10)
+        for path in paths:
+            warm.request("GET", path)
+            warm.getresponse().read()
+        warm.close()
+
+        results = multiprocessing.Queue()
+        clients = [multiprocessing.Process(target=client, args=(url, paths, args.seconds, args.seed + i, results))
+                   for i in range(args.clients)]
+        for process in clients:
+            process.start()
+        reports = [results.get() for _ in clients]
+        for process in clients:
+            process.join()
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    latencies = sorted(latency for report in reports for latency in report["latencies"])
+    statuses = {}
+    for report in reports:
+        for status, count in report["statuses"].items():
+            statuses[status] = statuses.get(status, 0) + count
+    rps = len(latencies) / args.seconds
+    failed = sum(count for status, count in statuses.items() if status not in (200, 304))
+    print(f"📦 {url} · {args.clients} clients · {args.seconds:.0f}s")
+    print(f"   requests/s      {rps:>10.0f}")
+    print(f"   p50 latency     {statistics.median(latencies) * 1000:>10.2f} ms")
+    print(f"   p99 latency     {latencies[int(len(latencies) * 0.99)] * 1000:>10.2f} ms")
+    print(f"   received        {sum(report['bytes'] for report in reports) / 1e6:>10.1f} MB")
+    print(f"   statuses        {', '.join(f'{status}: {count}' for status, count in sorted(statuses.items(), key=str))}")
+    if args.min_rps and rps < args.min_rps:
+        print(f"❌ below {args.min_rps:.0f} requests/s")
+        failed += 1
+    print("❌ some requests failed" if failed else "✅ no failed requests")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
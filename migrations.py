@@ -0,0 +1,205 @@
+"""
+Versioned catalog schema migrations, run once per process at startup.
+
+The catalog records the schema it is in as "schema_version" (missing means
+0, the original format). MIGRATIONS is the ordered list of upgrades; each
+one takes a mutable catalog from the previous version to the next. They are
+pure functions of the data (ids given to old records are derived from the
+record, not random), so upgrading the same old catalog twice gives the same
+result.
+
+Both apps call ensure_current(store) when their process starts. If the
+stored catalog is behind, it is backed up next to the store, every pending
+migration is applied in memory, and the result is written back with one
+store.save(), so a crash leaves either the old catalog or the new one. A
+lock file keeps two processes (say, the user and admin apps starting
+together) from migrating at the same time. Loading and rendering never
+write.
+
+Catalogs that are not in a local store (the GitHub copy) are upgraded in
+memory with upgraded(), once per download.
+
+    python migrations.py [status|upgrade] [clinic_data.json]
+"""
+
+import hashlib
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+import credentials
+import storage
+from catalog_cache import thaw
+
+DEFAULT_CATEGORIES = ["填充", "水光", "溶脂", "肉毒", "生髮"]
+LOCK_TIMEOUT = 30  # seconds to wait for another process's migration
+STALE_LOCK_SECONDS = 300  # a lock file this old was left by a crashed process
+
+
+class MigrationError(Exception):
+    """The catalog could not be brought to the current schema"""
+
+
+def _legacy_id(*parts):
+    """Stable 16-character id for a record that had none"""
+    return hashlib.sha1("/".join(str(part) for part in parts).encode("utf-8")).hexdigest()[:16]
+
+
+# --- Migrations ---
+def products_as_lists(data):
+    """Categories stored as {name: info} become lists of records"""
+    data.setdefault("products", {})
+    data.setdefault("sources", [])
+    data.setdefault("users", {})
+    for category, products in data["products"].items():
+        if isinstance(products, dict):
+            data["products"][category] = [{"id": _legacy_id(category, name), "name": name, **info}
+                                          for name, info in products.items()]
+
+
+def unique_product_ids(data):
+    """Every product has an id that is unique across categories"""
+    seen = set()
+    for category, products in data["products"].items():
+        for position, product in enumerate(products):
+            if not product.get("id") or product["id"] in seen:
+                product["id"] = _legacy_id(category, position, product.get("name"))
+            seen.add(product["id"])
+
+
+def default_categories(data):
+    """The five standard categories exist (formerly add_categories.py)"""
+    for category in DEFAULT_CATEGORIES:
+        data["products"].setdefault(category, [])
+
+
+def drop_users(data):
+    """Login accounts live in the credentials store, not the catalog"""
+    data.pop("users", None)
+
+
+MIGRATIONS = [products_as_lists, unique_product_ids, default_categories, drop_users]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def version_of(data):
+    return (data or {}).get("schema_version", 0)
+
+
+def migrate(data):
+    """Return (a mutable copy of data at SCHEMA_VERSION, names of the migrations applied)"""
+    version = version_of(data)
+    if version > SCHEMA_VERSION:
+        raise MigrationError(f"catalog is at schema {version}, newer than this code ({SCHEMA_VERSION})")
+    data = thaw(data)
+    applied = []
+    for migration in MIGRATIONS[version:]:
+        migration(data)
+        applied.append(migration.__name__)
+    data["schema_version"] = SCHEMA_VERSION
+    return data, applied
+
+
+def upgraded(data):
+    """data at SCHEMA_VERSION (data itself if it already is)"""
+    if data is None or version_of(data) == SCHEMA_VERSION:
+        return data
+    return migrate(data)[0]
+
+
+# --- Upgrading a store ---
+_lock = threading.Lock()
+_current = set()  # paths of stores already checked by this process
+
+
+@contextmanager
+def _lock_file(path):
+    """Hold path.migrate.lock, shared with other processes"""
+    lock_path = f"{path}.migrate.lock"
+    deadline = time.monotonic() + LOCK_TIMEOUT
+    while True:
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+            break
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(lock_path) > STALE_LOCK_SECONDS:
+                    os.remove(lock_path)
+                    continue
+            except OSError:
+                continue  # released in the meantime
+            if time.monotonic() > deadline:
+                raise MigrationError(f"another process is migrating the catalog ({lock_path})")
+            time.sleep(0.1)
+    try:
+        yield
+    finally:
+        os.close(fd)
+        os.remove(lock_path)
+
+
+def backup_path(store, version):
+    stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+    return f"{store.path}.v{version}-{stamp}.bak"
+
+
+def keep_users(data):
+    """Move login accounts still in a pre-drop_users catalog into the credentials store, hashed"""
+    if data.get("users"):
+        credentials.shared().import_users(data["users"])
+
+
+def upgrade(store):
+    """Bring the store to SCHEMA_VERSION; returns (backup file, migrations applied), or (None, []) if current"""
+    with _lock_file(store.path):
+        # Read again under the lock: another process may have just finished
+        data = store.load()
+        if data is None or version_of(data) == SCHEMA_VERSION:
+            return None, []
+        migrated, applied = migrate(data)
+        backup = backup_path(store, version_of(data))
+        store.export_json(backup)
+        keep_users(data)  # drop_users takes them out of the catalog
+        store.save(migrated)
+        return backup, applied
+
+
+def ensure_current(store):
+    """Upgrade the store the first time this process sees it; later calls return at once"""
+    if store.path in _current:
+        return
+    with _lock:
+        if store.path in _current:
+            return
+        data = store.load()
+        if data is not None and version_of(data) != SCHEMA_VERSION:
+            try:
+                upgrade(store)
+            except OSError as e:
+                raise MigrationError(f"could not upgrade {store.path}: {e}") from e
+        _current.add(store.path)
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "status"
+    if command not in ("status", "upgrade"):
+        print("Usage: python migrations.py [status|upgrade] [clinic_data.json]")
+        sys.exit(1)
+    store = storage.get_store(*sys.argv[2:3])
+    data = store.load()
+    if data is None:
+        print(f"📦 {store.path}: no catalog yet")
+        sys.exit(0)
+    version = version_of(data)
+    print(f"📦 {store.path}: schema {version} (current: {SCHEMA_VERSION})")
+    for migration in MIGRATIONS[version:]:
+        print(f"   pending {migration.__name__}: {migration.__doc__}")
+    if command == "upgrade":
+        backup, applied = upgrade(store)
+        if backup:
+            print(f"✅ Applied {', '.join(applied)}; the old catalog is in {backup}")
+        else:
+            print("✅ Already current")
@@ -0,0 +1,282 @@
+"""
+Timing spans for the apps' slow phases, an in-app debug panel, and Prometheus metrics.
+
+Off unless CLINIC_PERF=1. When off, span() and rerun() hand back one shared
+do-nothing object, so instrumented code pays for a function call and nothing
+else.
+
+    with perf.rerun("user_app"):
+        with perf.span("load_data") as span:
+            data = load_data()
+            span.note(products=..., bytes=...)
+
+Each rerun keeps its spans (name, seconds, notes such as payload bytes and
+product counts); the last KEEP_RERUNS reruns of the process are shown by
+debug_panel(). A fragment that reruns on its own is timed as a run named
+after it (see fragment()). Spans outside a rerun, like background catalog fetches, are
+counted too, under app="background". Every span also feeds a histogram per
+(app, span), exported in Prometheus text format:
+
+    CLINIC_PERF_FILE  written after a rerun, at most every EXPORT_SECONDS
+                      (default clinic_metrics.prom, for a textfile collector)
+    CLINIC_PERF_PORT  also serve http://host:PORT/metrics
+"""
+
+import http.server
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from datetime import datetime
+
+ENABLED = os.environ.get("CLINIC_PERF", "") not in ("", "0")
+METRICS_FILE = os.environ.get("CLINIC_PERF_FILE", "clinic_metrics.prom")
+METRICS_PORT = os.environ.get("CLINIC_PERF_PORT")
+KEEP_RERUNS = 50
+EXPORT_SECONDS = 10
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class _Off:
+    """What span() and rerun() return when timing is off"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def note(self, **fields):
+        pass
+
+
+_OFF = _Off()
+
+
+class Span:
+    """One timed phase; note() attaches sizes and counts to it"""
+
+    def __init__(self, name, app):
+        self.name = name
+        self.app = app
+        self.fields = {}
+        self.seconds = None
+        self.depth = 0  # how many spans it runs inside (the rerun counts)
+
+    def __enter__(self):
+        self.depth = getattr(_local, "depth", 0)
+        _local.depth = self.depth + 1
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.seconds = time.perf_counter() - self._started
+        _local.depth = self.depth
+        _finish(self)
+        return False
+
+    def note(self, **fields):
+        self.fields.update(fields)
+
+
+class Rerun(Span):
+    """One run of an app script and the spans timed during it"""
+
+    def __init__(self, app, name="rerun"):
+        super().__init__(name, app)
+        self.spans = []
+        self.at = datetime.now().strftime("%H:%M:%S")
+
+    def __enter__(self):
+        _local.rerun = self
+        return super().__enter__()
+
+    def __exit__(self, *exc):
+        _local.rerun = None
+        super().__exit__(*exc)
+        with _lock:
+            _reruns.append(self)
+        _export()
+        return False
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)  # the last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds):
+        self.counts[bisect_left(BUCKETS, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+
+
+_local = threading.local()
+_lock = threading.Lock()
+_reruns = deque(maxlen=KEEP_RERUNS)
+_histograms = {}  # (app, span) -> Histogram
+_payloads = {}  # (app, span, field) -> last numeric value noted
+_exported_at = 0.0
+_server = None
+
+
+def span(name):
+    """Time the with-block as name (a no-op unless CLINIC_PERF is set)"""
+    if not ENABLED:
+        return _OFF
+    rerun = getattr(_local, "rerun", None)
+    return Span(name, rerun.app if rerun else "background")
+
+
+def rerun(app):
+    """Time one script run of app; spans inside it are listed under it"""
+    if not ENABLED:
+        return _OFF
+    _start_server()
+    return Rerun(app)
+
+
+def fragment(name, app):
+    """Time a fragment: a span of the rerun it is part of, or a rerun of its own when it reruns alone"""
+    if not ENABLED:
+        return _OFF
+    if getattr(_local, "rerun", None) is not None:
+        return Span(name, _local.rerun.app)
+    _start_server()
+    return Rerun(app, name)
+
+
+def _finish(finished):
+    rerun = getattr(_local, "rerun", None)
+    if rerun is not None and finished is not rerun:
+        rerun.spans.append(finished)
+    with _lock:
+        _histograms.setdefault((finished.app, finished.name), Histogram()).observe(finished.seconds)
+        for field, value in finished.fields.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                _payloads[(finished.app, finished.name, field)] = value
+
+
+def note_catalog(timed, data, path=None):
+    """Note a catalog's product count, and the size of the file it came from, on a span"""
+    if not ENABLED or data is None:
+        return
+    timed.note(products=sum(len(products) for products in data.get("products", {}).values()),
+               bytes=os.path.getsize(path) if path and os.path.exists(path) else 0)
+
+
+def recent_reruns():
+    """The last KEEP_RERUNS reruns, newest first"""
+    with _lock:
+        return list(reversed(_reruns))
+
+
+# --- Prometheus export ---
+def _labels(**labels):
+    return ",".join(f'{key}="{value}"' for key, value in labels.items())
+
+
+def prometheus_text():
+    """Every histogram and payload gauge in the Prometheus text exposition format"""
+    with _lock:
+        histograms = sorted(_histograms.items())
+        payloads = sorted(_payloads.items())
+    lines = [
+        "# HELP clinic_span_seconds Time spent in each instrumented phase (span=\"rerun\" is the whole script run).",
+        "# TYPE clinic_span_seconds histogram",
+    ]
+    for (app, name), histogram in histograms:
+        cumulative = 0
+        for bound, count in zip(BUCKETS + ("+Inf",), histogram.counts):
+            cumulative += count
+            lines.append(f"clinic_span_seconds_bucket{{{_labels(app=app, span=name, le=bound)}}} {cumulative}")
+        lines.append(f"clinic_span_seconds_sum{{{_labels(app=app, span=name)}}} {histogram.sum:.6f}")
+        lines.append(f"clinic_span_seconds_count{{{_labels(app=app, span=name)}}} {histogram.count}")
+    lines += [
+        "# HELP clinic_span_payload Last size noted by a phase (catalog bytes, product counts, ...).",
+        "# TYPE clinic_span_payload gauge",
+    ]
+    for (app, name, field), value in payloads:
+        lines.append(f"clinic_span_payload{{{_labels(app=app, span=name, field=field)}}} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def _export():
+    """Write METRICS_FILE if the last write is older than EXPORT_SECONDS"""
+    global _exported_at
+    now = time.monotonic()
+    with _lock:
+        if not METRICS_FILE or now - _exported_at < EXPORT_SECONDS:
+            return
+        _exported_at = now
+    tmp_path = f"{METRICS_FILE}.tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(prometheus_text())
+        os.replace(tmp_path, METRICS_FILE)
+    except OSError:
+        pass
+
+
+class _MetricsHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        body = prometheus_text().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def _start_server():
+    """Serve /metrics on CLINIC_PERF_PORT, once per process"""
+    global _server
+    if not METRICS_PORT or _server is not None:
+        return
+    with _lock:
+        if _server is not None:
+            return
+        try:
+            _server = http.server.ThreadingHTTPServer(("", int(METRICS_PORT)), _MetricsHandler)
+        except OSError:
+            _server = False  # port taken, e.g. by the other app; don't retry every rerun
+            return
+    _server.daemon_threads = True
+    threading.Thread(target=_server.serve_forever, name="perf-metrics", daemon=True).start()
+
+
+# --- Debug panel ---
+def debug_panel():
+    """Expander with the last reruns and their phases (shown only when timing is on)"""
+    if not ENABLED:
+        return
+    import streamlit as st
+
+    with st.expander("🐢 Performance (last reruns)"):
+        reruns = recent_reruns()
+        if not reruns:
+            st.caption("No reruns timed yet.")
+            return
+        rows = []
+        for run in reruns:
+            row = {"Time": run.at, "App": run.app if run.name == "rerun" else f"{run.app} ({run.name})", "Total (ms)": round(run.seconds * 1000, 1),
+                   # Widget rendering and everything else outside the outermost spans
+                   "Other (ms)": round((run.seconds - sum(timed.seconds for timed in run.spans
+                                                          if timed.depth == run.depth + 1)) * 1000, 1)}
+            for timed in run.spans:
+                key = f"{timed.name} (ms)"
+                row[key] = round(row.get(key, 0) + timed.seconds * 1000, 1)
+                for field, value in timed.fields.items():
+                    row[f"{timed.name} {field}"] = value
+            rows.append(row)
+        st.dataframe(rows, use_container_width=True, hide_index=True)
+        st.caption(f"Metrics: {METRICS_FILE or 'no file'}"
+                   + (f", http://localhost:{METRICS_PORT}/metrics" if METRICS_PORT else ""))
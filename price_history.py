@@ -0,0 +1,200 @@
+"""
+Append-only price history: one line per price change, never rewritten.
+
+Each line records when a price changed, the product id and its source, the
+old and new price, and who made the change:
+
+    {"t": "2024-05-01 14:03:22", "id": "...", "src": "香港代理", "old": 100.0, "new": 105.0, "user": "admin"}
+
+Recording a change is one append. The first query in a process scans the
+file once to index the byte offset and time of every line by product and by
+source; after that only newly appended lines are read (also those written by
+other processes). A product's trend reads that product's lines only, and a
+price "as of" a date is a bisection over its times plus one line read.
+
+    history = price_history.shared()
+    history.record(product_id, source, 100.0, 105.0, "admin")
+    history.as_of(product_id, "2024-03-31")   # price at the end of that day
+    history.trend(product_id)                # [(time, price), ...]
+
+CLINIC_PRICE_HISTORY sets the file (default clinic_data.prices.jsonl).
+"""
+
+import json
+import os
+import threading
+from bisect import bisect_right
+from datetime import datetime
+
+DEFAULT_FILE = os.environ.get("CLINIC_PRICE_HISTORY", "clinic_data.prices.jsonl")
+SPARK_CHARS = "▁▂▃▄▅▆▇█"
+
+
+def _time_key(when):
+    """Comparable timestamp for a datetime, date or string; a bare date means the end of that day"""
+    if isinstance(when, datetime):
+        return when.strftime("%Y-%m-%d %H:%M:%S")
+    when = str(when)
+    return f"{when}\uffff" if len(when) == 10 else when
+
+
+class PriceHistory:
+    """One history file plus in-memory offsets of its lines by product and by source"""
+
+    def __init__(self, path=DEFAULT_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._end = None  # bytes indexed so far (None until the first scan)
+        self._products = {}  # product id -> ([times], [offsets])
+        self._sources = {}  # source -> [offsets]
+
+    # --- Index ---
+    def _index_line(self, offset, line):
+        entry = json.loads(line)
+        times, offsets = self._products.setdefault(entry["id"], ([], []))
+        # Lines are appended in time order, so these lists stay sorted
+        times.append(entry["t"])
+        offsets.append(offset)
+        self._sources.setdefault(entry.get("src") or "", []).append(offset)
+
+    def _catch_up(self):
+        """Index lines appended since the last call (caller holds the lock)"""
+        if self._end is None:
+            self._end = 0
+            self._cut_torn_line()
+        try:
+            f = open(self.path, "rb")
+        except FileNotFoundError:
+            return
+        with f:
+            f.seek(self._end)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # still being written
+                self._index_line(self._end, line)
+                self._end += len(line)
+
+    def _cut_torn_line(self):
+        """A crash can leave half a line at the end; cut it off before appending after it"""
+        try:
+            with open(self.path, "r+b") as f:
+                size = f.seek(0, os.SEEK_END)
+                if size == 0:
+                    return
+                f.seek(max(0, size - 1))
+                if f.read(1) == b"\n":
+                    return
+                f.seek(0)
+                data = f.read()
+                f.truncate(data.rfind(b"\n") + 1)
+        except FileNotFoundError:
+            pass
+
+    def _read(self, offsets):
+        if not offsets:
+            return []
+        with open(self.path, "rb") as f:
+            entries = []
+            for offset in offsets:
+                f.seek(offset)
+                entries.append(json.loads(f.readline()))
+            return entries
+
+    # --- Writing ---
+    def record_many(self, changes, user=None, when=None):
+        """Append (product id, source, old price, new price) changes in one write"""
+        stamp = _time_key(when or datetime.now())
+        lines = [
+            json.dumps({"t": stamp, "id": product_id, "src": source, "old": old, "new": new, "user": user},
+                       ensure_ascii=False) + "\n"
+            for product_id, source, old, new in changes
+            if old != new
+        ]
+        if not lines:
+            return 0
+        with self._lock:
+            self._catch_up()
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, "".join(lines).encode("utf-8"))
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+            self._catch_up()
+        return len(lines)
+
+    def record(self, product_id, source, old, new, user=None, when=None):
+        """Append one price change (nothing is written if the price did not change)"""
+        return self.record_many([(product_id, source, old, new)], user, when) == 1
+
+    # --- Queries ---
+    def entries(self, product_id):
+        """Every recorded change of one product, oldest first"""
+        with self._lock:
+            self._catch_up()
+            offsets = list(self._products.get(product_id, ((), ()))[1])
+        return self._read(offsets)
+
+    def source_entries(self, source, since=None):
+        """Every recorded change of the products from one source, oldest first"""
+        with self._lock:
+            self._catch_up()
+            offsets = list(self._sources.get(source, ()))
+        entries = self._read(offsets)
+        if since is not None:
+            since = str(since)
+            entries = [entry for entry in entries if entry["t"] >= since]
+        return entries
+
+    def as_of(self, product_id, when):
+        """The price product_id had at when, or None if no change of it is recorded"""
+        with self._lock:
+            self._catch_up()
+            times, offsets = self._products.get(product_id, ((), ()))
+            if not times:
+                return None
+            position = bisect_right(times, _time_key(when))
+            offset = offsets[max(position - 1, 0)]
+        entry = self._read([offset])[0]
+        # Before the first recorded change, the price was that change's old price
+        return entry["new"] if position else entry["old"]
+
+    def trend(self, product_id):
+        """[(time, price), ...]: the price before the first recorded change, then after each one"""
+        entries = self.entries(product_id)
+        if not entries:
+            return []
+        return [(entries[0]["t"], entries[0]["old"])] + [(entry["t"], entry["new"]) for entry in entries]
+
+    def source_trend(self, source, since=None):
+        """[(day, average % change), ...] across the products from one source"""
+        days = {}
+        for entry in self.source_entries(source, since):
+            if entry["old"]:
+                days.setdefault(entry["t"][:10], []).append((entry["new"] - entry["old"]) / entry["old"] * 100)
+        return [(day, round(sum(changes) / len(changes), 2)) for day, changes in sorted(days.items())]
+
+
+def sparkline(values):
+    """A row of block characters tracing values"""
+    values = [float(value) for value in values]
+    if not values:
+        return ""
+    low, high = min(values), max(values)
+    if high == low:
+        return SPARK_CHARS[len(SPARK_CHARS) // 2] * len(values)
+    scale = (len(SPARK_CHARS) - 1) / (high - low)
+    return "".join(SPARK_CHARS[round((value - low) * scale)] for value in values)
+
+
+_histories = {}
+_histories_lock = threading.Lock()
+
+
+def shared(path=DEFAULT_FILE):
+    """Return the process-wide history for path"""
+    key = os.path.abspath(path)
+    with _histories_lock:
+        if key not in _histories:
+            _histories[key] = PriceHistory(path)
+        return _histories[key]
@@ -0,0 +1,192 @@
+"""
+Remote catalog fetched over HTTP (the GitHub copy used on Streamlit Cloud).
+
+The last good catalog is served from memory for every session and every
+rerun. Once it is older than the TTL, a background thread revalidates it with
+If-None-Match / If-Modified-Since, so an unchanged catalog costs a 304 and no
+download, and nobody waits on the network while it happens. Requests use a
+strict timeout; if one fails, the old copy keeps being served and the fetch
+is retried RETRY_SECONDS later.
+
+Every successful download is also saved to disk, so a restarted server
+starts from that copy instantly and revalidates in the background. Only a
+cold start with no saved copy waits for the network, once per process.
+
+    catalog = remote_catalog.shared(url).get()
+
+prepare, if given, is applied to each downloaded (or saved) catalog once,
+before it is served; the disk copy keeps the catalog as downloaded.
+
+CLINIC_REMOTE_TTL (seconds, default 60), CLINIC_REMOTE_TIMEOUT (seconds,
+default 5) and CLINIC_REMOTE_CACHE (default clinic_data.remote.json)
+configure the shared loaders.
+"""
+
+import json
+import os
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import catalog_cache
+import perf
+
+DEFAULT_TTL = float(os.environ.get("CLINIC_REMOTE_TTL", 60))
+DEFAULT_TIMEOUT = float(os.environ.get("CLINIC_REMOTE_TIMEOUT", 5))
+DEFAULT_CACHE_FILE = os.environ.get("CLINIC_REMOTE_CACHE", "clinic_data.remote.json")
+RETRY_SECONDS = 10
+
+
+class RemoteCatalog:
+    """One URL's catalog, revalidated in the background once older than ttl"""
+
+    def __init__(self, url, cache_path=None, ttl=DEFAULT_TTL, timeout=DEFAULT_TIMEOUT, required_key="products",
+                 prepare=None):
+        self.url = url
+        self.prepare = prepare or (lambda data: data)
+        self.required_key = required_key  # a response without it is an error page, not a catalog
+        self.cache_path = cache_path
+        self.ttl = ttl
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._fetch_lock = threading.Lock()  # one request at a time
+        self._data = None
+        self._etag = None
+        self._last_modified = None
+        self._checked_at = None  # time.monotonic() of the last answer from the server
+        self._retry_at = 0.0
+        self._refreshing = False
+        self.last_error = None
+        self.fetches = 0
+        self.not_modified = 0
+        self.bytes = 0
+        self._load_saved()
+
+    # --- Disk copy ---
+    def _load_saved(self):
+        """Start from the copy saved by an earlier process, if it is for this URL"""
+        if not self.cache_path:
+            return
+        try:
+            saved = catalog_cache.read_json(self.cache_path)
+        except (OSError, ValueError):
+            return
+        if not isinstance(saved, dict) or saved.get("url") != self.url or saved.get("catalog") is None:
+            return
+        self._data = catalog_cache.freeze(self.prepare(saved["catalog"]))
+        self._etag = saved.get("etag")
+        self._last_modified = saved.get("last_modified")
+
+    def _save(self, data, etag, last_modified):
+        if not self.cache_path:
+            return
+        try:
+            catalog_cache.write_json_atomic(self.cache_path, {
+                "url": self.url,
+                "etag": etag,
+                "last_modified": last_modified,
+                "catalog": data,
+            })
+        except OSError as e:
+            self.last_error = f"could not save {self.cache_path}: {e}"
+
+    # --- Fetching ---
+    def refresh(self):
+        """Revalidate with the server now; returns True if a new catalog was downloaded"""
+        with self._fetch_lock:
+            return self._fetch()
+
+    def _fetch(self):
+        """One conditional request (caller holds the fetch lock)"""
+        request = urllib.request.Request(self.url, headers={"Accept-Encoding": "identity"})
+        with self._lock:
+            if self._data is not None:
+                if self._etag:
+                    request.add_header("If-None-Match", self._etag)
+                if self._last_modified:
+                    request.add_header("If-Modified-Since", self._last_modified)
+        try:
+            try:
+                with perf.span("remote_fetch") as span:
+                    with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                        body = response.read()
+                        etag = response.headers.get("ETag")
+                        last_modified = response.headers.get("Last-Modified")
+                    span.note(bytes=len(body))
+            except urllib.error.HTTPError as e:
+                if e.code != 304:
+                    raise
+                with self._lock:
+                    self._checked_at = time.monotonic()
+                    self.not_modified += 1
+                    self.last_error = None
+                return False
+            data = json.loads(body.decode("utf-8"))
+            if not isinstance(data, dict) or self.required_key not in data:
+                raise ValueError(f"response has no {self.required_key!r}")
+        except (OSError, ValueError) as e:
+            # URLError, HTTPError and socket timeouts are all OSErrors
+            with self._lock:
+                self.last_error = str(e)
+                self._retry_at = time.monotonic() + RETRY_SECONDS
+            return False
+
+        with self._lock:
+            self.fetches += 1
+            self.bytes += len(body)
+            self.last_error = None
+            self._checked_at = time.monotonic()
+            self._etag = etag
+            self._last_modified = last_modified
+            # Same content without validators: keep the old object so indexes see no change
+            prepared = self.prepare(data)
+            changed = prepared != self._data
+            if changed:
+                self._data = catalog_cache.freeze(prepared)
+        self._save(data, etag, last_modified)
+        return changed
+
+    def _refresh_in_background(self):
+        try:
+            self.refresh()
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def get(self):
+        """Return the last good catalog (or None), revalidating in the background when stale"""
+        with self._lock:
+            data = self._data
+            now = time.monotonic()
+            stale = (self._checked_at is None or now - self._checked_at >= self.ttl) and now >= self._retry_at
+            start = data is not None and stale and not self._refreshing
+            if start:
+                self._refreshing = True
+        if start:
+            threading.Thread(target=self._refresh_in_background, name="remote-catalog-refresh", daemon=True).start()
+        if data is None and stale:
+            # Nothing to serve yet: fetch inline, once, bounded by the timeout
+            with self._fetch_lock:
+                if self._data is None and time.monotonic() >= self._retry_at:
+                    self._fetch()
+            return self._data
+        return data
+
+    def stats(self):
+        with self._lock:
+            age = None if self._checked_at is None else time.monotonic() - self._checked_at
+            return {"fetches": self.fetches, "not_modified": self.not_modified, "bytes": self.bytes, "age": age,
+                    "etag": self._etag, "error": self.last_error}
+
+
+_loaders = {}
+_loaders_lock = threading.Lock()
+
+
+def shared(url, cache_path=DEFAULT_CACHE_FILE, prepare=None):
+    """Return the process-wide loader for url"""
+    with _loaders_lock:
+        if url not in _loaders:
+            _loaders[url] = RemoteCatalog(url, cache_path, prepare=prepare)
+        return _loaders[url]
@@ -0,0 +1,197 @@
+"""
+Read-only catalog snapshots: a small manifest plus one gzip shard per category.
+
+"Upload to Cloud" publishes the catalog into SNAPSHOT_DIR:
+
+    snapshot/manifest.json                 sources and, per category, its shard
+    snapshot/shards/<content hash>.json.gz  one category's products
+
+User accounts are never published. A shard is named by the hash of its
+contents, so it never changes once written: clients keep shards forever and
+only re-check the manifest (revalidated through remote_catalog, so an
+unchanged manifest is a 304). Editing one category publishes one new shard;
+the rest stay the same files, and a client downloads only the new shard, and
+only if it has opened that category.
+
+    client = snapshot.shared_client(manifest_url)
+    catalog = client.get(["填充"])  # loads that category's shard if needed
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import posixpath
+import threading
+import urllib.request
+from datetime import datetime
+
+import catalog_cache
+import perf
+import remote_catalog
+
+SNAPSHOT_DIR = "snapshot"
+MANIFEST = "manifest.json"
+FORMAT = 1
+DEFAULT_CACHE_DIR = os.environ.get("CLINIC_SNAPSHOT_CACHE", ".snapshot_cache")
+
+
+def encode_products(products):
+    """Canonical JSON for a category's products (what the shard hash covers)"""
+    return json.dumps(products, ensure_ascii=False, sort_keys=True, separators=(",", ":")).encode("utf-8")
+
+
+def shard_name(raw):
+    return f"shards/{hashlib.sha256(raw).hexdigest()[:20]}.json.gz"
+
+
+# --- Publishing ---
+def publish(data, directory=SNAPSHOT_DIR):
+    """Write the snapshot of data into directory; returns (manifest, number of new shards)"""
+    os.makedirs(os.path.join(directory, "shards"), exist_ok=True)
+    manifest_path = os.path.join(directory, MANIFEST)
+    try:
+        previous = catalog_cache.read_json(manifest_path)
+    except (OSError, ValueError):
+        previous = {}
+
+    categories = {}
+    written = 0
+    for category, products in data.get("products", {}).items():
+        if not isinstance(products, list):
+            continue
+        raw = encode_products(products)
+        name = shard_name(raw)
+        path = os.path.join(directory, *name.split("/"))
+        if not os.path.exists(path):
+            # mtime=0 keeps the compressed bytes identical for identical contents
+            with open(f"{path}.tmp", "wb") as f:
+                f.write(gzip.compress(raw, mtime=0))
+            os.replace(f"{path}.tmp", path)
+            written += 1
+        categories[category] = {"shard": name, "products": len(products), "bytes": os.path.getsize(path)}
+
+    manifest = {
+        "format": FORMAT,
+        "published": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "sources": list(data.get("sources", [])),
+        "categories": categories,
+    }
+    if previous.get("categories") != categories or previous.get("sources") != manifest["sources"]:
+        catalog_cache.write_json_atomic(manifest_path, manifest)
+    else:
+        manifest = previous
+
+    # Keep the previous manifest's shards so clients halfway through a refresh still find them
+    keep = {entry["shard"] for entry in categories.values()}
+    keep.update(entry.get("shard") for entry in previous.get("categories", {}).values())
+    for filename in os.listdir(os.path.join(directory, "shards")):
+        if f"shards/{filename}" not in keep:
+            os.remove(os.path.join(directory, "shards", filename))
+    return manifest, written
+
+
+# --- Reading ---
+class SnapshotClient:
+    """Catalog assembled from a published snapshot, one category shard at a time"""
+
+    def __init__(self, manifest_url, cache_dir=DEFAULT_CACHE_DIR, ttl=remote_catalog.DEFAULT_TTL,
+                 timeout=remote_catalog.DEFAULT_TIMEOUT):
+        self.manifest_url = manifest_url
+        self.cache_dir = cache_dir
+        self.timeout = timeout
+        manifest_copy = os.path.join(cache_dir, MANIFEST) if cache_dir else None
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+        self.manifest = remote_catalog.RemoteCatalog(manifest_url, manifest_copy, ttl=ttl, timeout=timeout,
+                                                     required_key="categories")
+        self._lock = threading.Lock()
+        self._shards = {}  # shard name -> frozen product list
+        self._opened = set()  # categories asked for so far; they stay loaded as the manifest moves on
+        self._assembled = (None, None, None)  # (manifest, shard names, catalog)
+        self.shard_bytes = 0
+
+    def _read_shard(self, name, raw_gz):
+        raw = gzip.decompress(raw_gz)
+        if shard_name(raw) != name:
+            raise ValueError(f"shard {name} does not match its hash")
+        return catalog_cache.freeze(json.loads(raw.decode("utf-8")))
+
+    def _shard(self, name):
+        """The products in shard name, from memory, the disk cache or the server"""
+        if name in self._shards:
+            return self._shards[name]
+        local = os.path.join(self.cache_dir, *name.split("/")) if self.cache_dir else None
+        products = None
+        if local and os.path.exists(local):
+            try:
+                with open(local, "rb") as f:
+                    products = self._read_shard(name, f.read())
+            except (OSError, ValueError):
+                products = None
+        if products is None:
+            url = posixpath.join(posixpath.dirname(self.manifest_url), name)
+            with perf.span("snapshot_shard") as span:
+                with urllib.request.urlopen(url, timeout=self.timeout) as response:
+                    raw_gz = response.read()
+                span.note(bytes=len(raw_gz))
+            products = self._read_shard(name, raw_gz)
+            self.shard_bytes += len(raw_gz)
+            if local:
+                os.makedirs(os.path.dirname(local), exist_ok=True)
+                with open(f"{local}.tmp", "wb") as f:
+                    f.write(raw_gz)
+                os.replace(f"{local}.tmp", local)
+        self._shards[name] = products
+        return products
+
+    def get(self, categories=None):
+        """Return the catalog with categories (None = all) loaded, or None without a manifest
+
+        Categories opened earlier stay in the result, so indexes over it are
+        not rebuilt when a session switches back and forth. A shard that
+        cannot be fetched keeps its category out until a later call.
+        """
+        manifest = self.manifest.get()
+        if manifest is None:
+            return None
+        entries = manifest["categories"]
+        with self._lock:
+            self._opened.update(entries if categories is None else categories)
+            products = {}
+            for category in entries:
+                if category not in self._opened:
+                    continue
+                try:
+                    products[category] = self._shard(entries[category]["shard"])
+                except (OSError, ValueError) as e:
+                    self.manifest.last_error = f"shard for {category}: {e}"
+            # Same manifest and shards: hand back the same object so nothing downstream resyncs
+            names = tuple(entries[category]["shard"] for category in products)
+            if self._assembled[0] is manifest and self._assembled[1] == names:
+                return self._assembled[2]
+            catalog = catalog_cache.FrozenDict(
+                products=catalog_cache.FrozenDict(products),
+                sources=manifest.get("sources", catalog_cache.FrozenList()),
+            )
+            # Drop shards no longer referenced by the manifest
+            live = {entry["shard"] for entry in entries.values()}
+            for name in [name for name in self._shards if name not in live]:
+                del self._shards[name]
+            self._assembled = (manifest, names, catalog)
+            return catalog
+
+    def stats(self):
+        return {**self.manifest.stats(), "shard_bytes": self.shard_bytes, "shards": len(self._shards)}
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def shared_client(manifest_url):
+    """Return the process-wide snapshot client for manifest_url"""
+    with _clients_lock:
+        if manifest_url not in _clients:
+            _clients[manifest_url] = SnapshotClient(manifest_url)
+        return _clients[manifest_url]
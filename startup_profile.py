@@ -0,0 +1,129 @@
+"""
+Cold-start profile of the two apps
+Run this with: python startup_profile.py [--budget [SECONDS]] [--runs N] [app.py ...]
+
+Each run starts a fresh Python process, the way a new server container does:
+it imports Streamlit, then renders the app script once (the first render) and
+once more (a warm rerun) through Streamlit's AppTest, with the catalog in
+this folder. admin_app.py is rendered logged in as admin. The report shows
+each phase, the median over the runs, and the slowest imports made by the
+first render.
+
+With --budget, the exit code is 1 when importing Streamlit plus the first
+render of any app takes longer than that many seconds (COLD_START_BUDGET if
+no number is given), so this doubles as the cold-start regression check.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+APPS = {
+    "user_app.py": {},
+    "admin_app.py": {"authenticated": True, "user_role": "admin", "username": "admin"},
+}
+COLD_START_BUDGET = 2.5  # seconds; both apps take about 1s on a laptop
+MARKER = "startup_profile:"
+
+# Runs in the child process: argv[1] is the app, argv[2] the session state as JSON
+CHILD = """
+import json, sys, time
+started = time.perf_counter()
+import streamlit
+imported = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+app = AppTest.from_file(sys.argv[1], default_timeout=60)
+state = json.loads(sys.argv[2])
+if state.get("username"):
+    import credentials
+    state["auth_token"] = credentials.shared().session_for(state["username"])["token"]
+for key, value in state.items():
+    app.session_state[key] = value
+print("%s render" % sys.argv[3], file=sys.stderr, flush=True)
+before = time.perf_counter()
+app.run()
+first = time.perf_counter() - before
+print("%s rerun" % sys.argv[3], file=sys.stderr, flush=True)
+before = time.perf_counter()
+app.run()
+rerun = time.perf_counter() - before
+print(json.dumps({
+    "import": imported - started,
+    "first": first,
+    "rerun": rerun,
+    "errors": [str(e.value) for e in app.exception],
+    "pandas": "pandas" in sys.modules,
+}))
+"""
+
+
+def slowest_imports(stderr, count=5):
+    """Top-level modules imported during the first render, slowest first, from -X importtime output"""
+    imports = []
+    rendering = False
+    for line in stderr.splitlines():
+        if line.startswith(MARKER):
+            rendering = line.endswith("render")
+            continue
+        if not rendering or not line.startswith("import time:") or "self [us]" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        # -X importtime indents nested imports by two more spaces after the separator space
+        if name[1:].startswith(" "):
+            continue
+        imports.append((int(cumulative) / 1e6, name.strip()))
+    return sorted(imports, reverse=True)[:count]
+
+
+def profile(app, session_state):
+    """One cold start of app in a fresh interpreter"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", CHILD, app, json.dumps(session_state), MARKER],
+        cwd=HERE, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"{app} failed to start:\n{result.stderr[-2000:]}")
+    timings = json.loads(result.stdout.strip().splitlines()[-1])
+    timings["slowest"] = slowest_imports(result.stderr)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold-start profile of the Streamlit apps")
+    parser.add_argument("apps", nargs="*", default=list(APPS))
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--budget", type=float, nargs="?", const=COLD_START_BUDGET,
+                        help=f"fail if import + first render takes longer (default {COLD_START_BUDGET}s)")
+    args = parser.parse_args()
+
+    failed = []
+    for app in args.apps:
+        runs = [profile(app, APPS.get(app, {})) for _ in range(args.runs)]
+        phases = {phase: statistics.median(run[phase] for run in runs) for phase in ("import", "first", "rerun")}
+        cold = statistics.median(run["import"] + run["first"] for run in runs)
+        print(f"📦 {app} (median of {args.runs})")
+        print(f"   import streamlit  {phases['import']:.3f}s")
+        print(f"   first render      {phases['first']:.3f}s")
+        print(f"   warm rerun        {phases['rerun']:.3f}s")
+        print(f"   cold start        {cold:.3f}s" + (f" (budget {args.budget:.1f}s)" if args.budget else ""))
+        print(f"   pandas loaded     {'yes' if runs[-1]['pandas'] else 'no'}")
+        for seconds, module in runs[-1]["slowest"]:
+            print(f"     {seconds:.3f}s  import {module}")
+        for error in runs[-1]["errors"]:
+            print(f"   ❌ {error}")
+        if runs[-1]["errors"]:
+            failed.append(app)
+        if args.budget and cold > args.budget:
+            print(f"   ❌ cold start is over the {args.budget:.1f}s budget")
+            failed.append(app)
+        elif args.budget:
+            print("   ✅ within budget")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+Stylesheets kept in static/ and added to the page once per session.
+
+Each stylesheet is read from disk once per process. Linking it through
+Streamlit's static file serving is not an option: app/static/ serves .css
+as text/plain with nosniff on the Streamlit versions requirements.txt
+allows, and browsers refuse that as a stylesheet.
+
+A <style> element rendered with st.markdown would have to be sent again on
+every rerun, since Streamlit drops elements a rerun does not render. So the
+first run of a session sends a one-pixel component whose script copies the
+stylesheet into the page's <head> instead; it stays there after the
+component itself is dropped, and later reruns send nothing.
+"""
+
+import json
+import os
+
+import streamlit as st
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+SENT_KEY = "_stylesheets_sent"
+
+_stylesheets = {}  # filename -> <script> markup that adds it to the page
+
+
+def _stylesheet(filename):
+    if filename not in _stylesheets:
+        with open(os.path.join(STATIC_DIR, filename), encoding="utf-8") as f:
+            # Escaped so a "</" in the CSS cannot end the script early
+            css = json.dumps(f.read()).replace("</", "<\\/")
+        element_id = json.dumps(f"static-{filename}")
+        _stylesheets[filename] = (
+            "<script>\n"
+            "const doc = window.parent.document;\n"
+            f"if (!doc.getElementById({element_id})) {{\n"
+            "  const style = doc.createElement('style');\n"
+            f"  style.id = {element_id};\n"
+            f"  style.textContent = {css};\n"
+            "  doc.head.appendChild(style);\n"
+            "}\n"
+            "</script>"
+        )
+    return _stylesheets[filename]
+
+
+def use_stylesheet(filename):
+    """Apply static/filename to the page; only the session's first run sends it"""
+    sent = st.session_state.setdefault(SENT_KEY, set())
+    if filename in sent:
+        return
+    if hasattr(st, "iframe"):
+        st.iframe(_stylesheet(filename), height=1)  # 0 is not allowed
+    else:  # Streamlit before st.iframe
+        import streamlit.components.v1 as components
+        components.html(_stylesheet(filename), height=0)
+    sent.add(filename)
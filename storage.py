@@ -0,0 +1,929 @@
+"""
+Pluggable storage backends for the clinic catalog.
+
+The backend is chosen with the CLINIC_STORAGE environment variable:
+
+    json    clinic_data.json, rewritten in full on every change (default)
+    sqlite  clinic_data.db (or CLINIC_DB_FILE), one indexed table per
+            record type, running in WAL mode so readers never block the
+            admin writer
+    journal clinic_data.json as a base snapshot plus an append-only
+            clinic_data.json.journal; each change appends one record and the
+            journal is folded into a new snapshot in the background once it
+            grows past CLINIC_JOURNAL_COMPACT_BYTES
+
+Every backend exposes the same methods: load(), save(data), add_product(),
+add_products(), update_product(), update_products(), delete_product(),
+add_source() and export_json(). load() always returns the read-only catalog
+structure used by both apps (see catalog_cache). add_products() and
+update_products() write any number of products (and the sources they need)
+as one atomic commit.
+
+Products are addressed by id. New ids come from new_product_id() and every
+store keeps an id -> (category, record) index current on each write, so
+get_product() is a dictionary lookup.
+
+Product records carry a "rev" number that every write bumps. Passing the
+rev the caller last saw as expected_rev to update_product() or
+delete_product() turns the write into a compare-and-swap: if the record
+changed in the meantime, ConflictError is raised with the fresh record
+instead of silently overwriting it. update_products() checks every record
+the same way and writes none of them if any one is stale.
+
+Import an existing clinic_data.json into SQLite with:
+
+    python storage.py migrate [clinic_data.json] [clinic_data.db]
+"""
+
+import json
+import os
+import queue
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from contextlib import ExitStack, contextmanager
+
+import catalog_cache
+import perf
+from catalog_cache import freeze, thaw
+
+PRODUCT_FIELDS = ["id", "name", "source", "is_genuine", "price", "unit", "date_added", "rev"]
+RECORD_LOCK_STRIPES = 64
+
+
+class ConflictError(Exception):
+    """A product changed after the caller read it; .current is the fresh record (None if deleted)"""
+
+    def __init__(self, product_id, current):
+        super().__init__(f"Product {product_id} was changed by someone else")
+        self.product_id = product_id
+        self.current = current
+
+
+def check_revision(product_id, current, expected_rev):
+    """Raise ConflictError (or KeyError without expected_rev) unless current is at expected_rev"""
+    if current is None:
+        if expected_rev is None:
+            raise KeyError(product_id)
+        raise ConflictError(product_id, None)
+    if expected_rev is not None and current.get("rev", 0) != expected_rev:
+        raise ConflictError(product_id, current)
+
+
+def find_product(data, category, product_id):
+    """Return the product with product_id in category, or None (scans; stores use get_product())"""
+    for product in (data or {}).get("products", {}).get(category, []):
+        if product.get("id") == product_id:
+            return product
+    return None
+
+
+# --- Product ids ---
+_ID_ALPHABET = "0123456789abcdefghjkmnpqrstvwxyz"  # Crockford base32, in sort order
+_id_lock = threading.Lock()
+_id_last_ms = 0
+_id_counter = 0
+
+
+def new_product_id():
+    """Return a compact, time-sortable, collision-free product id
+
+    16 lowercase base32 characters: 48 bits of creation time in milliseconds
+    followed by a 30-bit counter that starts at a random value each
+    millisecond and counts up within it. Ids from one process never repeat
+    and sort by creation time; ids from different processes would have to
+    share both the millisecond and the random start to collide.
+    """
+    global _id_last_ms, _id_counter
+    with _id_lock:
+        now = int(time.time() * 1000)
+        if now > _id_last_ms:
+            _id_last_ms = now
+            _id_counter = int.from_bytes(os.urandom(4), "big") >> 3
+        else:
+            _id_counter += 1
+            if _id_counter >= 1 << 30:
+                _id_last_ms += 1
+                _id_counter = 0
+        value = (_id_last_ms << 30) | _id_counter
+    chars = []
+    for _ in range(16):
+        chars.append(_ID_ALPHABET[value & 31])
+        value >>= 5
+    return "".join(reversed(chars))
+
+
+# --- Format helpers ---
+def normalize_catalog(data):
+    """Return a mutable copy of data with the top-level containers present"""
+    data = thaw(data)
+    data.setdefault("products", {})
+    data.setdefault("sources", [])
+    return data
+
+
+def check_current(data):
+    """Raise ValueError unless every category is a list of products with unique ids (migrations upgrades older catalogs)"""
+    seen_ids = set()
+    for category, products in data.get("products", {}).items():
+        if not isinstance(products, (list, tuple)):
+            raise ValueError(f"Category {category!r} is not in list format; run python migrations.py upgrade")
+        for product in products:
+            if not product.get("id") or product["id"] in seen_ids:
+                raise ValueError(f"Product {product.get('name')!r} in {category!r} has a missing or duplicate id")
+            seen_ids.add(product["id"])
+
+
+# --- Change records ---
+# Every write is described by one change record (the dicts the journal
+# backend appends); a "batch" record wraps several that commit together. All
+# backends use them to patch the shared cached catalog and the id index
+# instead of rebuilding either from scratch.
+def change_record(op, **fields):
+    return freeze({"op": op, **fields})
+
+
+def batch_record(records):
+    return change_record("batch", records=list(records))
+
+
+def _add_products_record(items, sources):
+    """One batch adding sources and then (category, product) items, each product at rev 1"""
+    return batch_record(
+        [change_record("add_source", source=source) for source in sources]
+        + [change_record("add_product", category=category, product={**product, "rev": 1})
+           for category, product in items]
+    )
+
+
+def record_categories(record):
+    """Categories a change record touches"""
+    if record["op"] == "batch":
+        return {category for r in record["records"] for category in record_categories(r)}
+    return {record["category"]} if "category" in record else set()
+
+
+def _apply_updates(data, updates):
+    """Replace products from {category: {id: product}} with one pass over each category"""
+    for category, replaced in updates.items():
+        products = data["products"].setdefault(category, [])
+        for idx, existing in enumerate(products):
+            product = replaced.get(existing.get("id"))
+            if product is not None:
+                products[idx] = product
+    updates.clear()
+
+
+def apply_record(data, record):
+    """Apply one change record to a catalog whose touched containers are mutable"""
+    op = record["op"]
+    if op == "batch":
+        # Runs of updates are applied together, so a batch costs one scan per category
+        updates = {}
+        for r in record["records"]:
+            if r["op"] == "update_product":
+                updates.setdefault(r["category"], {})[r["id"]] = r["product"]
+            else:
+                _apply_updates(data, updates)
+                apply_record(data, r)
+        _apply_updates(data, updates)
+        return
+    if op == "add_source":
+        if record["source"] not in data["sources"]:
+            data["sources"].append(record["source"])
+        return
+    products = data["products"].setdefault(record["category"], [])
+    if op == "add_product":
+        products.append(record["product"])
+    elif op == "update_product":
+        for idx, existing in enumerate(products):
+            if existing.get("id") == record["id"]:
+                products[idx] = record["product"]
+                break
+    elif op == "delete_product":
+        products[:] = [p for p in products if p.get("id") != record["id"]]
+    else:
+        raise ValueError(f"Unknown change record: {op}")
+
+
+def editable_copy(data, categories=()):
+    """Shallow copy of a frozen catalog with only the containers a change touches made mutable"""
+    data = dict(data)
+    data["sources"] = list(data.get("sources", []))
+    data["products"] = dict(data.get("products", {}))
+    for category in categories:
+        data["products"][category] = list(data["products"].get(category, []))
+    return data
+
+
+def patch_catalog(data, record):
+    """Return a new catalog with record applied, sharing every untouched part with data"""
+    data = editable_copy(data, record_categories(record))
+    apply_record(data, record)
+    return data
+
+
+def build_id_index(data):
+    """Map every product id to (category, record)"""
+    index = {}
+    for category, products in (data or {}).get("products", {}).items():
+        if isinstance(products, list):
+            for product in products:
+                index[product.get("id")] = (category, product)
+    return index
+
+
+def update_id_index(index, record):
+    """Apply one change record to an id index"""
+    op = record["op"]
+    if op == "batch":
+        for r in record["records"]:
+            update_id_index(index, r)
+    elif op in ("add_product", "update_product"):
+        index[record["product"]["id"]] = (record["category"], record["product"])
+    elif op == "delete_product":
+        index.pop(record["id"], None)
+
+
+class Store:
+    """Behaviour shared by every backend"""
+
+    def __init__(self, path):
+        self.path = path
+        self._index_lock = threading.Lock()
+        self._index = {}
+        self._indexed = None
+
+    def _id_index(self):
+        """The id index of the current catalog"""
+        data = self.load()
+        with self._index_lock:
+            if self._indexed is not data:
+                self._index = build_id_index(data)
+                self._indexed = data
+            return self._index
+
+    def get_product(self, product_id):
+        """Return (category, record) for product_id, or None, without scanning the catalog"""
+        return self._id_index().get(product_id)
+
+    def _current(self, category, product_id):
+        """Return the current record for product_id if it is in category"""
+        found = self.get_product(product_id)
+        return found[1] if found and found[0] == category else None
+
+    def _update_products_record(self, changes):
+        """One batch for (category, id, product, expected_rev) changes; ConflictError if any is stale"""
+        index = self._id_index()
+        records = []
+        for category, product_id, product, expected_rev in changes:
+            found = index.get(product_id)
+            current = found[1] if found and found[0] == category else None
+            check_revision(product_id, current, expected_rev)
+            records.append(change_record("update_product", category=category, id=product_id,
+                                         product={**product, "id": product_id, "rev": current.get("rev", 0) + 1}))
+        return batch_record(records)
+
+    def _publish(self, key, old, data, record):
+        """Cache data (old with record applied) under key and move the id index along"""
+        data = catalog_cache.cache_for(self.path).put(key, data)
+        with self._index_lock:
+            if old is not None and self._indexed is old:
+                update_id_index(self._index, record)
+                self._indexed = data
+        return data
+
+    def export_json(self, path):
+        """Write the current catalog to a JSON file (the format the cloud copy uses)"""
+        return catalog_cache.save_json(path, self.load() or {})
+
+
+# --- JSON backend ---
+class JsonStore(Store):
+    """The original single-document clinic_data.json storage"""
+
+    name = "json"
+
+    def __init__(self, path):
+        super().__init__(path)
+        self._write_lock = threading.Lock()
+
+    def load(self):
+        return catalog_cache.load_json(self.path)
+
+    def save(self, data):
+        check_current(data)
+        with self._write_lock:
+            return catalog_cache.save_json(self.path, data)
+
+    def _commit(self, record):
+        """Rewrite the file with one change applied (caller holds the write lock)"""
+        with perf.span("store_write") as span:
+            old = self.load() or normalize_catalog({})
+            data = patch_catalog(old, record)
+            catalog_cache.write_json_atomic(self.path, data)
+            perf.note_catalog(span, data, self.path)
+            return self._publish(catalog_cache.file_key(self.path), old, data, record)
+
+    # The whole file is rewritten on every change, so writes here share one
+    # lock; the revision check still stops stale edits from overwriting.
+    def add_product(self, category, product):
+        record = change_record("add_product", category=category, product={**product, "rev": 1})
+        with self._write_lock:
+            self._commit(record)
+        return record["product"]
+
+    def update_product(self, category, product_id, product, expected_rev=None):
+        with self._write_lock:
+            current = self._current(category, product_id)
+            check_revision(product_id, current, expected_rev)
+            record = change_record("update_product", category=category, id=product_id,
+                                   product={**product, "id": product_id, "rev": current.get("rev", 0) + 1})
+            self._commit(record)
+        return record["product"]
+
+    def delete_product(self, category, product_id, expected_rev=None):
+        with self._write_lock:
+            current = self._current(category, product_id)
+            if current is None:
+                return
+            check_revision(product_id, current, expected_rev)
+            self._commit(change_record("delete_product", category=category, id=product_id))
+
+    def add_products(self, items, sources=()):
+        record = _add_products_record(items, sources)
+        with self._write_lock:
+            self._commit(record)
+        return [r["product"] for r in record["records"] if r["op"] == "add_product"]
+
+    def update_products(self, changes):
+        with self._write_lock:
+            record = self._update_products_record(changes)
+            self._commit(record)
+        return [r["product"] for r in record["records"]]
+
+    def add_source(self, source):
+        with self._write_lock:
+            self._commit(change_record("add_source", source=source))
+
+
+# --- SQLite backend ---
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS categories (
+    name TEXT PRIMARY KEY,
+    position INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS products (
+    id TEXT PRIMARY KEY,
+    category TEXT NOT NULL,
+    name TEXT NOT NULL,
+    source TEXT,
+    is_genuine INTEGER NOT NULL DEFAULT 1,
+    price REAL NOT NULL DEFAULT 0,
+    unit TEXT,
+    date_added TEXT,
+    extra TEXT,
+    rev INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_products_category ON products (category);
+CREATE INDEX IF NOT EXISTS idx_products_source ON products (source);
+CREATE INDEX IF NOT EXISTS idx_products_is_genuine ON products (is_genuine);
+CREATE INDEX IF NOT EXISTS idx_products_name ON products (name);
+CREATE TABLE IF NOT EXISTS sources (
+    name TEXT PRIMARY KEY,
+    position INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS users (
+    username TEXT PRIMARY KEY,
+    password TEXT NOT NULL
+);
+"""
+
+
+def _product_row(category, product):
+    """Split a product record into table columns plus JSON for unknown fields"""
+    extra = {k: v for k, v in product.items() if k not in PRODUCT_FIELDS}
+    return (
+        product["id"],
+        category,
+        product["name"],
+        product.get("source"),
+        1 if product.get("is_genuine", True) else 0,
+        float(product.get("price", 0)),
+        product.get("unit"),
+        product.get("date_added"),
+        json.dumps(extra, ensure_ascii=False) if extra else None,
+        product.get("rev", 0),
+    )
+
+
+UPDATE_PRODUCT_SQL = (
+    "UPDATE products SET category = ?, name = ?, source = ?, is_genuine = ?, price = ?, "
+    "unit = ?, date_added = ?, extra = ?, rev = rev + 1 WHERE id = ? AND category = ? AND (? IS NULL OR rev = ?)"
+)
+PRODUCT_COLUMNS = "id, name, source, is_genuine, price, unit, date_added, extra, rev"
+SQLITE_MAX_PARAMS = 500
+
+
+def _row_product(row):
+    product_id, name, source, is_genuine, price, unit, date_added, extra, rev = row
+    product = {
+        "id": product_id,
+        "name": name,
+        "source": source,
+        "is_genuine": bool(is_genuine),
+        "price": price,
+        "unit": unit,
+        "date_added": date_added,
+        "rev": rev,
+    }
+    if extra:
+        product.update(json.loads(extra))
+    return product
+
+
+class SqliteStore(Store):
+    """Catalog stored in SQLite tables; each edit touches only its own rows"""
+
+    name = "sqlite"
+
+    def __init__(self, path):
+        super().__init__(path)
+        self._pool = queue.SimpleQueue()
+        with self._connection() as conn:
+            conn.executescript(SQLITE_SCHEMA)
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(products)")]
+            if "rev" not in columns:
+                conn.execute("ALTER TABLE products ADD COLUMN rev INTEGER NOT NULL DEFAULT 0")
+            conn.execute("INSERT OR IGNORE INTO meta VALUES ('store_id', ?)", (uuid.uuid4().hex,))
+            conn.execute("INSERT OR IGNORE INTO meta VALUES ('version', '0')")
+            self._store_id = conn.execute("SELECT value FROM meta WHERE key = 'store_id'").fetchone()[0]
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    @contextmanager
+    def _connection(self):
+        """Borrow a pooled connection (Streamlit runs each rerun on its own thread)"""
+        try:
+            conn = self._pool.get_nowait()
+        except queue.Empty:
+            conn = self._connect()
+        try:
+            yield conn
+        finally:
+            self._pool.put(conn)
+
+    @contextmanager
+    def _transaction(self):
+        """Run a write transaction and bump the catalog version"""
+        with perf.span("store_write"), self._connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+                conn.execute("UPDATE meta SET value = CAST(value AS INTEGER) + 1 WHERE key = 'version'")
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+    def _version(self, conn):
+        return (self._store_id, conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0])
+
+    def _read_all(self, conn):
+        data = {"products": {}, "sources": []}
+        for (category,) in conn.execute("SELECT name FROM categories ORDER BY position"):
+            data["products"][category] = []
+        rows = conn.execute(
+            "SELECT category, id, name, source, is_genuine, price, unit, date_added, extra, rev "
+            "FROM products ORDER BY rowid"
+        )
+        for row in rows:
+            data["products"].setdefault(row[0], []).append(_row_product(row[1:]))
+        data["sources"] = [name for (name,) in conn.execute("SELECT name FROM sources ORDER BY position")]
+        # Accounts from before they moved to the credentials store, until the migration takes them
+        users = dict(conn.execute("SELECT username, password FROM users ORDER BY rowid"))
+        if users:
+            data["users"] = users
+        schema = conn.execute("SELECT value FROM meta WHERE key = 'schema_version'").fetchone()
+        if schema is not None:
+            data["schema_version"] = int(schema[0])
+        return data
+
+    def load(self):
+        with self._connection() as conn:
+            if conn.execute("SELECT 1 FROM categories UNION ALL SELECT 1 FROM sources LIMIT 1").fetchone() is None:
+                return None
+            # Read the version and the rows in one snapshot so the cache key matches the data
+            conn.execute("BEGIN")
+            try:
+                key = self._version(conn)
+                return catalog_cache.cache_for(self.path).get(key, lambda: self._read_all(conn))
+            finally:
+                conn.execute("COMMIT")
+
+    def save(self, data):
+        check_current(data)
+        data = normalize_catalog(data)
+        with self._transaction() as conn:
+            for table in ("categories", "products", "sources", "users"):
+                conn.execute(f"DELETE FROM {table}")
+            conn.executemany(
+                "INSERT INTO categories VALUES (?, ?)",
+                [(category, position) for position, category in enumerate(data["products"])],
+            )
+            conn.executemany(
+                "INSERT OR REPLACE INTO products VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [_product_row(category, product)
+                 for category, products in data["products"].items()
+                 for product in products],
+            )
+            conn.executemany(
+                "INSERT OR IGNORE INTO sources VALUES (?, ?)",
+                [(source, position) for position, source in enumerate(data["sources"])],
+            )
+            conn.executemany("INSERT INTO users VALUES (?, ?)", list(data.get("users", {}).items()))
+            conn.execute("DELETE FROM meta WHERE key = 'schema_version'")
+            if "schema_version" in data:
+                conn.execute("INSERT INTO meta VALUES ('schema_version', ?)", (str(data["schema_version"]),))
+        return self.load()
+
+    def _after_commit(self, version, record):
+        """Patch the cached catalog if it is still at the version this write started from"""
+        old = catalog_cache.cache_for(self.path).peek(version)
+        if old is not None:
+            new_version = (self._store_id, str(int(version[1]) + 1))
+            self._publish(new_version, old, patch_catalog(old, record), record)
+
+    def _ensure_category(self, conn, category):
+        conn.execute(
+            "INSERT OR IGNORE INTO categories SELECT ?, COALESCE(MAX(position) + 1, 0) FROM categories",
+            (category,),
+        )
+
+    def _fetch_product(self, conn, product_id):
+        row = conn.execute(f"SELECT {PRODUCT_COLUMNS} FROM products WHERE id = ?", (product_id,)).fetchone()
+        return _row_product(row) if row else None
+
+    def _fetch_current(self, conn, category, product_id):
+        """The record for product_id if it is in category, like Store._current()"""
+        row = conn.execute(f"SELECT {PRODUCT_COLUMNS} FROM products WHERE id = ? AND category = ?",
+                           (product_id, category)).fetchone()
+        return _row_product(row) if row else None
+
+    def _fetch_products(self, conn, product_ids):
+        """{id: record} for product_ids, a few hundred per query"""
+        found = {}
+        for start in range(0, len(product_ids), SQLITE_MAX_PARAMS):
+            chunk = product_ids[start:start + SQLITE_MAX_PARAMS]
+            rows = conn.execute(f"SELECT {PRODUCT_COLUMNS} FROM products WHERE id IN ({','.join('?' * len(chunk))})",
+                                chunk)
+            for row in rows:
+                found[row[0]] = _row_product(row)
+        return found
+
+    def add_product(self, category, product):
+        record = change_record("add_product", category=category, product={**product, "rev": 1})
+        with self._transaction() as conn:
+            version = self._version(conn)
+            self._ensure_category(conn, category)
+            conn.execute("INSERT INTO products VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                         _product_row(category, record["product"]))
+        self._after_commit(version, record)
+        return record["product"]
+
+    def add_products(self, items, sources=()):
+        record = _add_products_record(items, sources)
+        added = [r for r in record["records"] if r["op"] == "add_product"]
+        with self._transaction() as conn:
+            version = self._version(conn)
+            for source in sources:
+                conn.execute(
+                    "INSERT OR IGNORE INTO sources SELECT ?, COALESCE(MAX(position) + 1, 0) FROM sources",
+                    (source,),
+                )
+            for category in dict.fromkeys(r["category"] for r in added):
+                self._ensure_category(conn, category)
+            conn.executemany("INSERT INTO products VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                             [_product_row(r["category"], r["product"]) for r in added])
+        self._after_commit(version, record)
+        return [r["product"] for r in added]
+
+    def update_product(self, category, product_id, product, expected_rev=None):
+        with self._transaction() as conn:
+            version = self._version(conn)
+            # The WHERE clause is the compare-and-swap: it only matches the revision we expect
+            row = _product_row(category, {**product, "id": product_id})
+            cursor = conn.execute(UPDATE_PRODUCT_SQL, row[1:-1] + (product_id, category, expected_rev, expected_rev))
+            if cursor.rowcount == 0:
+                check_revision(product_id, self._fetch_current(conn, category, product_id), expected_rev)
+            record = change_record("update_product", category=category, id=product_id,
+                                   product=self._fetch_product(conn, product_id))
+        self._after_commit(version, record)
+        return record["product"]
+
+    def update_products(self, changes):
+        changes = list(changes)
+        with self._transaction() as conn:
+            version = self._version(conn)
+            cursor = conn.executemany(UPDATE_PRODUCT_SQL, [
+                _product_row(category, {**product, "id": product_id})[1:-1]
+                + (product_id, category, expected_rev, expected_rev)
+                for category, product_id, product, expected_rev in changes
+            ])
+            if cursor.rowcount != len(changes):
+                # Something was stale or not in its category; find it, and the rollback undoes the rest
+                for category, product_id, product, expected_rev in changes:
+                    check_revision(product_id, self._fetch_current(conn, category, product_id), expected_rev)
+            updated = self._fetch_products(conn, [product_id for _, product_id, _, _ in changes])
+            record = batch_record([change_record("update_product", category=category, id=product_id,
+                                                 product=updated[product_id])
+                                   for category, product_id, _, _ in changes])
+        self._after_commit(version, record)
+        return [r["product"] for r in record["records"]]
+
+    def delete_product(self, category, product_id, expected_rev=None):
+        with self._transaction() as conn:
+            version = self._version(conn)
+            cursor = conn.execute(
+                "DELETE FROM products WHERE id = ? AND category = ? AND (? IS NULL OR rev = ?)",
+                (product_id, category, expected_rev, expected_rev),
+            )
+            if cursor.rowcount == 0:
+                current = self._fetch_current(conn, category, product_id)
+                if current is not None:
+                    raise ConflictError(product_id, current)
+                return
+        self._after_commit(version, change_record("delete_product", category=category, id=product_id))
+
+    def add_source(self, source):
+        with self._transaction() as conn:
+            version = self._version(conn)
+            conn.execute(
+                "INSERT OR IGNORE INTO sources SELECT ?, COALESCE(MAX(position) + 1, 0) FROM sources",
+                (source,),
+            )
+        self._after_commit(version, change_record("add_source", source=source))
+
+
+# --- Journal backend ---
+def read_journal(path):
+    """Return the complete records in a journal and the byte offset where they end
+
+    A crash can leave a half-written last line; it is ignored here and cut
+    off before the next append.
+    """
+    records = []
+    end = 0
+    try:
+        with open(path, 'rb') as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    break
+                end += len(line)
+    except FileNotFoundError:
+        pass
+    return records, end
+
+
+class JournalStore(Store):
+    """Base snapshot plus an append-only change journal, compacted in the background"""
+
+    name = "journal"
+
+    def __init__(self, path, compact_bytes=None):
+        super().__init__(path)
+        self.journal_path = f"{path}.journal"
+        self.compact_bytes = compact_bytes or int(os.environ.get("CLINIC_JOURNAL_COMPACT_BYTES", 1 << 20))
+        self._lock = threading.Lock()
+        self._compact_lock = threading.Lock()
+        self._compacting = False
+        self._seq = None
+        self._fd = None
+        self._record_locks = [threading.Lock() for _ in range(RECORD_LOCK_STRIPES)]
+
+    def _record_lock(self, product_id):
+        """Lock that serializes writers of one product without blocking writers of others"""
+        return self._record_locks[hash(product_id) % RECORD_LOCK_STRIPES]
+
+    def _key(self):
+        return (catalog_cache.file_key(self.path), catalog_cache.file_key(self.journal_path))
+
+    def _read(self):
+        """Replay the journal on top of the snapshot"""
+        for attempt in range(3):
+            base = catalog_cache.read_json(self.path) if os.path.exists(self.path) else {}
+            base_seq = base.pop("journal_seq", 0)
+            records = [r for r in read_journal(self.journal_path)[0] if r["seq"] > base_seq]
+            # A gap means we read the old snapshot and the new journal while a
+            # compaction was swapping them; read both again.
+            if records and records[0]["seq"] != base_seq + 1 and attempt < 2:
+                continue
+            data = normalize_catalog(base)
+            for record in records:
+                apply_record(data, record)
+            return data
+
+    def load(self):
+        key = self._key()
+        if key == (None, None):
+            return None
+        return catalog_cache.cache_for(self.path).get(key, self._read)
+
+    def _recover(self):
+        """Find the last sequence number and cut off a torn final record"""
+        base_seq = 0
+        if os.path.exists(self.path):
+            base_seq = catalog_cache.read_json(self.path).get("journal_seq", 0)
+        records, end = read_journal(self.journal_path)
+        if os.path.exists(self.journal_path) and os.path.getsize(self.journal_path) > end:
+            with open(self.journal_path, 'r+b') as f:
+                f.truncate(end)
+        self._seq = max([base_seq] + [r["seq"] for r in records])
+
+    def _close_journal(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def _append(self, record):
+        """Append one record, apply it to the cached catalog, and fsync it
+
+        Only the append itself is serialized. The fsync runs on a duplicate
+        descriptor outside the lock, so concurrent writers share disk flushes
+        instead of queueing for them, even if a compaction swaps the file.
+        """
+        with perf.span("store_write") as span:
+            with self._lock:
+                old = self.load() or normalize_catalog({})
+                if self._seq is None:
+                    self._recover()
+                if self._fd is None:
+                    self._fd = os.open(self.journal_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+                self._seq += 1
+                record = freeze({"seq": self._seq, **record})
+                line = (json.dumps(record, ensure_ascii=False) + "\n").encode('utf-8')
+                os.write(self._fd, line)
+                sync_fd = os.dup(self._fd)
+                self._publish(self._key(), old, patch_catalog(old, record), record)
+                span.note(bytes=len(line))
+            try:
+                os.fsync(sync_fd)
+                journal_size = os.fstat(sync_fd).st_size
+            finally:
+                os.close(sync_fd)
+        if journal_size > self.compact_bytes:
+            self._start_compaction()
+
+    def _start_compaction(self):
+        with self._lock:
+            if self._compacting:
+                return
+            self._compacting = True
+        threading.Thread(target=self.compact, name="journal-compaction", daemon=True).start()
+
+    def compact(self):
+        """Fold the journal into a new snapshot"""
+        try:
+            with self._compact_lock:
+                with self._lock:
+                    data = self.load() or normalize_catalog({})
+                    if self._seq is None:
+                        self._recover()
+                    seq = self._seq
+                    offset = read_journal(self.journal_path)[1]
+                # The cached catalog is immutable, so it can be written out
+                # while new records keep being appended.
+                catalog_cache.write_json_atomic(self.path, {**data, "journal_seq": seq})
+                with self._lock:
+                    current = catalog_cache.cache_for(self.path).peek()
+                    tmp_path = f"{self.journal_path}.tmp"
+                    with open(tmp_path, 'wb') as tmp:
+                        if os.path.exists(self.journal_path):
+                            with open(self.journal_path, 'rb') as f:
+                                f.seek(offset)
+                                tmp.write(f.read())
+                        tmp.flush()
+                        os.fsync(tmp.fileno())
+                    self._close_journal()
+                    os.replace(tmp_path, self.journal_path)
+                    catalog_cache.cache_for(self.path).put(self._key(), current if current is not None else data)
+        finally:
+            with self._lock:
+                self._compacting = False
+
+    def save(self, data):
+        check_current(data)
+        data = normalize_catalog(data)
+        # A compaction writes an older catalog out of _lock; waiting for it keeps that from landing after this
+        with self._compact_lock, self._lock:
+            if self._seq is None:
+                self._recover()
+            catalog_cache.write_json_atomic(self.path, {**data, "journal_seq": self._seq})
+            tmp_path = f"{self.journal_path}.tmp"
+            open(tmp_path, 'wb').close()
+            self._close_journal()
+            os.replace(tmp_path, self.journal_path)
+            return catalog_cache.cache_for(self.path).put(self._key(), data)
+
+    def export_json(self, path):
+        if os.path.abspath(path) == os.path.abspath(self.path):
+            self.compact()
+            return self.load()
+        return super().export_json(path)
+
+    def add_product(self, category, product):
+        record = change_record("add_product", category=category, product={**product, "rev": 1})
+        self._append(record)
+        return record["product"]
+
+    def update_product(self, category, product_id, product, expected_rev=None):
+        with self._record_lock(product_id):
+            current = self._current(category, product_id)
+            check_revision(product_id, current, expected_rev)
+            record = change_record("update_product", category=category, id=product_id,
+                                   product={**product, "id": product_id, "rev": current.get("rev", 0) + 1})
+            self._append(record)
+        return record["product"]
+
+    def delete_product(self, category, product_id, expected_rev=None):
+        with self._record_lock(product_id):
+            current = self._current(category, product_id)
+            if current is None:
+                return
+            check_revision(product_id, current, expected_rev)
+            self._append(change_record("delete_product", category=category, id=product_id))
+
+    def add_products(self, items, sources=()):
+        # One journal line, so a crash keeps either all of the products or none
+        record = _add_products_record(items, sources)
+        self._append(record)
+        return [r["product"] for r in record["records"] if r["op"] == "add_product"]
+
+    def update_products(self, changes):
+        changes = list(changes)
+        # Take every stripe involved, in a fixed order so two batches cannot deadlock
+        stripes = sorted({hash(product_id) % RECORD_LOCK_STRIPES for _, product_id, _, _ in changes})
+        with ExitStack() as stack:
+            for stripe in stripes:
+                stack.enter_context(self._record_locks[stripe])
+            record = self._update_products_record(changes)
+            self._append(record)
+        return [r["product"] for r in record["records"]]
+
+    def add_source(self, source):
+        self._append(change_record("add_source", source=source))
+
+
+# --- Backend selection ---
+BACKENDS = {"json": JsonStore, "sqlite": SqliteStore, "journal": JournalStore}
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_store(json_path="clinic_data.json"):
+    """Return the process-wide store for the backend selected by CLINIC_STORAGE"""
+    backend = os.environ.get("CLINIC_STORAGE", "json")
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown CLINIC_STORAGE backend: {backend}")
+    path = os.environ.get("CLINIC_DB_FILE", "clinic_data.db") if backend == "sqlite" else json_path
+    key = (backend, os.path.abspath(path))
+    with _stores_lock:
+        if key not in _stores:
+            _stores[key] = BACKENDS[backend](path)
+        return _stores[key]
+
+
+def migrate_json_to_sqlite(json_path="clinic_data.json", db_path="clinic_data.db"):
+    """One-shot import of clinic_data.json (any schema version) into SQLite"""
+    import migrations  # migrations imports this module
+    with open(json_path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    migrations.keep_users(data)
+    store = SqliteStore(db_path)
+    return store.save(migrations.upgraded(data))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] != "migrate":
+        print("Usage: python storage.py migrate [clinic_data.json] [clinic_data.db]")
+        sys.exit(1)
+    migrated = migrate_json_to_sqlite(*sys.argv[2:4])
+    print('✅ Migration complete!')
+    for category, products in migrated["products"].items():
+        print(f"✅ {category}: {len(products)} products")
+    print(f"✅ {len(migrated['sources'])} sources")
@@ -0,0 +1,107 @@
+"""
+Stress test for concurrent product edits (no lost updates)
+Run this with: python stress_concurrency.py [--writers 16] [--increments 50]
+
+Many threads play admin/partner sessions that each read a product, raise its
+price by 1 and save it with the revision they read. Conflicting saves are
+retried, so at the end every product's price must have grown by exactly the
+number of successful saves. Each storage backend runs in its own temp dir.
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+import storage
+
+CATEGORY = "填充"
+
+
+def seed_catalog(products):
+    return {
+        "products": {CATEGORY: [
+            {
+                "id": f"stress_{i}",
+                "name": f"Stress Product {i}",
+                "source": "Stress Source",
+                "is_genuine": True,
+                "price": 100.0,
+                "unit": "per 支",
+                "date_added": "2026-01-01 00:00",
+            }
+            for i in range(products)
+        ]},
+        "sources": ["Stress Source"],
+        "users": {},
+    }
+
+
+def run_backend(backend, writers, increments, products):
+    workdir = tempfile.mkdtemp(prefix=f"clinic_stress_{backend}_")
+    path = os.path.join(workdir, "clinic_data.db" if backend == "sqlite" else "clinic_data.json")
+    store = storage.BACKENDS[backend](path)
+    store.save(seed_catalog(products))
+
+    saves = {f"stress_{i}": 0 for i in range(products)}
+    conflicts = [0]
+    counter_lock = threading.Lock()
+
+    def writer(seed):
+        rng = random.Random(seed)
+        for _ in range(increments):
+            product_id = f"stress_{rng.randrange(products)}"
+            while True:
+                current = storage.find_product(store.load(), CATEGORY, product_id)
+                try:
+                    store.update_product(CATEGORY, product_id, {**current, "price": current["price"] + 1},
+                                         expected_rev=current.get("rev", 0))
+                    break
+                except storage.ConflictError:
+                    with counter_lock:
+                        conflicts[0] += 1
+            with counter_lock:
+                saves[product_id] += 1
+
+    threads = [threading.Thread(target=writer, args=(i,)) for i in range(writers)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    # Read back through a fresh store so nothing comes from this store's cache
+    final = storage.BACKENDS[backend](path)
+    storage.catalog_cache.cache_for(path).invalidate()
+    lost = 0
+    for product_id, count in saves.items():
+        product = storage.find_product(final.load(), CATEGORY, product_id)
+        lost += count - int(product["price"] - 100.0)
+
+    total = writers * increments
+    status = "✅" if lost == 0 else "❌"
+    print(f"{status} {backend:8} {total} saves, {conflicts[0]} conflicts retried, "
+          f"{lost} lost updates, {total / elapsed:.0f} saves/s")
+    return lost
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--writers", type=int, default=16)
+    parser.add_argument("--increments", type=int, default=50)
+    parser.add_argument("--products", type=int, default=4)
+    parser.add_argument("--backend", choices=sorted(storage.BACKENDS), action="append")
+    args = parser.parse_args()
+
+    lost = 0
+    for backend in args.backend or ["json", "journal", "sqlite"]:
+        lost += run_backend(backend, args.writers, args.increments, args.products)
+    sys.exit(1 if lost else 0)
+
+
+if __name__ == "__main__":
+    main()
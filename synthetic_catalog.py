@@ -0,0 +1,110 @@
+"""
+Seeded generator of realistic clinic catalogs for benchmarks and load tests.
+
+The same seed and size always give the same catalog: product names mixing
+brand names, Chinese names and both (e.g. "Juvederm 玻尿酸 Volift 1ml"),
+prices in each category's usual range, many sources of both kinds (本地/香港
+agents and importers), every unit, 行貨 and 水貨, and dates added over the
+last two years, spread over all five categories.
+
+    data = synthetic_catalog.generate(100_000, seed=1)
+    legacy = synthetic_catalog.generate(10_000, legacy=True)  # old {name: info} format
+"""
+
+import random
+from datetime import datetime, timedelta
+
+import migrations
+from catalog_import import UNITS
+
+CATEGORIES = {
+    # category -> (brands, Chinese names, variants, price range)
+    "填充": (["Juvederm", "Restylane", "Belotero", "Teosyal", "Stylage", "Radiesse", "Sculptra", "Ellanse"],
+             ["玻尿酸", "透明質酸", "膠原蛋白", "微晶瓷", "童顏針"],
+             ["Ultra 3", "Volbella", "Volift", "Voluma", "Lyft", "Kysse", "Balance", "Intense", "Deep"],
+             (600, 4800)),
+    "水光": (["Profhilo", "Rejuran", "Skinvive", "NCTF 135HA", "Juvelook", "Chanel", "Restylane Vital"],
+             ["水光針", "嬰兒針", "三文魚針", "肉毒水光", "補水針"],
+             ["Healer", "i", "S", "Light", "Classic", "Eye"],
+             (300, 3200)),
+    "溶脂": (["Aqualyx", "Kybella", "Lipolab", "Belkyra", "Lemon Bottle", "Cinderella"],
+             ["溶脂針", "瘦臉針", "消脂針", "去雙下巴"],
+             ["Body", "Face", "Pro", "Plus"],
+             (150, 1800)),
+    "肉毒": (["Botox", "Dysport", "Xeomin", "Nabota", "Hutox", "Botulax", "Coretox", "Letybo"],
+             ["肉毒桿菌", "保妥適", "瘦面針", "除皺針"],
+             ["50U", "100U", "200U", "300U", "500U"],
+             (400, 5200)),
+    "生髮": (["Regaine", "Dermaheal HL", "Hair Filler", "PRP Kit", "Exosome", "Minoxidil"],
+             ["生髮精華", "頭皮針", "防脫髮", "外泌體"],
+             ["5%", "Serum", "Ampoule", "Set"],
+             (80, 2400)),
+}
+SIZES = ["0.5ml", "1ml", "1.1ml", "2ml", "2.5ml", "5ml", "10 vials", "x2", "x5", ""]
+SOURCE_KINDS = ["本地供應商", "香港代理", "台灣進口", "韓國直送", "Global Med", "Korea Import",
+                "SINOPHARM", "Euro Pharma", "Asia Aesthetics", "Japan Trading"]
+GENUINE_SHARE = 0.7
+
+
+def sources(count, rng):
+    """count distinct source names"""
+    names = list(SOURCE_KINDS)
+    while len(names) < count:
+        names.append(f"{rng.choice(SOURCE_KINDS)} {len(names)}")
+    return names[:count]
+
+
+def product_name(category, rng):
+    brands, chinese, variants, _ = CATEGORIES[category]
+    style = rng.random()
+    if style < 0.4:
+        parts = [rng.choice(brands), rng.choice(variants)]
+    elif style < 0.7:
+        parts = [rng.choice(brands), rng.choice(chinese), rng.choice(variants)]
+    else:
+        parts = [rng.choice(chinese), rng.choice(variants)]
+    parts.append(rng.choice(SIZES))
+    return " ".join(part for part in parts if part)
+
+
+def generate(products, seed=0, source_count=None, legacy=False, now=None):
+    """A catalog with that many products, spread over every category
+
+    legacy=True returns the original format, as the migrations expect it:
+    {name: info} categories (names made unique within their category) and
+    plain-text user accounts.
+    """
+    rng = random.Random(seed)
+    now = now or datetime(2026, 1, 1)
+    source_names = sources(source_count or max(10, min(500, products // 200)), rng)
+    catalog = {"products": {category: {} if legacy else [] for category in CATEGORIES},
+               "sources": source_names}
+    if legacy:
+        catalog["users"] = {"admin": "admin123", "partner": "partner123"}
+    else:
+        catalog["schema_version"] = migrations.SCHEMA_VERSION
+    categories = list(CATEGORIES)
+    weights = [4, 3, 2, 3, 1]
+    for category in rng.choices(categories, weights, k=products):
+        low, high = CATEGORIES[category][3]
+        added = now - timedelta(minutes=rng.randrange(2 * 365 * 24 * 60))
+        product = {
+            "id": f"{rng.getrandbits(64):016x}",
+            "name": product_name(category, rng),
+            "source": rng.choice(source_names),
+            "is_genuine": rng.random() < GENUINE_SHARE,
+            "price": round(rng.uniform(low, high) / 10) * 10.0,
+            "unit": rng.choice(UNITS),
+            "date_added": added.strftime("%Y-%m-%d %H:%M"),
+            "rev": 1,
+        }
+        if legacy:
+            name = product.pop("name")
+            del product["id"], product["rev"]
+            products_in_category = catalog["products"][category]
+            while name in products_in_category:
+                name = f"{name} #{len(products_in_category)}"
+            products_in_category[name] = product
+        else:
+            catalog["products"][category].append(product)
+    return catalog
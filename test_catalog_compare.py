@@ -0,0 +1,35 @@
+"""
+Checks of catalog_compare's pack-size parsing
+Run this with: python -m pytest test_catalog_compare.py
+"""
+
+import pytest
+
+import catalog_compare
+
+
+@pytest.mark.parametrize("name, model, ml, toxin_units, pieces", [
+    ("Botox 10支", "botox", None, None, 10),
+    ("肉毒10支", "肉毒", None, None, 10),
+    ("肉毒 10支", "肉毒", None, None, 10),
+    ("水光x5", "水光", None, None, 5),
+    ("肉毒2x1ml", "肉毒", 1.0, None, 2),
+    ("保妥適100U 2支", "保妥適", None, 100.0, 2),
+    ("玻尿酸1ml", "玻尿酸", 1.0, None, None),
+    ("Juvederm Volift 2 x 1ml", "juvederm volift", 1.0, None, 2),
+    ("Max5 cream", "5 cream max", None, None, None),
+])
+def test_parse_name(name, model, ml, toxin_units, pieces):
+    parsed_model, _, parsed_ml, parsed_units, parsed_pieces = catalog_compare.parse_name(name)
+    assert (parsed_model, parsed_ml, parsed_units, parsed_pieces) == (model, ml, toxin_units, pieces)
+
+
+def test_cjk_names_share_a_group_and_a_per_piece_price():
+    compare = catalog_compare.CompareIndex().sync({"products": {"肉毒": [
+        {"id": "a", "name": "肉毒10支", "source": "本地供應商", "is_genuine": True, "price": 1000, "unit": "per 盒"},
+        {"id": "b", "name": "肉毒 5支", "source": "香港代理", "is_genuine": True, "price": 400, "unit": "per 盒"},
+    ]}})
+    [group] = compare.groups("肉毒")
+    assert group["offers"] == 2
+    assert group["basis"] == "piece"
+    assert (group["best"]["id"], group["best"]["unit_price"]) == ("b", 80)
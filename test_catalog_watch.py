@@ -0,0 +1,25 @@
+"""
+Checks that fresh installs can push catalog changes
+Run this with: python -m pytest test_catalog_watch.py
+"""
+
+import os
+import re
+
+import catalog_watch
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def test_requirements_stay_within_push_versions():
+    with open(os.path.join(HERE, "requirements.txt"), encoding="utf-8") as f:
+        line = next(line for line in f if line.startswith("streamlit"))
+    lowest = tuple(int(part) for part in re.search(r">=\s*(\d+)\.(\d+)", line).groups())
+    below = tuple(int(part) for part in re.search(r"<\s*(\d+)\.(\d+)", line).groups())
+    first, last = catalog_watch.PUSH_VERSIONS
+    assert lowest == first
+    assert below == (last[0], last[1] + 1)
+
+
+def test_fallback_is_slow():
+    assert catalog_watch.FALLBACK_SECONDS >= 30
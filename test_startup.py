@@ -0,0 +1,18 @@
+"""
+Cold-start budget for both apps (see startup_profile.py)
+Run this with: python -m pytest test_startup.py
+"""
+
+import statistics
+
+import pytest
+
+import startup_profile
+
+
+@pytest.mark.parametrize("app", list(startup_profile.APPS))
+def test_cold_start_within_budget(app):
+    runs = [startup_profile.profile(app, startup_profile.APPS[app]) for _ in range(3)]
+    assert runs[-1]["errors"] == []
+    cold = statistics.median(run["import"] + run["first"] for run in runs)
+    assert cold <= startup_profile.COLD_START_BUDGET, f"{app} cold start took {cold:.2f}s"
@@ -1,7 +1,19 @@
 import streamlit as st
-import json
+import datetime
 import os
-import pandas as pd
+
+import catalog_compare
+import catalog_query
+import catalog_search
+import catalog_stats
+import catalog_watch
+import credentials
+import migrations
+import perf
+import remote_catalog
+import snapshot
+import static_assets
+import storage
 
 # --- Page Configuration ---
 # Version 2.0: Mobile-optimized card layout
@@ -13,185 +25,85 @@ st.set_page_config(
 )
 
 # --- CSS Styling for Mobile ---
-st.markdown("""
-    <style>
-    /* Mobile responsive styling */
-    * {
-        margin: 0;
-        padding: 0;
-        box-sizing: border-box;
-    }
-    
-    .main-header {
-        font-size: 1.8em;
-        font-weight: bold;
-        color: #2e8b57;
-        text-align: center;
-        margin-bottom: 15px;
-        padding: 10px;
-    }
-    
-    .category-button {
-        background-color: #f0f8f0;
-        border: 2px solid #2e8b57;
-        border-radius: 8px;
-        padding: 12px;
-        margin: 6px 0;
-        width: 100%;
-        text-align: center;
-        font-weight: bold;
-        color: #2e8b57;
-        font-size: 16px;
-    }
-    
-    .category-button:hover {
-        background-color: #2e8b57;
-        color: white;
-    }
-    
-    .table-container {
-        background-color: white;
-        border-radius: 8px;
-        padding: 10px;
-        margin: 10px 0;
-    }
-    
-    /* Expandable card styling */
-    .streamlit-expanderHeader {
-        background-color: #e8f5e9 !important;
-        border: 2px solid #2e8b57 !important;
-        border-radius: 8px !important;
-        padding: 12px !important;
-        margin: 8px 0 !important;
-        font-weight: bold !important;
-    }
-    
-    .streamlit-expanderContent {
-        background-color: #f9f9f9 !important;
-        padding: 15px !important;
-    }
-    
-    /* Mobile-friendly table styling */
-    [data-testid="stDataFrame"] {
-        font-size: 12px !important;
-        overflow-x: hidden !important;
-    }
-    
-    [data-testid="stDataFrame"] table {
-        width: 100% !important;
-        border-collapse: collapse !important;
-        table-layout: fixed !important;
-    }
-    
-    [data-testid="stDataFrame"] th {
-        background-color: #2e8b57 !important;
-        color: white !important;
-        padding: 8px 6px !important;
-        text-align: left !important;
-        font-weight: bold !important;
-        border: 1px solid #1d5e3f !important;
-        font-size: 11px !important;
-        white-space: nowrap !important;
-        overflow: hidden !important;
-        text-overflow: ellipsis !important;
-    }
-    
-    [data-testid="stDataFrame"] td {
-        padding: 8px 6px !important;
-        border: 1px solid #ddd !important;
-        text-align: left !important;
-        font-size: 12px !important;
-        word-wrap: break-word !important;
-        overflow-wrap: break-word !important;
-    }
-    
-    [data-testid="stDataFrame"] tr:nth-child(even) {
-        background-color: #f9f9f9 !important;
-    }
-    
-    [data-testid="stDataFrame"] tr:nth-child(odd) {
-        background-color: #ffffff !important;
-    }
-    
-    [data-testid="stDataFrame"] tr:hover {
-        background-color: #e8f5e9 !important;
-    }
-    
-    /* Button styling for mobile */
-    .stButton > button {
-        width: 100%;
-        padding: 12px !important;
-        font-size: 16px !important;
-        border-radius: 8px !important;
-        margin: 5px 0 !important;
-    }
-    
-    /* Input fields */
-    .stTextInput input, .stNumberInput input, .stSelectbox select {
-        font-size: 16px !important;
-        padding: 10px !important;
-        border-radius: 5px !important;
-    }
-    
-    /* Tabs */
-    .stTabs [role="tablist"] button {
-        font-size: 14px !important;
-        padding: 10px 15px !important;
-    }
-    
-    /* Reduce margin */
-    .block-container {
-        padding: 10px !important;
-    }
-    
-    /* Better spacing for mobile */
-    h1, h2, h3 {
-        margin-top: 15px !important;
-        margin-bottom: 10px !important;
-    }
-    
-    /* Product info text styling */
-    p {
-        font-size: 14px !important;
-        line-height: 1.6 !important;
-    }
-    
-    /* Better divider */
-    hr {
-        margin: 10px 0 !important;
-        border: none !important;
-        border-top: 1px solid #ddd !important;
-    }
-    </style>
-    """, unsafe_allow_html=True)
+static_assets.use_stylesheet("user_app.css")
 
 # --- Data Management ---
 DATA_FILE = "clinic_data.json"
-GITHUB_RAW_URL = "https://raw.githubusercontent.com/lchunwai-hub/anesthetic-clinic-app/main/clinic_data.json"
-
-def load_data():
-    """Load clinic data from local file first (for offline use), then GitHub"""
-    # Try loading from local file FIRST (for offline/local testing)
-    if os.path.exists(DATA_FILE):
-        try:
-            with open(DATA_FILE, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except:
-            pass
+PAGE_SIZE = 20
+TABLE_CACHE_ENTRIES = 32
+PAGE_CACHE_ENTRIES = 256  # as many pages as QueryIndex keeps results for
+SORT_OPTIONS = {
+    "Name (A-Z)": ("name", False),
+    "Price: low to high": ("price", False),
+    "Price: high to low": ("price", True),
+    "Newest first": ("date", True),
+    "Oldest first": ("date", False),
+}
+DATE_OPTIONS = {"Any time": 0, "Last 7 days": 7, "Last 30 days": 30, "Last 90 days": 90, "Last year": 365}
+GITHUB_RAW_URL = os.environ.get(
+    "CLINIC_REMOTE_URL",
+    "https://raw.githubusercontent.com/lchunwai-hub/anesthetic-clinic-app/main/clinic_data.json"
+)
+SNAPSHOT_URL = os.environ.get(
+    "CLINIC_SNAPSHOT_URL",
+    "https://raw.githubusercontent.com/lchunwai-hub/anesthetic-clinic-app/main/snapshot/manifest.json"
+)
+
+def load_data(categories=None):
+    """Load clinic data from local file first (for offline use), then GitHub
+
+    From GitHub only the given categories (None = all) are downloaded.
+    """
+    # Try loading from local storage FIRST (for offline/local testing).
+    # The parsed catalog is shared by all sessions and only re-read when it changes.
+    try:
+        data = storage.get_store(DATA_FILE).load()
+        if data is not None:
+            return data
+    except:
+        pass
     
-    # Fallback to GitHub (for Streamlit Cloud)
+    # Fallback to GitHub (for Streamlit Cloud): the published snapshot, fetching
+    # only shards that changed for the categories on screen
+    try:
+        data = snapshot.shared_client(SNAPSHOT_URL).get(categories)
+        if data is not None:
+            return data
+    except:
+        pass
+
+    # No snapshot published yet: the full catalog file, served from memory or
+    # the saved copy and revalidated in the background
     try:
-        import urllib.request
-        import time
-        # Add timestamp to prevent caching
-        cache_buster = f"?t={int(time.time())}"
-        with urllib.request.urlopen(GITHUB_RAW_URL + cache_buster) as response:
-            data = json.loads(response.read().decode())
+        data = remote_catalog.shared(GITHUB_RAW_URL, prepare=migrations.upgraded).get()
+        if data is not None:
             return data
     except:
         pass
     
-    return {"products": {}, "sources": [], "users": {}}
+    return {"products": {}, "sources": []}
+
+def watched_catalog():
+    """(key, load) of the catalog load_data() reads, for catalog_watch: the local store, else GitHub's copy"""
+    store = storage.get_store(DATA_FILE)
+    try:
+        if store.load() is not None:
+            return store.path, store.load
+    except:
+        pass
+    # The manifest changes whenever a snapshot is published; the watcher never downloads shards itself
+    manifest = snapshot.shared_client(SNAPSHOT_URL).manifest
+    if manifest.get() is not None:
+        return SNAPSHOT_URL, manifest.get
+    return GITHUB_RAW_URL, remote_catalog.shared(GITHUB_RAW_URL, prepare=migrations.upgraded).get
+
+# --- Schema ---
+# Old catalog formats are upgraded once, when the process starts; reruns only read
+try:
+    migrations.ensure_current(storage.get_store(DATA_FILE))
+except migrations.MigrationError as e:
+    st.error(f"❌ Could not upgrade the catalog: {e}")
+    st.stop()
 
 # --- Session State ---
 if 'user_logged_in' not in st.session_state:
@@ -200,6 +112,8 @@ if 'selected_category' not in st.session_state:
     st.session_state.selected_category = "填充"
 if 'enable_login' not in st.session_state:
     st.session_state.enable_login = False  # Set to False for testing convenience
+if 'user_token' not in st.session_state:
+    st.session_state.user_token = None
 
 # --- Login Page ---
 def login_page():
@@ -215,14 +129,15 @@ def login_page():
             password = st.text_input("Password", type="password", placeholder="Enter password")
 
             if st.form_submit_button("Login", use_container_width=True):
-                data = load_data()
-                # Simple login - you can modify this logic
-                if username and password:  # Basic validation
+                try:
+                    session = credentials.shared().login(username, password, client=credentials.client_address())
+                except credentials.LoginError as e:
+                    st.error(str(e))
+                else:
                     st.session_state.user_logged_in = True
+                    st.session_state.user_token = session["token"]
                     st.success("Login successful!")
                     st.rerun()
-                else:
-                    st.error("Please enter valid credentials")
 
         st.markdown('</div>', unsafe_allow_html=True)
 
@@ -232,16 +147,38 @@ def login_page():
             st.session_state.user_logged_in = True
             st.rerun()
 
+def session_valid():
+    """Whether the user is logged in; a login's token is checked (and renewed) instead of the password"""
+    if not st.session_state.user_logged_in:
+        return False
+    if st.session_state.user_token is None:
+        return True  # skipped the login
+    session = credentials.shared().check_token(st.session_state.user_token)
+    if session is None:
+        st.session_state.user_logged_in = False
+        st.session_state.user_token = None
+        return False
+    st.session_state.user_token = session["token"]
+    return True
+
 # --- Main Interface ---
+def shown_categories():
+    """Categories the current view needs (None = all of them)"""
+    if st.session_state.get("search_query", "").strip() or st.session_state.get("filter_all_categories"):
+        return None
+    return [st.session_state.get("category_selector", st.session_state.selected_category)]
+
 def main_interface():
     """Main user interface with categories and product table"""
-    data = load_data()
+    with perf.span("load_data") as span:
+        data = load_data(shown_categories())
+        perf.note_catalog(span, data, storage.get_store(DATA_FILE).path)
 
     # Header
     st.markdown('<h1 class="main-header">💉 Anesthetic Clinic Product Catalog</h1>', unsafe_allow_html=True)
 
-    # Top bar with category selector, refresh and logout button
-    header_cols = st.columns([2, 0.5, 0.5])
+    # Top bar with category selector and logout button
+    header_cols = st.columns([2.5, 0.5])
     
     categories = ["填充", "水光", "溶脂", "肉毒", "生髮"]
     
@@ -256,74 +193,231 @@ def main_interface():
         )
         st.session_state.selected_category = selected
     
-    # Refresh button
-    with header_cols[1]:
-        if st.button("🔄", key="refresh_btn", help="Refresh data"):
-            st.rerun()
-    
     # Logout button
-    with header_cols[2]:
+    with header_cols[1]:
         if st.button("Logout", key="user_logout", use_container_width=True):
             st.session_state.user_logged_in = False
+            st.session_state.user_token = None
             st.rerun()
 
+    # Search box (matches across all categories)
+    st.text_input(
+        "Search products",
+        key="search_query",
+        placeholder="🔍 Search by name or source, e.g. volu / 玻尿酸",
+        label_visibility="collapsed"
+    )
+
+    # The indexes are shared by all sessions and only re-index products that changed
+    with perf.span("index_sync"):
+        index = catalog_query.shared_index().sync(data)
+        stats = catalog_stats.shared_index().sync(data)
+
+    filters = filter_panel(index)
+    overview_panel(stats)
+
     st.markdown("---")
 
-    # Product table (full width, no side panel)
-    st.markdown(f"### 📊 {st.session_state.selected_category} Products")
-
-    if st.session_state.selected_category in data["products"]:
-        products = data["products"][st.session_state.selected_category]
-        
-        # Handle migration from dict to list format
-        if isinstance(products, dict):
-            # Convert old dict format to new list format
-            products_list = []
-            for prod_name, prod_info in products.items():
-                products_list.append({
-                    'name': prod_name,
-                    **prod_info
-                })
-            products = products_list
-
-        if products:
-            # Convert to DataFrame for table display
-            table_data = []
-            for product_info in products:
-                table_data.append({
-                    "Product Name": product_info['name'],
-                    "Price ($)": f"{product_info.get('price', 0):.2f}",
-                    "Type": "行" if product_info.get("is_genuine", True) else "水",
-                    "Source": product_info.get("source", "N/A")
-                })
-
-            df = pd.DataFrame(table_data)
-
-            # Display table with mobile-friendly styling (no horizontal scroll)
+    product_table(filters)
+
+@st.fragment(run_every=catalog_watch.fallback_interval())
+def product_table(filters):
+    """Title, summary and one page of the matching products
+
+    A fragment: when the catalog changes, the watcher reruns only this part
+    of each open page (see catalog_watch), and turning pages reruns only
+    this part too.
+    """
+    filters = dict(filters)  # the arguments are kept for the next fragment run
+    with perf.fragment("product_table", "user_app"):
+        # Subscribe before loading, so a change made in between is pushed again
+        catalog_watch.shared(*watched_catalog()).subscribe()
+        with perf.span("load_data") as span:
+            data = load_data(shown_categories())
+            perf.note_catalog(span, data, storage.get_store(DATA_FILE).path)
+        with perf.span("index_sync"):
+            index = catalog_query.shared_index().sync(data)
+            stats = catalog_stats.shared_index().sync(data)
+            compare = catalog_compare.shared_index().sync(data)
+
+        query = st.session_state.get("search_query", "")
+        all_categories = filters.pop("all_categories")
+        if query.strip():
+            # Search always spans every category
+            with perf.span("search"):
+                filters["ids"] = catalog_search.shared_index().sync(data).match(query)
+            title = f"🔍 Results for \"{query.strip()}\""
+        elif all_categories:
+            title = "📊 All Products"
+        else:
+            filters["category"] = st.session_state.selected_category
+            title = f"📊 {st.session_state.selected_category} Products"
+        show_category = filters.get("category") is None
+
+        # Product table (full width, no side panel)
+        st.markdown(f"### {title}")
+        if "ids" not in filters:
+            summary_header(stats, filters.get("category"))
+        compare_panel(compare, st.session_state.selected_category)
+
+        with perf.span("query") as span:
+            total, _ = index.query(limit=0, **filters)
+            span.note(matches=total)
+        if not total:
+            st.info("📭 No products match." if query.strip() else "📭 No products available in this category.")
+            return
+
+        pages = (total - 1) // PAGE_SIZE + 1
+        page = 1
+        if pages > 1:
+            page = st.number_input(f"Page (of {pages})", min_value=1, max_value=pages,
+                                   value=min(st.session_state.get("page_number", 1), pages), step=1)
+            st.session_state.page_number = page
+        with perf.span("query"):
+            _, results = index.query(offset=(page - 1) * PAGE_SIZE, limit=PAGE_SIZE, **filters)
+        st.caption(f"{total} product{'s' if total != 1 else ''}, showing "
+                   f"{(page - 1) * PAGE_SIZE + 1}-{(page - 1) * PAGE_SIZE + len(results)}")
+
+        with perf.span("table"):
+            _, df = page_table(id(results), show_category, data, results)
+
+        # Display table with mobile-friendly styling (no horizontal scroll)
+        with perf.span("render_table"):
             st.dataframe(
                 df,
                 use_container_width=True,
                 hide_index=True,
                 column_config={
                     "Product Name": st.column_config.TextColumn("Product Name", width="medium"),
-                    "Price ($)": st.column_config.TextColumn("Price", width="small"),
+                    "Category": st.column_config.TextColumn("Category", width="small"),
+                    "Price ($)": st.column_config.NumberColumn("Price", width="small", format="$%.2f"),
                     "Type": st.column_config.TextColumn("Type", width="small"),
                     "Source": st.column_config.TextColumn("Source", width="small")
                 }
             )
 
+@st.cache_resource(max_entries=TABLE_CACHE_ENTRIES, show_spinner=False)
+def category_table(list_id, category, _products):
+    """Display table of one category, indexed by product id and shared by all sessions
+
+    Catalog lists are never changed in place and a new catalog version reuses
+    the lists of untouched categories, so the list's id identifies its
+    contents. The list is returned with the table to keep that id taken.
+    """
+    # pandas takes about as long to import as Streamlit itself; only pages with a table pay for it
+    import pandas as pd
+
+    df = pd.DataFrame({
+        "Product Name": [product.get('name', '') for product in _products],
+        "Category": category,
+        "Price ($)": [catalog_query.price_of(product) for product in _products],
+        "Type": ["行" if product.get("is_genuine", True) else "水" for product in _products],
+        "Source": [product.get("source", "N/A") for product in _products],
+    }, index=[product.get('id') for product in _products])
+    return _products, df
+
+@st.cache_resource(max_entries=PAGE_CACHE_ENTRIES, show_spinner=False)
+def page_table(results_id, show_category, _data, _results):
+    """Rows of the cached category tables for one page of (category, record) results, shared by all sessions
+
+    QueryIndex.query() hands back the same results list for the same page of
+    the same catalog, so reruns showing that page reuse the table. As with
+    category_table, the list is returned with the table to keep its id taken.
+    """
+    import pandas as pd
+
+    by_category = {}
+    for category, product_info in _results:
+        by_category.setdefault(category, []).append(product_info.get('id'))
+    frames = []
+    for category, ids in by_category.items():
+        products = _data["products"][category]
+        _, table = category_table(id(products), category, products)
+        frames.append(table.loc[ids])
+    df = pd.concat(frames).reindex([product_info.get('id') for _, product_info in _results])
+    if not show_category:
+        df = df.drop(columns="Category")
+    return _results, df
+
+def summary_header(stats, category):
+    """Count, price range and cheapest product of the category (None = all) on screen"""
+    summary = stats.summary(category=category)
+    st.caption(catalog_stats.describe(summary))
+    if summary["cheapest"]:
+        cheapest_category, cheapest = stats.record(summary["cheapest"])
+        where = "" if category else f" in {cheapest_category}"
+        st.caption(f"💡 Cheapest{where}: **{cheapest.get('name')}** ${summary['min']:,.2f} "
+                   f"({cheapest.get('source') or 'N/A'})")
+
+def overview_panel(stats):
+    """Statistics per category, and per source within the selected category"""
+    with st.expander("📊 Overview"):
+        st.dataframe(catalog_stats.table_rows(stats.table("category"), "Category"),
+                     use_container_width=True, hide_index=True)
+        category = st.session_state.selected_category
+        st.markdown(f"**Sources for {category}**")
+        rows = catalog_stats.table_rows(stats.table("source", category=category), "Source")
+        if rows:
+            st.dataframe(rows, use_container_width=True, hide_index=True)
         else:
-            st.info(f"📭 No products found in {st.session_state.selected_category} category.")
-    else:
-        st.info("📭 No products available in this category.")
+            st.caption("No products in this category.")
+
+def compare_panel(compare, category):
+    """Best price of each product offered by several sources or as both 行貨 and 水貨, per unit"""
+    with st.expander("⚖️ Compare Prices"):
+        with perf.span("compare"):
+            groups = compare.groups(category)
+        if not groups:
+            st.caption(f"No product in {category} is offered more than once.")
+            return
+        st.caption("Prices are per ml, per U or per piece where the product name gives the pack size.")
+        st.dataframe(catalog_compare.group_rows(groups), use_container_width=True, hide_index=True)
+        labels = {group["model"]: group["label"] for group in groups}
+        model = st.selectbox("Offers for", list(labels), format_func=labels.get, key="compare_model")
+        st.dataframe(catalog_compare.offer_rows(compare, compare.offers(category, model)),
+                     use_container_width=True, hide_index=True)
+
+def filter_panel(index):
+    """Filter and sort controls; returns keyword arguments for QueryIndex.query()"""
+    with st.expander("⚙️ Filters & Sorting"):
+        all_categories = st.checkbox("Show all categories", key="filter_all_categories")
+
+        price_cols = st.columns(2)
+        with price_cols[0]:
+            price_min = st.number_input("Min price ($)", min_value=0.0, value=0.0, step=10.0, key="filter_price_min")
+        with price_cols[1]:
+            price_max = st.number_input("Max price ($)", min_value=0.0, value=0.0, step=10.0, key="filter_price_max",
+                                        help="0 = no limit")
+
+        sources = st.multiselect("Source", index.values("source"), key="filter_sources")
+        units = st.multiselect("Unit", index.values("unit"), key="filter_units")
+        product_type = st.radio("Type", ["All", "行貨", "水貨"], horizontal=True, key="filter_type")
+        added = st.selectbox("Date added", list(DATE_OPTIONS), key="filter_added")
+        sort_label = st.selectbox("Sort by", list(SORT_OPTIONS), key="filter_sort")
+
+    sort, descending = SORT_OPTIONS[sort_label]
+    days = DATE_OPTIONS[added]
+    return {
+        "all_categories": all_categories,
+        "price_min": price_min or None,
+        "price_max": price_max or None,
+        "sources": sources,
+        "units": units,
+        "genuine": {"All": None, "行貨": True, "水貨": False}[product_type],
+        "date_from": (datetime.date.today() - datetime.timedelta(days=days)).isoformat() if days else None,
+        "sort": sort,
+        "descending": descending,
+    }
 
 # --- Main App Logic ---
 def main():
-    # Check if login is enabled
-    if st.session_state.enable_login and not st.session_state.user_logged_in:
-        login_page()
-    else:
-        main_interface()
+    with perf.rerun("user_app"):
+        # Check if login is enabled
+        if st.session_state.enable_login and not session_valid():
+            login_page()
+        else:
+            main_interface()
+    perf.debug_panel()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file